@@ -0,0 +1,62 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Benchmarks per-call overhead of client request contexts.
+
+The legacy variant builds a connection opener and its chain of handlers
+for every request, which is how requests were opened before openers were
+shared by all requests of a client.
+'''
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jsonrpc2 import base
+from jsonrpc2 import client
+
+CALLS = 5000
+
+JSONRPC_CLIENT = client.JsonRpcClient('http://localhost:8080')
+
+
+def legacy():
+    request = base.JsonRpcRequest('foo', [1, 2])
+    JSONRPC_CLIENT.opener_class(JSONRPC_CLIENT)
+    client.JsonRpcContext(JSONRPC_CLIENT, request)
+
+def shared():
+    request = base.JsonRpcRequest('foo', [1, 2])
+    client.JsonRpcContext(JSONRPC_CLIENT, request)
+
+def run(name, func):
+    seconds = min(timeit.repeat(func, number=CALLS, repeat=3))
+    print('%-40s %10.2f us/call' % (name, seconds / CALLS * 1e6))
+
+
+def main():
+    run('opener per call', legacy)
+    run('shared opener', shared)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''
+Benchmarks per-request logging costs of large payloads.
+
+The eager variant formats messages before calling the logger, which is how
+messages were logged before the logger deferred formatting.
+'''
+
+import os
+import sys
+import json
+import timeit
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jsonrpc2 import logger
+
+REQUESTS = 200
+
+PAYLOAD = {
+    'jsonrpc': '2.0',
+    'method': 'store',
+    'params': [{'id': i, 'name': 'item-%d' % i, 'tags': ['a', 'b', 'c']}
+               for i in range(5000)],
+    'id': 1,
+}
+DATA = json.dumps(PAYLOAD)
+
+
+def eager():
+    # A dumped and a loaded message of a request
+    logger.debug('Dumps message: %s' % PAYLOAD)
+    logger.debug('Loads message: %s' % DATA)
+
+def lazy():
+    logger.debug('Dumps message: %s', PAYLOAD)
+    logger.debug('Loads message: %s', DATA)
+
+def run(name, func):
+    seconds = min(timeit.repeat(func, number=REQUESTS, repeat=3))
+    print('%-40s %10.2f us/request' % (name, seconds / REQUESTS * 1e6))
+
+
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        self.format(record)
+
+
+def main():
+    print('Payload: %d bytes' % len(DATA))
+    logger.setup(logging.INFO)
+    logger._logger.handlers = [NullHandler()]
+
+    run('debug disabled, eager', eager)
+    run('debug disabled, lazy', lazy)
+
+    logger.configure(logging.DEBUG)
+    run('debug enabled, lazy', lazy)
+
+    logger.configure(logging.DEBUG, max_payload=200)
+    run('debug enabled, truncated to 200', lazy)
+
+    logger.configure(logging.DEBUG, sample=100)
+    run('debug enabled, sampled 1/100', lazy)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Benchmarks allocation sizes and encoding and decoding times of messages.
+
+The legacy variant uses dict backed message classes decoded by trying
+constructors of the given classes, which is how messages were decoded
+before they were decoded by the set of their members.
+'''
+
+import os
+import sys
+import json
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jsonrpc2 import base
+from jsonrpc2 import errors
+
+MESSAGES = 20000
+
+__metaclass__ = type
+
+
+class LegacyNotification:
+    def __init__(self, method, params):
+        self.method = method
+        self.params = params
+
+class LegacyRequest:
+    def __init__(self, method, params, id=None):
+        self.id = id or base._gen_id()
+        self.method = method
+        self.params = params
+
+class LegacyResponse:
+    def __init__(self, id, result):
+        self.id = id
+        self.result = result
+
+def legacy_loads(data, classes=[]):
+    message = json.loads(data, encoding='utf-8')
+    if (not isinstance(message, dict) or
+        message.pop('jsonrpc', None) != base.SPEC_VER):
+        raise errors.InvalidJsonRpcError()
+    for cls in classes:
+        try:
+            return cls(**message)
+        except TypeError:
+            pass
+    try:
+        raise errors.JsonRpcError(id=message['id'], **message['error'])
+    except (TypeError, KeyError) as err:
+        raise errors.JsonRpcParseError(data={'exception': '%s' % err})
+
+
+def size(obj):
+    total = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        total += sys.getsizeof(obj.__dict__)
+    return total
+
+def run(name, func):
+    seconds = min(timeit.repeat(func, number=MESSAGES, repeat=3))
+    print('%-40s %10.2f us/message' % (name, seconds / MESSAGES * 1e6))
+
+def decode(loads, data, classes):
+    def func():
+        try:
+            loads(data, classes)
+        except errors.JsonRpcError:
+            pass
+    return func
+
+
+def main():
+    print('Allocated bytes per message object:')
+    for name, legacy, message in [
+            ('notification', LegacyNotification('foo', None),
+             base.JsonRpcNotification('foo', None)),
+            ('request', LegacyRequest('foo', None, '1'),
+             base.JsonRpcRequest('foo', None, '1')),
+            ('response', LegacyResponse('1', None),
+             base.JsonRpcResponse('1', None))]:
+        print('%-40s %10d -> %d' % (name, size(legacy), size(message)))
+
+    server_classes = [base.JsonRpcNotification, base.JsonRpcRequest]
+    client_classes = [base.JsonRpcResponse]
+    legacy_server = [LegacyNotification, LegacyRequest]
+    legacy_client = [LegacyResponse]
+    notification = base.JsonRpcNotification('foo', [1, 2]).dumps()
+    request = base.JsonRpcRequest('foo', [1, 2], '1').dumps()
+    response = base.JsonRpcResponse('1', [1, 2]).dumps()
+    error = base.dumps(errors.JsonRpcError(id='1').marshal())
+
+    print('Decoding:')
+    for name, data, legacy_classes, classes in [
+            ('notification', notification, legacy_server, server_classes),
+            ('request', request, legacy_server, server_classes),
+            ('response', response, legacy_client, client_classes),
+            ('error', error, legacy_client, client_classes)]:
+        run('%s, legacy' % name, decode(legacy_loads, data, legacy_classes))
+        run('%s, by members' % name, decode(base.loads, data, classes))
+
+    print('Encoding:')
+    run('request', base.JsonRpcRequest('foo', [1, 2], '1').dumps)
+    run('response', base.JsonRpcResponse('1', [1, 2]).dumps)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Benchmarks concurrent requests sent by one multiplexed connection against
+requests sent by N pooled persistent connections.
+
+The server answers after a short delay, so that requests overlap. Pooled
+requests need a connection each while they are in flight, a multiplexed
+stream keeps all of them in flight on a single one.
+'''
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jsonrpc2 import base
+from jsonrpc2 import server
+from jsonrpc2 import future
+from jsonrpc2.client import JsonRpcClient
+
+ROUNDS = 50
+
+DELAY = 0.002
+
+
+class BenchIface(server.JsonRpcIface):
+    def echo(self, value):
+        base.call_later(DELAY, self._on_result, value)
+
+
+def pooled(url, connections):
+    client = JsonRpcClient(url, keep_alive=True)
+    client.pool.size = connections
+    return client
+
+def multiplexed(url, connections):
+    return JsonRpcClient(url, multiplexed=True, max_in_flight=connections)
+
+def run(name, factory, url, connections, jsonrpc_server):
+    client = factory(url, connections)
+    accepted = jsonrpc_server.stats()['accepted']
+    start = time.time()
+    for i in range(ROUNDS):
+        future.gather(*[client.echo([j]) for j in range(connections)]
+                      ).result(10)
+    seconds = time.time() - start
+    calls = ROUNDS * connections
+    print('%-40s %10.2f us/call %6d connection(s)' % (
+          '%s, %d in flight' % (name, connections), seconds / calls * 1e6,
+          jsonrpc_server.stats()['accepted'] - accepted))
+    for stream in list(client.streams.values()):
+        stream.close()
+    if client.pool is not None:
+        client.pool.clear()
+
+
+def main():
+    port = random.randint(10000, 65000)
+    url = 'http://localhost:%d' % port
+    jsonrpc_server = server.JsonRpcServer(('localhost', port), BenchIface,
+                                          backlog=128, keep_alive=True)
+    try:
+        for connections in (1, 8, 32):
+            run('pooled', pooled, url, connections, jsonrpc_server)
+            run('multiplexed', multiplexed, url, connections, jsonrpc_server)
+    finally:
+        for handler in list(jsonrpc_server.connections):
+            handler.close()
+        jsonrpc_server.close()
+
+if __name__ == '__main__':
+    main()
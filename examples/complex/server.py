@@ -24,6 +24,7 @@ Provides the echo example server.
 import logging
 
 from jsonrpc2 import loop, JsonRpcClient, JsonRpcIface, JsonRpcServer
+from jsonrpc2.future import Return
 
 class MultiplyIface(JsonRpcIface):
     def multiply(self, x, y):
@@ -36,43 +37,23 @@ class MultiplyIface(JsonRpcIface):
 
 
 class ComplexIface(JsonRpcIface):
-    client = None
-    i = 1
-    n = 0
-    x = 1
-
-    def _on_multiply_result(self, result):
-        result = result['result']
-        if self.i < self.n:
-            self.i += 1
-            self.client.multiply([result, self.x],
-                                 self._on_multiply_result, self._on_error)
-        else:
-            self._on_result({'x': self.x, 'n': self.n, 'result': result})
-
     def power(self, x, n):
         logging.info('Power: %s ^ %s' % (x, n))
-        self.i = 2
-        self.n = n
-        self.x = x
+        base = x
         if n < 0:
-            x = 1.0 / x
-            n = -n
-        if n == 0:
-            return {
-                'x': self.x,
-                'n': self.n,
-                'result': 1
-            }
-        elif n == 1:
-            return {
-                'x': self.x,
-                'n': self.n,
-                'result': x
-            }
-        self.i = 2
-        self.client = JsonRpcClient('http://localhost:8092', timeout=5)
-        self.client.multiply([x, x], self._on_multiply_result, self._on_error)
+            base = 1.0 / x
+        result = 1
+        if abs(n) > 0:
+            result = base
+            client = JsonRpcClient('http://localhost:8092', timeout=5)
+            for i in range(abs(n) - 1):
+                response = yield client.multiply([result, base])
+                result = response['result']
+        raise Return({
+            'x': x,
+            'n': n,
+            'result': result
+        })
 
 
 def run():
@@ -29,7 +29,7 @@ __contact__ = 'marcin.g.lyko@gmail.com'
 
 from .base import VERSION as __version__
 
-from .base import loop
+from .base import loop, call_later, RawJson
 from .client import JsonRpcClient
 from .server import JsonRpcIface, JsonRpcServer
 from .errors import JsonRpcError, JsonRpcInternalError
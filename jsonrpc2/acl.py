@@ -0,0 +1,238 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Definitions of access control lists of Json-RPC server connections.
+'''
+
+import socket
+import bisect
+import binascii
+
+ALLOW = 'allow'
+DENY = 'deny'
+
+# Bit lengths of addresses of supported families
+_BITS = {socket.AF_INET: 32, socket.AF_INET6: 128}
+
+_IPV4_MAPPED_PREFIX = '::ffff:'
+
+__metaclass__ = type
+
+def parse_address(address):
+    '''
+    Returns a (family, integer) pair of the given IPv4 or IPv6 address.
+    IPv4-mapped IPv6 addresses are returned as IPv4 ones.
+
+    Raises ValueError if the address is invalid.
+    '''
+    address = address.split('%', 1)[0]
+    if address.lower().startswith(_IPV4_MAPPED_PREFIX) and '.' in address:
+        address = address[len(_IPV4_MAPPED_PREFIX):]
+    family = socket.AF_INET6 if ':' in address else socket.AF_INET
+    try:
+        packed = socket.inet_pton(family, address)
+    except (socket.error, ValueError):
+        raise ValueError('Invalid IP address: %r' % address)
+    return family, int(binascii.hexlify(packed), 16)
+
+
+class AclRule:
+    '''
+    A class of ACL rules which allow or deny connections from an IPv4 or
+    IPv6 network given in the CIDR notation. A single address is a network
+    of the maximum prefix length.
+    '''
+    def __init__(self, network, action=ALLOW):
+        if action not in (ALLOW, DENY):
+            raise ValueError('Unknown ACL action: %r' % action)
+        address, _, prefixlen = network.partition('/')
+        self.family, value = parse_address(address)
+        bits = _BITS[self.family]
+        try:
+            self.prefixlen = int(prefixlen) if prefixlen else bits
+        except ValueError:
+            raise ValueError('Invalid network prefix: %r' % network)
+        if not 0 <= self.prefixlen <= bits:
+            raise ValueError('Invalid network prefix: %r' % network)
+        size = 1 << (bits - self.prefixlen)
+        self.first = value & ~(size - 1)
+        self.last = self.first + size - 1
+        self.network = network
+        self.action = action
+        self.hits = 0
+
+    def __repr__(self):
+        return '<%s(%s %s)>' % (self.__class__.__name__, self.action,
+                                self.network)
+
+    @property
+    def key(self):
+        return (self.family, self.first, self.prefixlen)
+
+    @classmethod
+    def parse(cls, rule):
+        '''
+        Creates a rule of the given network which is denied if it is
+        prefixed with "!", e.g. "10.0.0.0/8" or "!10.1.0.0/16".
+        '''
+        if isinstance(rule, cls):
+            return rule
+        rule = rule.strip()
+        if rule.startswith('!'):
+            return cls(rule[1:].strip(), DENY)
+        return cls(rule, ALLOW)
+
+
+class JsonRpcAcl:
+    '''
+    A class of compiled access control lists.
+
+    The most specific rule matching an address decides if it is allowed, a
+    deny rule wins over an allow rule of the same network. Addresses which
+    do not match any rule get the default action, which is deny if there are
+    any allow rules and allow otherwise.
+
+    Rules are compiled into disjoint sorted address ranges per family, so an
+    address is checked with a single binary search regardless of the number
+    of rules.
+    '''
+    def __init__(self, rules=(), default=None):
+        self.default = default
+        self.default_hits = 0
+        self.rules = []
+        self._tables = {}
+        self._default_action = default or ALLOW
+        self.load(rules)
+
+    def __repr__(self):
+        return '<%s(%d rules) at %#x>' % (self.__class__.__name__,
+                                          len(self.rules), id(self))
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __contains__(self, address):
+        return self.check(address)
+
+    def load(self, rules):
+        '''
+        Compiles the given rules and replaces the current ones. Hit counters
+        of rules which are not changed are preserved, so the list can be
+        reloaded at runtime.
+        '''
+        rules = [AclRule.parse(rule) for rule in rules]
+        previous = dict(((rule.key, rule.action), rule.hits)
+                        for rule in self.rules)
+        unique = {}
+        for rule in rules:
+            rule.hits = previous.get((rule.key, rule.action), rule.hits)
+            current = unique.get(rule.key)
+            if current is None or rule.action == DENY:
+                unique[rule.key] = rule
+        tables = {}
+        for family in _BITS:
+            tables[family] = self._compile(
+                [rule for rule in unique.values() if rule.family == family])
+        default = self.default
+        if default is None:
+            allows = [rule for rule in rules if rule.action == ALLOW]
+            default = DENY if allows else ALLOW
+        # Swap the compiled state at once.
+        self.rules, self._tables, self._default_action = (rules, tables,
+                                                          default)
+
+    def _compile(self, rules):
+        # Networks are either nested or disjoint, so the ranges of a sweep
+        # over networks sorted by their first address and prefix are owned by
+        # the innermost open network.
+        rules.sort(key=lambda rule: (rule.first, rule.prefixlen))
+        starts, ends, owners = [], [], []
+
+        def emit(first, last, rule):
+            if first <= last:
+                starts.append(first)
+                ends.append(last)
+                owners.append(rule)
+
+        stack = []
+        position = 0
+        for rule in rules:
+            while stack and stack[-1].last < rule.first:
+                top = stack.pop()
+                emit(position, top.last, top)
+                position = top.last + 1
+            if stack:
+                emit(position, rule.first - 1, stack[-1])
+            position = rule.first
+            stack.append(rule)
+        while stack:
+            top = stack.pop()
+            emit(position, top.last, top)
+            position = top.last + 1
+        return starts, ends, owners
+
+    def match(self, address):
+        '''
+        Returns the rule matching the given address or None.
+        '''
+        family, value = parse_address(address)
+        starts, ends, owners = self._tables[family]
+        index = bisect.bisect_right(starts, value) - 1
+        if index >= 0 and value <= ends[index]:
+            return owners[index]
+        return None
+
+    def check(self, address):
+        '''
+        Returns True if the given address is allowed and counts a hit of the
+        matching rule. Invalid addresses are denied.
+        '''
+        try:
+            rule = self.match(address)
+        except ValueError:
+            return False
+        if rule is None:
+            self.default_hits += 1
+            return self._default_action == ALLOW
+        rule.hits += 1
+        return rule.action == ALLOW
+
+    def stats(self):
+        '''
+        Returns a list of (rule, action, hits) tuples of all rules followed
+        by the default one, with rule None.
+        '''
+        stats = [(rule.network, rule.action, rule.hits)
+                 for rule in self.rules]
+        stats.append((None, self._default_action, self.default_hits))
+        return stats
+
+
+def compile_acl(rules):
+    '''
+    Returns an ACL of the given rules, which may be an ACL already or None.
+
+    Addresses which do not match any of the given rules are denied, so an
+    empty list denies all connections. Only None allows all of them.
+    '''
+    if rules is None or isinstance(rules, JsonRpcAcl):
+        return rules
+    return JsonRpcAcl(rules, default=DENY)
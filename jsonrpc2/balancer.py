@@ -0,0 +1,367 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Definitions of client side load balancers of Json-RPC endpoints.
+
+A balancer chooses an endpoint of every request by its policy:
+ * round_robin - endpoints in turn,
+ * least_outstanding - the endpoint with the fewest pending requests,
+ * p2c_ewma - the better of two random endpoints, by their EWMA latency
+   weighted by pending requests,
+ * consistent_hash - the endpoint of a key of request params on a hash
+   ring, so requests of a key go to the same endpoint.
+
+Endpoints which fail a number of requests in a row, e.g. by connection
+errors, timeouts or HTTP errors of servers, are ejected for a time which
+doubles with every following ejection.
+'''
+
+import math
+import time
+import bisect
+import random
+import hashlib
+import six
+
+from . import logger
+from .errors import JsonRpcProtocolError, JsonRpcResponseError
+
+ROUND_ROBIN = 'round_robin'
+LEAST_OUTSTANDING = 'least_outstanding'
+P2C_EWMA = 'p2c_ewma'
+CONSISTENT_HASH = 'consistent_hash'
+
+__metaclass__ = type
+
+def is_endpoint_failure(error):
+    '''
+    Checks if the given request error is a failure of its endpoint, rather
+    than an error of the request.
+    '''
+    if isinstance(error, JsonRpcProtocolError):
+        # Client errors of HTTP, except for 400 of connection errors
+        return not 400 < error.code < 500
+    return isinstance(error, JsonRpcResponseError)
+
+
+class Endpoint:
+    '''
+    A class of balanced endpoints, which keep statistics of their requests.
+    '''
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        # Failures in a row and ejections in a row
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0
+        self.ewma = 0.0
+        self._ewma_time = None
+
+    def __repr__(self):
+        return '<%s(%s)>' % (self.__class__.__name__, self.url)
+
+    def ejected(self, now=None):
+        return self.ejected_until > (now or time.time())
+
+    def update_ewma(self, latency, decay, now=None):
+        '''
+        Adds the given latency to the exponentially weighted moving average,
+        in which older latencies decay with the given time in seconds.
+        '''
+        now = now or time.time()
+        if self._ewma_time is None:
+            self.ewma = latency
+        else:
+            weight = math.exp(-max(0, now - self._ewma_time) / decay)
+            self.ewma = self.ewma * weight + latency * (1 - weight)
+        self._ewma_time = now
+
+    def cost(self):
+        return self.ewma * (self.outstanding + 1)
+
+    def stats(self):
+        return {
+            'url': self.url,
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'failures': self.failures,
+            'ewma': self.ewma,
+            'ejected': self.ejected()
+        }
+
+
+class BalancingPolicy:
+    '''
+    A base class for balancing policies, which choose random endpoints.
+    '''
+    def __init__(self, random=random):
+        self.random = random
+
+    def update(self, endpoints):
+        '''
+        Handles the given new list of all endpoints.
+        '''
+        pass
+
+    def choose(self, endpoints, request):
+        '''
+        Returns one of the given available endpoints for the given request.
+        '''
+        return self.random.choice(endpoints)
+
+
+class RoundRobin(BalancingPolicy):
+    '''
+    A policy choosing endpoints in turn.
+    '''
+    def __init__(self):
+        BalancingPolicy.__init__(self)
+        self._next = 0
+
+    def choose(self, endpoints, request):
+        endpoint = endpoints[self._next % len(endpoints)]
+        self._next += 1
+        return endpoint
+
+
+class LeastOutstanding(BalancingPolicy):
+    '''
+    A policy choosing the endpoint with the fewest pending requests, the
+    first one in turn of equal ones.
+    '''
+    def __init__(self):
+        BalancingPolicy.__init__(self)
+        self._next = 0
+
+    def choose(self, endpoints, request):
+        self._next += 1
+        count = len(endpoints)
+        return min((endpoints[(self._next + i) % count]
+                    for i in range(count)),
+                   key=lambda endpoint: endpoint.outstanding)
+
+
+class PowerOfTwoChoices(BalancingPolicy):
+    '''
+    A policy choosing the better one of two random endpoints by their EWMA
+    latency weighted by pending requests.
+    '''
+    def choose(self, endpoints, request):
+        if len(endpoints) == 1:
+            return endpoints[0]
+        first, second = self.random.sample(endpoints, 2)
+        if second.cost() < first.cost():
+            return second
+        return first
+
+
+class ConsistentHash(BalancingPolicy):
+    '''
+    A policy choosing endpoints on a hash ring by a key of request params.
+
+    The key is given as a name of a member of dictionary params, an index of
+    list params, or a function of a request. Every endpoint has the given
+    number of points on the ring, so only keys of a removed or ejected
+    endpoint move to other endpoints. Requests without a key go to random
+    endpoints.
+    '''
+    def __init__(self, key, replicas=100, random=random):
+        BalancingPolicy.__init__(self, random)
+        self.key = key
+        self.replicas = replicas
+        self._ring = []
+        self._points = []
+
+    def request_key(self, request):
+        '''
+        Returns the hash key of the given request.
+        '''
+        if callable(self.key):
+            return self.key(request)
+        try:
+            return request.params[self.key]
+        except (KeyError, IndexError, TypeError):
+            return None
+
+    def _hash(self, value):
+        digest = hashlib.md5(('%s' % value).encode('utf-8')).hexdigest()
+        return int(digest[:16], 16)
+
+    def update(self, endpoints):
+        # The ring is built of all endpoints, so ejections do not move keys
+        # of other endpoints.
+        ring = []
+        for endpoint in endpoints:
+            for i in range(self.replicas):
+                ring.append((self._hash('%s#%d' % (endpoint.url, i)),
+                             endpoint.url))
+        ring.sort()
+        self._ring = [url for point, url in ring]
+        self._points = [point for point, url in ring]
+
+    def choose(self, endpoints, request):
+        key = self.request_key(request)
+        if key is None or not self._ring:
+            return self.random.choice(endpoints)
+        available = dict((endpoint.url, endpoint) for endpoint in endpoints)
+        index = bisect.bisect(self._points, self._hash(key))
+        count = len(self._ring)
+        for i in range(count):
+            endpoint = available.get(self._ring[(index + i) % count])
+            if endpoint is not None:
+                return endpoint
+        return self.random.choice(endpoints)
+
+# Policy classes by names, of policies without arguments
+POLICIES = {
+    ROUND_ROBIN: RoundRobin,
+    LEAST_OUTSTANDING: LeastOutstanding,
+    P2C_EWMA: PowerOfTwoChoices
+}
+
+
+class JsonRpcBalancer:
+    '''
+    A class of client side load balancers.
+
+    Endpoints are given as a list of URLs or a resolver function returning
+    them, which is called again every resolve_interval seconds. A policy is
+    given as a name or a policy object; the consistent_hash policy needs
+    a key, so it is given as a ConsistentHash object.
+    '''
+    #: Failures in a row which eject an endpoint
+    max_failures = 5
+
+    #: Time in seconds of the first ejection of an endpoint
+    ejection_time = 10
+
+    #: The maximum time in seconds of ejections
+    max_ejection_time = 300
+
+    #: Decay time in seconds of EWMA latencies
+    ewma_decay = 10
+
+    #: Time in seconds between calls of a resolver
+    resolve_interval = 30
+
+    def __init__(self, endpoints, policy=ROUND_ROBIN):
+        if isinstance(policy, six.string_types):
+            if policy not in POLICIES:
+                raise ValueError('Unknown balancing policy: %r' % policy)
+            policy = POLICIES[policy]()
+        self.policy = policy
+        self.resolver = None
+        # A DNS cache prefetching hosts of new endpoints or None
+        self.dns_cache = None
+        self.endpoints = []
+        self._resolved = 0
+        if callable(endpoints):
+            self.resolver = endpoints
+            self.resolve()
+        else:
+            self.update(endpoints)
+
+    def update(self, urls):
+        '''
+        Sets endpoints of the given URLs, keeping statistics of endpoints
+        which are still there.
+        '''
+        if not urls:
+            raise ValueError('No endpoints to balance')
+        current = dict((endpoint.url, endpoint) for endpoint in self.endpoints)
+        self.endpoints = [current.get(url) or Endpoint(url) for url in urls]
+        self.policy.update(self.endpoints)
+        if self.dns_cache is not None:
+            self.dns_cache.prefetch(url for url in urls if url not in current)
+
+    def resolve(self):
+        '''
+        Updates endpoints by the resolver. Endpoints are kept if it fails.
+        '''
+        self._resolved = time.time()
+        try:
+            self.update(self.resolver())
+        except Exception:
+            if not self.endpoints:
+                raise
+            logger.exception('Resolve endpoints error')
+
+    def select(self, request, exclude=()):
+        '''
+        Returns an endpoint of the given request. Ejected endpoints and the
+        given excluded ones, e.g. endpoints of failed attempts of a request,
+        are skipped unless all endpoints are.
+        '''
+        now = time.time()
+        if (self.resolver is not None and
+            now - self._resolved >= self.resolve_interval):
+            self.resolve()
+        endpoints = [endpoint for endpoint in self.endpoints
+                     if not endpoint.ejected(now) and endpoint not in exclude]
+        if not endpoints:
+            endpoints = [endpoint for endpoint in self.endpoints
+                         if endpoint not in exclude] or self.endpoints
+        return self.policy.choose(endpoints, request)
+
+    def start(self, endpoint):
+        '''
+        Counts a sent request of the given endpoint.
+        '''
+        endpoint.outstanding += 1
+        endpoint.requests += 1
+
+    def finish(self, endpoint, latency, error=None):
+        '''
+        Counts a finished request of the given endpoint with the given
+        latency in seconds and error, if it failed.
+        '''
+        now = time.time()
+        endpoint.outstanding = max(0, endpoint.outstanding - 1)
+        endpoint.update_ewma(latency, self.ewma_decay, now)
+        if error is None or not is_endpoint_failure(error):
+            endpoint.consecutive_failures = 0
+            endpoint.ejections = 0
+            return
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        if (endpoint.consecutive_failures >= self.max_failures and
+            not endpoint.ejected(now)):
+            endpoint.ejections += 1
+            ejection_time = min(self.max_ejection_time, self.ejection_time *
+                                2 ** min(endpoint.ejections - 1, 16))
+            endpoint.ejected_until = now + ejection_time
+            logger.warning('Eject endpoint for %ss: %r', ejection_time,
+                           endpoint)
+
+    def cancel(self, endpoint):
+        '''
+        Counts a cancelled request of the given endpoint.
+        '''
+        endpoint.outstanding = max(0, endpoint.outstanding - 1)
+
+    def stats(self):
+        '''
+        Returns a list of statistics of endpoints.
+        '''
+        return [endpoint.stats() for endpoint in self.endpoints]
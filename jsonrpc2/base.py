@@ -21,10 +21,15 @@
 Basic functions and defintions of Json-RPC message classes.
 '''
 
+import re
 import json
+import time
+import heapq
 import random
 import string
 import asyncore
+import itertools
+import six
 from . import logger
 
 from .errors import JsonRpcError, JsonRpcParseError, InvalidJsonRpcError
@@ -35,27 +40,43 @@ VERSION = '0.2.4'
 # Json-RPC specification version
 SPEC_VER = '2.0'
 
-_ID_CHARSET = string.ascii_letters + string.digits
+# A counter of generated message IDs, started at a random number so IDs of
+# different processes do not repeat each other
+_ids = itertools.count(random.getrandbits(32))
 
 __metaclass__ = type
 
-def _gen_id(length=8):
+def _gen_id():
     '''
-    Generates random message ID.
+    Generates a message ID unique within the process, for 2^32 IDs.
     '''
-    return ''.join([random.choice(_ID_CHARSET) for i in range(length)])
+    return '%08x' % (next(_ids) & 0xffffffff)
+
+# JSON decoders by encodings
+_decoders = {}
+
+def _decoder(encoding):
+    decoder = _decoders.get(encoding)
+    if decoder is None:
+        decoder = _decoders[encoding] = json.JSONDecoder(encoding=encoding)
+    return decoder
 
 def dumps(message, encoding=None):
     '''
     Serializes the Json-RPC message given as dictionary object to a JSON
-    formatted data using the specified encoding.
+    formatted data using the specified encoding. The given dictionary is not
+    modified.
 
     Raises a JsonRpcParseError exception if the message cannot be serialized.
     '''
-    logger.debug('Dumps message: %s' % message)
+    message = dict(message)
+    message['jsonrpc'] = SPEC_VER
+    return _encode(message, encoding)
+
+def _encode(message, encoding=None):
+    logger.debug('Dumps message: %s', message)
     if not encoding:
         encoding = 'utf-8'
-    message['jsonrpc'] = SPEC_VER
     try:
         return json.dumps(message, encoding=encoding)
     except TypeError as err:
@@ -70,11 +91,11 @@ def loads(data, classes=[], encoding=None):
     Raises a JsonRpcError exception if the message cannot be deserialized to
     a message of one the specified classes.
     '''
-    logger.debug('Loads message: %s' % data)
+    logger.debug('Loads message: %s', data)
     if not encoding:
         encoding = 'utf-8'
     try:
-        message = json.loads(data, encoding=encoding)
+        message = _decoder(encoding).decode(data)
     except ValueError as err:
         data = {'exception': '%s' % err}
         raise JsonRpcParseError(data=data)
@@ -82,32 +103,299 @@ def loads(data, classes=[], encoding=None):
     if (not isinstance(message, dict) or
         message.pop('jsonrpc', None) != SPEC_VER):
         raise InvalidJsonRpcError()
-    # JSON-RPC message validation
-    for cls in classes:
+    # JSON-RPC message validation by the set of its members
+    shape = frozenset(message)
+    cls = _MESSAGE_SHAPES.get(shape)
+    if cls is not None and cls in classes:
+        return cls(**message)
+    if shape == _ERROR_SHAPE and isinstance(message['error'], dict):
+        error = message['error']
+        if (_ERROR_MEMBERS.issuperset(error) and 'code' in error and
+            'message' in error):
+            raise JsonRpcError(id=message['id'], **error)
+    data = {'exception': 'Unexpected members: %s' %
+                         ', '.join(sorted(shape))}
+    raise JsonRpcParseError(data=data)
+
+
+class RawJson:
+    '''
+    A class of JSON encoded values, which are spliced into messages as they
+    are and decoded lazily.
+
+    Interface methods may return raw JSON results, e.g. documents fetched
+    from a cache, to skip decoding and encoding them.
+    '''
+    __slots__ = ('data', 'encoding', '_value')
+
+    def __init__(self, data, encoding=None):
+        encoding = encoding or 'utf-8'
+        if isinstance(data, six.text_type):
+            data = data.encode(encoding)
+        self.data = data
+        self.encoding = encoding
+        self._value = _UNDECODED
+
+    def __repr__(self):
+        return '<%s(%d bytes)>' % (self.__class__.__name__, len(self.data))
+
+    def __eq__(self, other):
+        return isinstance(other, RawJson) and self.data == other.data
+
+    def __ne__(self, other):
+        return not self == other
+
+    @property
+    def value(self):
+        '''
+        The decoded value.
+        '''
+        if self._value is _UNDECODED:
+            self._value = _decoder(self.encoding).decode(self.data)
+        return self._value
+
+_UNDECODED = object()
+
+_WHITESPACE_RE = re.compile(r'\s*')
+
+# Members of a response which follow its result, e.g. ', "id": "1"}'
+_RESPONSE_TAIL_RE = re.compile(r'(?:,\s*"(?:id|jsonrpc|error)"\s*:\s*'
+                               r'(?:"(?:[^"\\]|\\.)*"|-?\d+|null)\s*)*}\s*$')
+
+# The maximum size of response members which follow its result
+_RESPONSE_TAIL_SIZE = 1024
+
+# Members of a plain response other than its result
+_RAW_RESPONSE_SHAPE = frozenset(['jsonrpc', 'id'])
+
+# Characters other than brackets, and a table of brackets to square ones
+_NON_BRACKET_CHARS = ''.join(chr(i) for i in range(256)
+                             if chr(i) not in '[]{}')
+_BRACKET_TABLE = string.maketrans('{}', '[]')
+_NON_BRACKET_RE = re.compile(r'[^\[\]{}]+')
+
+# The maximum nesting of raw results which are skimmed
+_MAX_SKIMMED_DEPTH = 64
+
+def _skim_value(data, decoder):
+    # Checks that the given data is a single encoded value without decoding
+    # its containers: their brackets have to be balanced outside strings.
+    if not data:
+        return False
+    if data[0] not in '[{':
+        # Scalars and strings are decoded at once.
         try:
-            return cls(**message)
-        except TypeError:
-            pass
+            return decoder.raw_decode(data)[1] == len(data)
+        except ValueError:
+            return False
+    if data[-1] not in ']}':
+        return False
+    # Quotes of strings split the data, once escaped ones are removed.
+    parts = data.replace('\\\\', '').replace('\\"', '').split('"')
+    if not len(parts) % 2:
+        return False
+    outside = ''.join(parts[::2])
+    if isinstance(outside, six.text_type):
+        brackets = _NON_BRACKET_RE.sub('', outside).replace(
+                        '{', '[').replace('}', ']')
+    else:
+        brackets = outside.translate(_BRACKET_TABLE, _NON_BRACKET_CHARS)
+    # The outer brackets enclose the whole data if inner ones are balanced.
+    brackets = brackets[1:-1]
+    for i in range(_MAX_SKIMMED_DEPTH):
+        if not brackets:
+            return True
+        reduced = brackets.replace('[]', '')
+        if len(reduced) == len(brackets):
+            return False
+        brackets = reduced
+    return False
+
+def loads_raw_result(data, encoding=None):
+    '''
+    Deserializes the given JSON formatted Json-RPC response leaving its
+    result encoded, as a RawJson object of the result bytes of the data.
+
+    Only the members other than the result are decoded. The result is
+    skimmed rather than decoded: brackets of its containers have to be
+    balanced outside strings, and malformed members of them raise
+    ValueError when the value of the RawJson object is read. Responses of
+    other shapes than a result, an ID, a version and an optional null error
+    are fully decoded by loads().
+
+    Raises a JsonRpcError exception like loads() if the data is not a
+    response.
+    '''
+    logger.debug('Loads raw message: %s', data)
+    if not encoding:
+        encoding = 'utf-8'
+    decoder = _decoder(encoding)
+    members = {}
+    result_start = None
     try:
-        raise JsonRpcError(id=message['id'], **message['error'])
-    except (TypeError, KeyError) as err:
-        data = {'exception': '%s' % err}
-        raise JsonRpcParseError(data=data)
+        index = _WHITESPACE_RE.match(data).end()
+        if data[index:index + 1] == '{':
+            index += 1
+        else:
+            index = None
+        while index is not None:
+            index = _WHITESPACE_RE.match(data, index).end()
+            if data[index:index + 1] != '"':
+                break
+            key, index = json.decoder.scanstring(data, index + 1, encoding)
+            index = _WHITESPACE_RE.match(data, index).end()
+            if data[index:index + 1] != ':':
+                break
+            index = _WHITESPACE_RE.match(data, index + 1).end()
+            if key == 'result':
+                result_start = index
+                break
+            members[key], index = decoder.raw_decode(data, index)
+            index = _WHITESPACE_RE.match(data, index).end()
+            if data[index:index + 1] != ',':
+                break
+            index += 1
+    except ValueError:
+        result_start = None
+    result = None
+    if result_start is not None:
+        tail = _RESPONSE_TAIL_RE.search(
+                    data, max(result_start, len(data) - _RESPONSE_TAIL_SIZE))
+        if tail is not None:
+            raw = data[result_start:tail.start()].rstrip()
+            tail = tail.group()
+            try:
+                members.update(decoder.decode('{' + tail[1:]
+                                              if tail.startswith(',')
+                                              else '{}'))
+            except ValueError:
+                raw = None
+            if _skim_value(raw, decoder):
+                result = RawJson(raw, encoding)
+    if 'error' in members and members['error'] is None:
+        del members['error']
+    if (result is None or frozenset(members) != _RAW_RESPONSE_SHAPE or
+        members['jsonrpc'] != SPEC_VER):
+        # Not a plain response, like an error or a malformed one.
+        message = loads(data, [JsonRpcResponse], encoding=encoding)
+        message.result = RawJson(json.dumps(message.result,
+                                            encoding=encoding))
+        return message
+    return JsonRpcResponse(members['id'], result)
+
 
+# Scheduled timers as a heap of (deadline, sequence number, timer) entries
+_timers = []
+_timer_seq = itertools.count()
+
+class Timer:
+    '''
+    A class of timers scheduled by call_later().
+    '''
+    def __init__(self, deadline, callback, args, kwargs):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+        self._entry = (deadline, next(_timer_seq), self)
+
+    def cancel(self):
+        '''
+        Cancels the timer if it has not been run yet.
+        '''
+        if self.cancelled:
+            return
+        self.cancelled = True
+        try:
+            _timers.remove(self._entry)
+        except ValueError:
+            return
+        heapq.heapify(_timers)
+
+    def run(self):
+        self.cancelled = True
+        self.callback(*self.args, **self.kwargs)
+
+def call_later(delay, callback, *args, **kwargs):
+    '''
+    Schedules the given callback to be called by the event loop after the
+    given delay in seconds. Returns a timer which can be cancelled.
+    '''
+    timer = Timer(time.time() + delay, callback, args, kwargs)
+    heapq.heappush(_timers, timer._entry)
+    return timer
+
+def run_timers():
+    '''
+    Runs all timers which are due.
+    '''
+    now = time.time()
+    while _timers and _timers[0][0] <= now:
+        timer = heapq.heappop(_timers)[2]
+        try:
+            timer.run()
+        except Exception:
+            logger.exception('Timer error')
+
+def active():
+    '''
+    Checks if the event loop has any channels or timers to run.
+    '''
+    return bool(asyncore.socket_map or _timers)
+
+def poll_timeout(timeout):
+    '''
+    Returns the given poll timeout in seconds shortened to the deadline of
+    the next timer.
+    '''
+    if _timers:
+        # Poll timeouts are truncated to milliseconds, round them up.
+        return max(0, min(timeout, _timers[0][0] - time.time() + 0.001))
+    return timeout
 
 def loop(timeout=1, count=None):
     '''
-    Runs an asynchronous event loop.
+    Runs an asynchronous event loop until there are no more channels and
+    timers, or the given count of iterations is reached.
     '''
-    asyncore.loop(timeout=timeout, use_poll=True, count=count)
+    socket_map = asyncore.socket_map
+    while socket_map or _timers:
+        if count is not None:
+            if count <= 0:
+                break
+            count -= 1
+        if socket_map:
+            asyncore.poll2(poll_timeout(timeout), socket_map)
+        else:
+            time.sleep(poll_timeout(timeout))
+        run_timers()
 
 
 class JsonRpcBase:
     '''
     A base class for Json-RPC messages.
+
+    Members of a message are the slots of its class, so messages are
+    decoded by the set of their members.
     '''
-    def dumps(self, message, encoding=None):
-        return dumps(message, encoding=encoding)
+    __slots__ = ()
+
+    def __repr__(self):
+        return '<%s(%s)>' % (self.__class__.__name__,
+                             ', '.join('%s=%r' % (name, getattr(self, name))
+                                       for name in self.__slots__))
+
+    def marshal(self):
+        '''
+        Returns a new dictionary of members of the message.
+        '''
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def dumps(self, encoding=None):
+        message = self.marshal()
+        message['jsonrpc'] = SPEC_VER
+        return _encode(message, encoding=encoding)
 
 class JsonRpcNotification(JsonRpcBase):
     '''
@@ -118,17 +406,12 @@ class JsonRpcNotification(JsonRpcBase):
         "params": null
     }
     '''
+    __slots__ = ('method', 'params')
+
     def __init__(self, method, params):
         self.method = method
         self.params = params
 
-    def dumps(self, encoding=None):
-        notification = {
-            'method': self.method,
-            'params': self.params
-        }
-        return JsonRpcBase.dumps(self, notification, encoding=encoding)
-
 class JsonRpcRequest(JsonRpcBase):
     '''
     A class of Json-RPC requests:
@@ -139,19 +422,13 @@ class JsonRpcRequest(JsonRpcBase):
         "params": null
     }
     '''
+    __slots__ = ('method', 'params', 'id')
+
     def __init__(self, method, params, id=None):
         self.id = id or _gen_id()
         self.method = method
         self.params = params
 
-    def dumps(self, encoding=None):
-        request = {
-            'method': self.method,
-            'params': self.params,
-            'id': self.id
-        }
-        return JsonRpcBase.dumps(self, request, encoding=encoding)
-
 class JsonRpcResponse(JsonRpcBase):
     '''
     A class of Json-RPC responses:
@@ -161,14 +438,17 @@ class JsonRpcResponse(JsonRpcBase):
         "result": null
     }
     '''
+    __slots__ = ('result', 'id')
+
     def __init__(self, id, result):
         self.id = id
         self.result = result
 
-    def dumps(self, encoding=None):
-        response = {
-            'result': self.result,
-            'id': self.id
-        }
-        return JsonRpcBase.dumps(self, response, encoding=encoding)
+# Message classes by the sets of their members
+_MESSAGE_SHAPES = dict((frozenset(cls.__slots__), cls)
+                       for cls in (JsonRpcNotification, JsonRpcRequest,
+                                   JsonRpcResponse))
+
+_ERROR_SHAPE = frozenset(('error', 'id'))
+_ERROR_MEMBERS = frozenset(('code', 'message', 'data'))
 
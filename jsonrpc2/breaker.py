@@ -0,0 +1,230 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Definitions of circuit breakers of Json-RPC client endpoints.
+'''
+
+import time
+from collections import deque
+
+from . import logger
+from .errors import TIMEOUT_CODE
+from .balancer import is_endpoint_failure
+
+# States of circuit breakers
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+__metaclass__ = type
+
+class CircuitBreaker:
+    '''
+    A class of circuit breakers of endpoints.
+
+    A closed breaker counts outcomes of requests in a sliding window of the
+    given length in seconds. When the window has at least the minimum
+    number of requests and the rate of failures or timeouts exceeds its
+    threshold, the breaker opens and requests fail fast. After the open
+    time it is half-open and lets the given number of trial requests
+    through: it closes when all of them succeed and opens again when any of
+    them fails.
+    '''
+    def __init__(self, url, breakers):
+        self.url = url
+        self.breakers = breakers
+        self.state = CLOSED
+        self.opened_at = None
+        # (time, failed, timed out) outcomes of requests in the window
+        self.outcomes = deque()
+        self.failures = 0
+        self.timeouts = 0
+        # Started and succeeded trial requests of a half-open breaker
+        self.trials = 0
+        self.trial_successes = 0
+        self.rejected = 0
+        self.transitions = 0
+
+    def __repr__(self):
+        return '<%s(%s, %s)>' % (self.__class__.__name__, self.url,
+                                 self.state)
+
+    def _set_state(self, state, now):
+        previous, self.state = self.state, state
+        self.transitions += 1
+        self.outcomes.clear()
+        self.failures = self.timeouts = 0
+        self.trials = self.trial_successes = 0
+        self.opened_at = now if state == OPEN else None
+        logger.warning('Circuit breaker %s: url=%r', state, self.url)
+        self.breakers.state_changed(self, previous, state)
+
+    def _expire(self, now):
+        start = now - self.breakers.window
+        outcomes = self.outcomes
+        while outcomes and outcomes[0][0] < start:
+            failed, timed_out = outcomes.popleft()[1:]
+            self.failures -= failed
+            self.timeouts -= timed_out
+
+    def available(self, now=None):
+        '''
+        Checks if a request would be allowed, without starting it.
+        '''
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            now = now or time.time()
+            return now - self.opened_at >= self.breakers.open_time
+        return self.trials < self.breakers.trial_requests
+
+    def allow(self):
+        '''
+        Starts a request if it is allowed. Returns False if it should fail
+        fast.
+        '''
+        if self.state == CLOSED:
+            return True
+        now = time.time()
+        if self.state == OPEN:
+            if now - self.opened_at < self.breakers.open_time:
+                self.rejected += 1
+                return False
+            self._set_state(HALF_OPEN, now)
+        if self.trials >= self.breakers.trial_requests:
+            self.rejected += 1
+            return False
+        self.trials += 1
+        return True
+
+    def record(self, error=None):
+        '''
+        Counts the outcome of a started request with the given error, if it
+        failed.
+        '''
+        now = time.time()
+        failed = error is not None and is_endpoint_failure(error)
+        if self.state == HALF_OPEN:
+            if failed:
+                self._set_state(OPEN, now)
+            else:
+                self.trial_successes += 1
+                if self.trial_successes >= self.breakers.trial_requests:
+                    self._set_state(CLOSED, now)
+            return
+        if self.state == OPEN:
+            return
+        timed_out = failed and getattr(error, 'code', None) == TIMEOUT_CODE
+        self.outcomes.append((now, failed, timed_out))
+        self.failures += failed
+        self.timeouts += timed_out
+        self._expire(now)
+        if failed and self._tripped():
+            self._set_state(OPEN, now)
+
+    def cancel(self):
+        '''
+        Releases a cancelled trial request of a half-open breaker.
+        '''
+        if self.state == HALF_OPEN and self.trials > self.trial_successes:
+            self.trials -= 1
+
+    def _tripped(self):
+        breakers = self.breakers
+        requests = len(self.outcomes)
+        if requests < breakers.min_requests:
+            return False
+        if self.failures >= breakers.error_rate * requests:
+            return True
+        return (breakers.timeout_rate is not None and
+                self.timeouts >= breakers.timeout_rate * requests)
+
+    def stats(self):
+        return {
+            'url': self.url,
+            'state': self.state,
+            'requests': len(self.outcomes),
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'rejected': self.rejected,
+            'transitions': self.transitions
+        }
+
+
+class CircuitBreakers:
+    '''
+    A class of circuit breakers of all endpoints of a client.
+
+    Breakers of endpoints are created on their first requests with the given
+    window in seconds, minimum number of requests in a window, thresholds of
+    failure and timeout rates, open time in seconds and number of trial
+    requests. Callbacks of state changes are called with a breaker and its
+    previous and new states.
+    '''
+    #: A class of circuit breakers
+    breaker_class = CircuitBreaker
+
+    def __init__(self, window=10, min_requests=10, error_rate=0.5,
+                       timeout_rate=None, open_time=5, trial_requests=1,
+                       on_state_change=None):
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.open_time = open_time
+        self.trial_requests = trial_requests
+        self.breakers = {}
+        self.callbacks = []
+        # Counts of state changes by new states
+        self.state_changes = {CLOSED: 0, OPEN: 0, HALF_OPEN: 0}
+        if on_state_change is not None:
+            self.callbacks.append(on_state_change)
+
+    def get(self, url):
+        '''
+        Returns the circuit breaker of the given endpoint URL.
+        '''
+        breaker = self.breakers.get(url)
+        if breaker is None:
+            breaker = self.breakers[url] = self.breaker_class(url, self)
+        return breaker
+
+    def available(self, url):
+        breaker = self.breakers.get(url)
+        return breaker is None or breaker.available()
+
+    def add_callback(self, callback):
+        '''
+        Adds a callback of state changes of breakers.
+        '''
+        self.callbacks.append(callback)
+
+    def state_changed(self, breaker, previous, state):
+        self.state_changes[state] += 1
+        for callback in self.callbacks:
+            try:
+                callback(breaker, previous, state)
+            except Exception:
+                logger.exception('Circuit breaker callback error')
+
+    def stats(self):
+        return [breaker.stats()
+                for url, breaker in sorted(self.breakers.items())]
@@ -0,0 +1,159 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Definitions of response caches of Json-RPC clients.
+'''
+
+import json
+import time
+from collections import OrderedDict
+
+from . import logger
+
+__metaclass__ = type
+
+class CacheEntry:
+    '''
+    A class of cached results.
+    '''
+    __slots__ = ('result', 'expires', 'stale_until')
+
+    def __init__(self, result, expires, stale_until):
+        self.result = result
+        self.expires = expires
+        self.stale_until = stale_until
+
+
+class JsonRpcCache:
+    '''
+    A class of response caches of Json-RPC clients.
+
+    Results of the methods with the given TTLs in seconds are cached by
+    URLs, methods and canonical params, up to the given number of least
+    recently used entries. Expired results are still returned for the given
+    stale time in seconds, while they are revalidated by a new request.
+    Concurrent requests of the same missing result share one request.
+
+    Cached results are shared by all callers, so they must not be modified.
+    '''
+    def __init__(self, ttls, max_entries=1024, stale_ttl=0):
+        # TTLs of results by method names
+        self.ttls = dict(ttls)
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self.entries = OrderedDict()
+        # Pending requests of missing and stale results by keys
+        self.inflight = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def ttl(self, method):
+        '''
+        Returns the TTL of results of the given method or None if they are
+        not cached.
+        '''
+        return self.ttls.get(method)
+
+    def key(self, url, request):
+        '''
+        Returns the cache key of the given request sent to the given URL or
+        None if its params cannot be serialized.
+        '''
+        try:
+            params = json.dumps(request.params, sort_keys=True,
+                                separators=(',', ':'))
+        except (TypeError, ValueError):
+            return None
+        return (url, request.method, params)
+
+    def get(self, key, now=None):
+        '''
+        Returns the cached entry of the given key or None. Stale entries are
+        returned as well, which expiration time is past.
+        '''
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        now = now or time.time()
+        if now >= entry.stale_until:
+            self.misses += 1
+            return None
+        # Move the entry to the most recently used end.
+        self.entries[key] = entry
+        if now >= entry.expires:
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key, result, now=None):
+        '''
+        Caches the given result of a request with the given key.
+        '''
+        ttl = self.ttls.get(key[1])
+        if ttl is None:
+            return
+        expires = (now or time.time()) + ttl
+        self.entries.pop(key, None)
+        self.entries[key] = CacheEntry(result, expires,
+                                       expires + self.stale_ttl)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def finish(self, key, future):
+        '''
+        Caches the result of the given done request future of the given key.
+        Errors are not cached.
+        '''
+        if self.inflight.get(key) is future:
+            del self.inflight[key]
+        if not future.cancelled() and future.exception() is None:
+            self.put(key, future.result())
+
+    def invalidate(self, method=None):
+        '''
+        Drops cached results of the given method or all of them.
+        '''
+        logger.debug('Invalidate cache: method=%r', method)
+        if method is None:
+            self.entries.clear()
+            return
+        for key in [key for key in self.entries if key[1] == method]:
+            del self.entries[key]
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'inflight': len(self.inflight),
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions
+        }
@@ -22,13 +22,28 @@ Definitions of Json-RPC client side classes.
 '''
 
 import json
+import time
+import heapq
+import functools
+from collections import OrderedDict
 import six.moves.urllib.request as urllib_request
 import six.moves.urllib.error as urllib_error
 
 from . import logger
-from .http import HttpRequestContext
-from .base import loads, JsonRpcNotification, JsonRpcRequest, JsonRpcResponse
-from .errors import JsonRpcError, JsonRpcProtocolError, JsonRpcResponseError
+from .http import HttpOpener, HttpRequestContext, HttpHandler, HttpsHandler, \
+                  HttpConnectionPool, TlsSessionCache
+from .future import JsonRpcFuture, TimeoutError
+from .balancer import JsonRpcBalancer
+from .multiplex import JsonRpcStream
+from .retry import is_retryable, MethodStats
+from .deadline import DEADLINE_HEADER, current_deadline, activate_deadline, \
+                      encode_deadline
+from .base import loads, loads_raw_result, call_later, JsonRpcNotification, \
+                  JsonRpcRequest, JsonRpcResponse
+from .errors import TIMEOUT_CODE, JsonRpcError, JsonRpcProtocolError, \
+                    JsonRpcResponseError, JsonRpcDeadlineError, \
+                    JsonRpcCircuitOpenError, JsonRpcQuorumError, \
+                    JsonRpcDuplicateIdError
 
 __metaclass__ = type
 
@@ -38,17 +53,22 @@ class JsonRpcProcessor(urllib_request.BaseHandler):
     '''
     handler_order = 9999
 
-    def __init__(self, context):
-        self.context = context
+    def __init__(self, client):
+        self.client = client
 
-    def http_response(self, request, response):
+    def http_response(self, context, response):
         '''
-        Processes the given Json-RPC response.
+        Processes the given Json-RPC response of the given request context.
         '''
         if response.code == 200:
-            message = loads(response.read(), [JsonRpcResponse],
-                            encoding=self.context.client.encoding)
-            if request.id != message.id:
+            trace = context.trace
+            if trace is None:
+                message = self.loads(response.read())
+            else:
+                span = trace.child('jsonrpc.loads')
+                message = self.loads(response.read())
+                span.finish()
+            if self.client.route(message) is not context:
                 raise JsonRpcResponseError(data={'id': message.id})
             return message.result
         raise JsonRpcProtocolError(response.code, response.msg,
@@ -56,26 +76,274 @@ class JsonRpcProcessor(urllib_request.BaseHandler):
 
     https_response = http_response
 
+    def loads(self, data):
+        '''
+        Deserializes the given response, leaving its result encoded as
+        a RawJson object if the client wants raw results.
+        '''
+        client = self.client
+        if client.raw_results:
+            return loads_raw_result(data, encoding=client.encoding)
+        return loads(data, [JsonRpcResponse], encoding=client.encoding)
+
+
+class JsonRpcOpener(HttpOpener):
+    '''
+    A class of connection openers of Json-RPC clients.
+    '''
+    def __init__(self, client):
+        self.client = client
+        self.dns_cache = client.dns_cache
+        HttpOpener.__init__(self, JsonRpcProcessor(client))
+
+    def create_handler(self, handler_class):
+        if issubclass(handler_class, HttpsHandler):
+            return handler_class(context=self.client.ssl_context,
+                                 sessions=self.client.tls_sessions,
+                                 pool=self.client.pool,
+                                 dns_cache=self.client.dns_cache)
+        if issubclass(handler_class, HttpHandler):
+            return handler_class(pool=self.client.pool,
+                                 dns_cache=self.client.dns_cache)
+        return HttpOpener.create_handler(self, handler_class)
+
 
-class JsonRpcContext(HttpRequestContext):
+class JsonRpcContext(HttpRequestContext, JsonRpcFuture):
     '''
     A class of Json-RPC request contexts.
+
+    A context is a future of the request result as well, so it can be
+    awaited by coroutine interface methods. Cancelling it closes the
+    connection of the request.
+
+    Timeouts of responses are swept by the client, and their dispatchers
+    time them out as well when the event loop does not run timers, like
+    asyncore.loop(). Requests sent while a server handles a request with a
+    deadline inherit it, and their deadlines are sent to servers in a
+    header.
+
+    Requests of multiplexed clients are sent by streams of their URLs and
+    neither their deadlines nor their trace contexts are propagated.
     '''
-    def __init__(self, client, request):
+    def __init__(self, client, request, exclude=(), url=None):
+        JsonRpcFuture.__init__(self, canceller=self.abort)
         self.client = client
+        # Callbacks of the request result and error
+        self._handlers = (None, None)
         self.request = request
-        data = request.dumps(encoding=self.client.encoding)
-        HttpRequestContext.__init__(self, self.client.url, data,
-                                    JsonRpcProcessor(self))
+        self.trace = None
+        self._wait_span = None
+        # The time the response is expected until
+        self.deadline = None
+        # The deadline of the handled server request, which is inherited
+        self.inherited_deadline = current_deadline()
+        # The balanced endpoint of the request
+        self.endpoint = None
+        self._started = None
+        self.url = url or client.url
+        if url is None and client.balancer is not None:
+            if client.breakers is not None:
+                exclude = list(exclude) + [
+                    endpoint for endpoint in client.balancer.endpoints
+                    if not client.breakers.available(endpoint.url)]
+            self.endpoint = client.balancer.select(request, exclude)
+            self.url = self.endpoint.url
+        tracer = client.tracer
+        if tracer is None:
+            data = request.dumps(encoding=self.client.encoding)
+        else:
+            self.trace = tracer.start_span('jsonrpc.call', tracer.current,
+                                           method=request.method,
+                                           url=self.url)
+            span = self.trace.child('jsonrpc.dumps')
+            data = request.dumps(encoding=self.client.encoding)
+            span.finish()
+        # The serialized request
+        self.data = data
+        HttpRequestContext.__init__(self, self.url, data, client.opener)
+        if self.trace is not None:
+            self._request.add_header(tracer.header, tracer.inject(self.trace))
 
     def send_request(self, on_result=None, on_error=None):
-        self._run(on_result, on_error, timeout=self.client.timeout)
+        self._handlers = (on_result, on_error)
+        if not self.client.register(self):
+            self._fail(JsonRpcDuplicateIdError(self.request.id))
+            return
+        if self.deadline is not None:
+            if self.deadline <= time.time():
+                # The inherited deadline has passed already.
+                self._fail(JsonRpcDeadlineError(self.request.id))
+                return
+            self._request.add_header(DEADLINE_HEADER,
+                                     encode_deadline(self.deadline))
+        if self.client.breakers is not None and not self._start_breaker():
+            return
+        self._start_endpoint()
+        if self.client.multiplexed:
+            self._submit()
+            return
+        if self.trace is None:
+            self._run(self._set_result, self._set_error,
+                      timeout=self.client.timeout)
+            return
+        span = self.trace.child('http.send')
+        self._run(self._set_result, self._set_error,
+                  timeout=self.client.timeout)
+        span.finish()
+        if self.trace.end is None:
+            self._wait_span = self.trace.child('http.wait')
+
+    def _submit(self):
+        # Sends the request by the multiplexed stream of its URL.
+        self._on_error = self._set_error
+        stream = self.client.stream(self.url)
+        if self.trace is None:
+            stream.submit(self)
+            return
+        span = self.trace.child('http.send')
+        stream.submit(self)
+        span.finish()
+        if not self.done():
+            self._wait_span = self.trace.child('http.wait')
 
     def send_notification(self):
-        self._run(timeout=self.client.timeout)
-        self._response.close()
+        self._start_endpoint()
+        if self.client.multiplexed:
+            self.client.stream(self.url).notify(self)
+            self._notified()
+            return
+        if self.trace is None:
+            self._run(on_error=self.set_exception, timeout=self.client.timeout,
+                      on_open=self._notified)
+        else:
+            span = self.trace.child('http.send')
+            self._run(on_error=self.set_exception, timeout=self.client.timeout,
+                      on_open=self._notified)
+            span.finish()
+
+    def _notified(self):
+        if self.trace is not None:
+            self.trace.finish()
+        if self._response is not None:
+            self._response.close()
+        self.set_result(None)
+
+    def _set_result(self, result):
+        if self.done():
+            return
+        on_result = self._handlers[0]
+        if on_result:
+            on_result(result)
+        self.set_result(result)
+
+    def _set_error(self, error):
+        if self.done():
+            return
+        on_error = self._handlers[1]
+        if on_error:
+            on_error(error)
+        self.set_exception(error)
+
+    def _start_endpoint(self):
+        if self.endpoint is None:
+            return
+        self._started = time.time()
+        self.client.balancer.start(self.endpoint)
+        self.add_done_callback(self._finish_endpoint)
+
+    def _fail(self, error):
+        # Fails the request before it is sent.
+        if self.trace is not None:
+            self.trace.finish(error='%s' % error)
+        self._set_error(error)
+
+    def _start_breaker(self):
+        breaker = self.client.breakers.get(self.url)
+        if not breaker.allow():
+            logger.debug('Reject request of open circuit: url=%r', self.url)
+            self._fail(JsonRpcCircuitOpenError(self.request.id,
+                                               data={'url': self.url}))
+            return False
+        self.add_done_callback(self._finish_breaker)
+        return True
+
+    def _finish_breaker(self, context):
+        breaker = self.client.breakers.get(self.url)
+        if self.cancelled():
+            breaker.cancel()
+        else:
+            breaker.record(self.exception())
+
+    def _finish_endpoint(self, context):
+        balancer = self.client.balancer
+        if self.cancelled():
+            balancer.cancel(self.endpoint)
+        else:
+            balancer.finish(self.endpoint, time.time() - self._started,
+                            self.exception())
+
+    def _response_timeout(self):
+        # The response dispatcher times the request out at its deadline too.
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.time(), 0.001)
+
+    def expire(self):
+        '''
+        Fails the request with a timeout error and closes its connection.
+        '''
+        logger.warning('Handle response time out')
+        try:
+            self.on_error(urllib_error.URLError((TIMEOUT_CODE,
+                                                 'Connection timed out')))
+        finally:
+            self.abort()
+
+    def on_result(self):
+        if self.inherited_deadline is None:
+            self._handle_result()
+        else:
+            activate_deadline(self.inherited_deadline, self._handle_result)
+
+    def _handle_result(self):
+        if self.trace is None:
+            HttpRequestContext.on_result(self)
+            return
+        if self._wait_span is not None:
+            self._wait_span.finish()
+        self.client.tracer.activate(self.trace,
+                                    HttpRequestContext.on_result, self)
+        self.trace.finish()
+
+    def on_message(self, message):
+        '''
+        Handles the given response message of the request received by
+        a multiplexed stream.
+        '''
+        if self.inherited_deadline is None:
+            self._handle_message(message)
+        else:
+            activate_deadline(self.inherited_deadline, self._handle_message,
+                              message)
+
+    def _handle_message(self, message):
+        if self.trace is None:
+            self._set_result(message.result)
+            return
+        if self._wait_span is not None:
+            self._wait_span.finish()
+        self.client.tracer.activate(self.trace, self._set_result,
+                                    message.result)
+        self.trace.finish()
 
     def on_error(self, error):
+        if self.inherited_deadline is None:
+            self._handle_error(error)
+        else:
+            activate_deadline(self.inherited_deadline, self._handle_error,
+                              error)
+
+    def _handle_error(self, error):
         if isinstance(error, urllib_error.URLError):
             code = 400
             message = str(error.reason)
@@ -87,7 +355,312 @@ class JsonRpcContext(HttpRequestContext):
         if not isinstance(error, JsonRpcError):
             error = JsonRpcResponseError(data={'exception': str(error)})
         error.id = self.request.id
-        HttpRequestContext.on_error(self, error)
+        if self.trace is None:
+            HttpRequestContext.on_error(self, error)
+            return
+        if self._wait_span is not None:
+            self._wait_span.finish()
+        self.trace.tags['error'] = '%s' % error
+        self.client.tracer.activate(self.trace,
+                                    HttpRequestContext.on_error, self, error)
+        self.trace.finish()
+
+
+class JsonRpcCall(JsonRpcFuture):
+    '''
+    A class of Json-RPC calls with retries and hedged requests.
+
+    A call is a future of the result of one or more attempts of a request,
+    which are sent as separate requests with their own IDs, to other
+    endpoints if the client is balanced. Failed attempts are retried and
+    slow attempts of idempotent methods are hedged within the retry budget
+    of the client. The first result is taken and other attempts are
+    cancelled.
+    '''
+    def __init__(self, client, request):
+        JsonRpcFuture.__init__(self, canceller=self._cancel_attempts)
+        self.client = client
+        self.request = request
+        self.idempotent = request.method in client.idempotent
+        self.stats = client.method_stats.get(request.method)
+        if self.stats is None:
+            self.stats = client.method_stats[request.method] = MethodStats()
+        # Contexts of sent attempts
+        self.attempts = []
+        self.retries = 0
+        self.hedges = 0
+        self._handlers = (None, None)
+        self._hedger = None
+        self._started = None
+        self._inherited_deadline = current_deadline()
+
+    def send_request(self, on_result=None, on_error=None):
+        self._handlers = (on_result, on_error)
+        self._started = time.time()
+        self.stats.requests += 1
+        if self.client.retry_budget is not None:
+            self.client.retry_budget.deposit()
+        self._send_attempt()
+        self._schedule_hedge()
+
+    def _send_attempt(self):
+        request = self.request
+        if self.attempts:
+            request = JsonRpcRequest(request.method, request.params)
+        exclude = [attempt.endpoint for attempt in self.attempts]
+        context = JsonRpcContext(self.client, request, exclude)
+        self.attempts.append(context)
+        context.add_done_callback(self._finish_attempt)
+        context.send_request()
+
+    def _schedule_hedge(self):
+        hedging = self.client.hedging
+        if (self.done() or hedging is None or not self.idempotent or
+            self.hedges >= hedging.max_hedges):
+            return
+        delay = hedging.hedge_delay(self.stats)
+        if delay is not None:
+            self._hedger = call_later(delay, self._hedge)
+
+    def _hedge(self):
+        self._hedger = None
+        budget = self.client.retry_budget
+        if self.done() or (budget is not None and not budget.withdraw()):
+            return
+        logger.debug('Hedge request: method=%r', self.request.method)
+        self.hedges += 1
+        self.stats.hedges += 1
+        activate_deadline(self._inherited_deadline, self._send_attempt)
+        self._schedule_hedge()
+
+    def _retry(self, error):
+        budget = self.client.retry_budget
+        return (budget is not None and self.retries < budget.max_retries and
+                is_retryable(error, self.idempotent) and budget.withdraw())
+
+    def _finish_attempt(self, context):
+        if self.done() or context.cancelled():
+            return
+        error = context.exception()
+        if error is None:
+            self.stats.latencies.append(time.time() - self._started)
+            if context is not self.attempts[0]:
+                self.stats.hedge_wins += 1
+            self._set_result(context.result())
+        elif self._retry(error):
+            logger.debug('Retry request: method=%r, error=%s',
+                         self.request.method, error)
+            self.retries += 1
+            self.stats.retries += 1
+            self._send_attempt()
+        elif all(attempt.done() for attempt in self.attempts):
+            # No other attempt can succeed any more
+            self.stats.errors += 1
+            error.id = self.request.id
+            self._set_error(error)
+
+    def _set_result(self, result):
+        self._cancel_attempts()
+        on_result = self._handlers[0]
+        if on_result:
+            on_result(result)
+        self.set_result(result)
+
+    def _set_error(self, error):
+        self._cancel_attempts()
+        on_error = self._handlers[1]
+        if on_error:
+            on_error(error)
+        self.set_exception(error)
+
+    def _cancel_attempts(self):
+        if self._hedger is not None:
+            self._hedger.cancel()
+            self._hedger = None
+        for attempt in self.attempts:
+            attempt.cancel()
+
+
+class JsonRpcCachedCall(JsonRpcFuture):
+    '''
+    A class of futures of cached results, which are taken from the cache of
+    the client or from a pending request of the same result.
+    '''
+    def __init__(self, request, on_result=None, on_error=None):
+        JsonRpcFuture.__init__(self)
+        self.request = request
+        # Is the result taken from the cache
+        self.cached = False
+        self._handlers = (on_result, on_error)
+
+    def hit(self, result):
+        '''
+        Takes the given cached result in the next iteration of the event
+        loop, so the handlers are not called by the request.
+        '''
+        self.cached = True
+        call_later(0, self._hit, result)
+
+    def _hit(self, result):
+        if not self.done():
+            self._set_result(result)
+
+    def follow(self, future):
+        '''
+        Takes the result or error of the given request future when it is
+        done.
+        '''
+        future.add_done_callback(self._follow)
+
+    def _follow(self, future):
+        if self.done():
+            return
+        if future.cancelled():
+            self.cancel()
+        elif future.exception() is not None:
+            self._set_error(future.exception())
+        else:
+            self._set_result(future.result())
+
+    def _set_result(self, result):
+        on_result = self._handlers[0]
+        if on_result:
+            on_result(result)
+        self.set_result(result)
+
+    def _set_error(self, error):
+        on_error = self._handlers[1]
+        if on_error:
+            on_error(error)
+        self.set_exception(error)
+
+
+class JsonRpcFanout(JsonRpcFuture):
+    '''
+    A class of scatter-gather calls of a method of many endpoints.
+
+    A fanout is a future of a dict of results by URLs of the endpoints, in
+    the order they are received, which is done when:
+     * all endpoints respond, by default,
+     * the given quorum of endpoints respond with results, or it fails with
+       JsonRpcQuorumError when the quorum cannot be reached,
+     * the first given number of endpoints respond with results or errors.
+    Errors of endpoints are kept in the errors attribute. When the given
+    timeout expires, the fanout takes the results received so far, unless
+    the quorum is not reached. Requests which are still pending are
+    cancelled and their URLs are kept in the pending attribute.
+
+    Callbacks of results and errors are called with URLs of endpoints as
+    each one of them responds, to merge results as they are streamed.
+    '''
+    def __init__(self, client, method, endpoints, params=None, quorum=None,
+                       first=None, timeout=None, on_result=None,
+                       on_error=None):
+        JsonRpcFuture.__init__(self, canceller=self._cancel_calls)
+        if quorum is not None and first is not None:
+            raise ValueError('Quorum and first completions are exclusive')
+        if isinstance(endpoints, dict):
+            self.shards = OrderedDict(endpoints)
+        else:
+            self.shards = OrderedDict((url, params) for url in endpoints)
+        if (quorum or first or 0) > len(self.shards):
+            raise ValueError('Fanout of %d endpoints cannot complete: '
+                             'quorum=%r, first=%r' % (len(self.shards),
+                                                      quorum, first))
+        self.client = client
+        self.method = method
+        self.quorum = quorum
+        self.first = first
+        self.timeout = timeout
+        # Results and errors of endpoints by URLs
+        self.results = OrderedDict()
+        self.errors = OrderedDict()
+        # Contexts of pending requests by URLs
+        self.contexts = OrderedDict()
+        self.pending = []
+        self._handlers = (on_result, on_error)
+        self._timer = None
+
+    def send_requests(self):
+        '''
+        Sends requests of all endpoints concurrently.
+        '''
+        for url, params in self.shards.items():
+            request = JsonRpcRequest(self.method, params)
+            context = JsonRpcContext(self.client, request, url=url)
+            self.contexts[url] = context
+            context.add_done_callback(functools.partial(self._finish_call,
+                                                        url))
+        if self.timeout is not None:
+            self._timer = call_later(self.timeout, self._expire)
+        for context in list(self.contexts.values()):
+            if self.done():
+                break
+            context.send_request()
+        if not self.shards:
+            self._complete()
+
+    def _finish_call(self, url, context):
+        if self.done() or context.cancelled():
+            return
+        del self.contexts[url]
+        error = context.exception()
+        if error is None:
+            result = self.results[url] = context.result()
+            on_result = self._handlers[0]
+            if on_result:
+                on_result(url, result)
+        else:
+            self.errors[url] = error
+            on_error = self._handlers[1]
+            if on_error:
+                on_error(url, error)
+        if self.quorum is not None:
+            if len(self.results) >= self.quorum:
+                self._complete()
+            elif len(self.results) + len(self.contexts) < self.quorum:
+                self._fail()
+        elif self.first is not None:
+            if len(self.results) + len(self.errors) >= self.first:
+                self._complete()
+        elif not self.contexts:
+            self._complete()
+
+    def _expire(self):
+        self._timer = None
+        if self.done():
+            return
+        logger.debug('Fanout timed out: method=%r, pending=%d',
+                     self.method, len(self.contexts))
+        if self.quorum is not None:
+            self._fail()
+        else:
+            self._complete()
+
+    def _complete(self):
+        self._cancel_calls()
+        self.set_result(self.results)
+
+    def _fail(self):
+        self._cancel_calls()
+        errors = dict((url, '%s' % error)
+                      for url, error in self.errors.items())
+        self.set_exception(JsonRpcQuorumError(data={
+            'method': self.method,
+            'quorum': self.quorum,
+            'results': len(self.results),
+            'errors': errors,
+            'pending': self.pending
+        }))
+
+    def _cancel_calls(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.pending = list(self.contexts)
+        contexts, self.contexts = self.contexts, OrderedDict()
+        for context in contexts.values():
+            context.cancel()
 
 
 class JsonRpcMethod:
@@ -101,8 +674,14 @@ class JsonRpcMethod:
     def __call__(self, *args, **kwargs):
         if self.client.notifier:
             return self.notify(*args, **kwargs)
+        if self.client.blocking:
+            return self.call(*args, **kwargs)
         return self.request(*args, **kwargs)
 
+    def call(self, params=None, timeout=None):
+        request = JsonRpcRequest(self.method, params)
+        return self.client.call(request, timeout)
+
     def notify(self, params=None):
         notification = JsonRpcNotification(self.method, params)
         return self.client.notify(notification)
@@ -115,6 +694,42 @@ class JsonRpcMethod:
 class JsonRpcClient:
     '''
     A class of Json-RPC clients.
+
+    The URL is a single one, or a list of URLs or a resolver function of
+    them, which requests are balanced between by a round robin balancer.
+    Other balancers are given as the balancer argument.
+
+    Requests return contexts which are futures of their results. Results
+    are waited for by running the event loop, e.g. by context.result() or
+    future.gather(). Blocking clients wait for results of method calls and
+    return them, and keep connections alive in a pool by default.
+
+    Hosts are resolved without blocking the event loop, and their addresses
+    are cached, when a DNS cache is given (see jsonrpc2.resolver.DnsCache).
+
+    Results of the methods of the given cache are reused until they expire,
+    without sending requests.
+
+    Requests of endpoints which keep failing fail fast with
+    JsonRpcCircuitOpenError errors when circuit breakers are given.
+
+    Requests failed on connection errors, and on any endpoint failures for
+    the given idempotent methods, are retried within the given retry
+    budget. Slow requests of idempotent methods are hedged by the given
+    hedging policy. Such requests return calls instead of contexts.
+
+    The same method of many endpoints is called by a fanout (see
+    JsonRpcFanout), e.g. to gather results of shards.
+
+    Multiplexed clients send requests by a single stream per URL (see
+    jsonrpc2.multiplex.JsonRpcStream), with up to max_in_flight requests
+    waiting for responses, which are received in any order.
+
+    Requests time out after the timeout, or at deadlines inherited from
+    requests being handled, by a timer of the event loop which is run by
+    jsonrpc2.loop() and the waits for results. Response dispatchers time
+    them out as well, so they time out when the event loop is run by
+    asyncore.loop() too, except for requests of multiplexed streams.
     '''
     #: Default HTTP path
     _http_path = '/RPC2'
@@ -122,26 +737,228 @@ class JsonRpcClient:
     #: Should send notifications by default
     notifier = False
 
-    def __init__(self, url, timeout=None, encoding=None, logging=None):
+    #: A class of connection openers
+    opener_class = JsonRpcOpener
+
+    def __init__(self, url, timeout=None, encoding=None, logging=None,
+                       ssl_context=None, tracer=None, raw_results=False,
+                       blocking=False, keep_alive=None, balancer=None,
+                       idempotent=(), retry_budget=None, hedging=None,
+                       breakers=None, cache=None, dns_cache=None,
+                       multiplexed=False, max_in_flight=64):
+        if balancer is None and (isinstance(url, (list, tuple)) or
+                                 callable(url)):
+            balancer = JsonRpcBalancer(url)
+            url = None
+        # A balancer of requests between endpoints or None
+        self.balancer = balancer
         self.url = url
         self.timeout = timeout
         self.encoding = encoding or 'utf-8'
+        self.ssl_context = ssl_context
+        self.tracer = tracer
+        # Are results passed to callbacks as RawJson objects of received bytes
+        self.raw_results = raw_results
+        # Do method calls wait for their results
+        self.blocking = blocking
+        if keep_alive is None:
+            keep_alive = blocking
+        # A pool of persistent connections or None
+        self.pool = HttpConnectionPool() if keep_alive else None
+        # TLS sessions of servers, which are resumed on Python 3.6+ only
+        self.tls_sessions = TlsSessionCache()
+        # A DNS cache of hosts, resolving them in the background, or None
+        self.dns_cache = dns_cache
+        if balancer is not None and dns_cache is not None:
+            balancer.dns_cache = dns_cache
+            dns_cache.prefetch(endpoint.url for endpoint in balancer.endpoints)
+        # The connection opener shared by requests
+        self.opener = self.opener_class(self)
+        # Names of methods which can be safely retried and hedged
+        self.idempotent = frozenset(idempotent)
+        # A retry budget or None if requests are not retried
+        self.retry_budget = retry_budget
+        # A hedging policy or None if requests are not hedged
+        self.hedging = hedging
+        # Circuit breakers of endpoints or None
+        self.breakers = breakers
+        # A cache of results or None
+        self.cache = cache
+        # Are requests sent by multiplexed streams
+        self.multiplexed = multiplexed
+        self.max_in_flight = max_in_flight
+        # Multiplexed streams by URLs
+        self.streams = {}
+        # Statistics of retried and hedged calls by method names
+        self.method_stats = {}
+        # Contexts of pending requests by request IDs
+        self.pending = {}
+        # A heap of (deadline, request ID) entries of pending requests
+        self._deadlines = []
+        self._sweeper = None
         logger.setup(logging)
 
     def __getattr__(self, method):
         return JsonRpcMethod(method, self)
 
+    def register(self, context):
+        '''
+        Adds the given request context to pending requests until it is
+        done, and schedules a timeout of its response at the client timeout
+        or the inherited deadline, whichever is sooner.
+
+        Returns False if a request of the same ID is pending already, as
+        responses are routed to requests by their IDs.
+        '''
+        request_id = context.request.id
+        if request_id in self.pending:
+            return False
+        self.pending[request_id] = context
+        context.add_done_callback(self._unregister)
+        deadline = context.inherited_deadline
+        if self.timeout:
+            timeout = time.time() + self.timeout
+            if deadline is None or timeout < deadline:
+                deadline = timeout
+        if deadline is None:
+            return True
+        context.deadline = deadline
+        heapq.heappush(self._deadlines, (deadline, request_id))
+        self._schedule_sweep()
+        return True
+
+    def _unregister(self, context):
+        request_id = context.request.id
+        if self.pending.get(request_id) is context:
+            del self.pending[request_id]
+        if not self.pending:
+            self._deadlines = []
+            if self._sweeper is not None:
+                self._sweeper.cancel()
+                self._sweeper = None
+
+    def stream(self, url):
+        '''
+        Returns the multiplexed stream of the given URL, connecting a new one
+        if there is none or its server has closed it.
+        '''
+        stream = self.streams.get(url)
+        if stream is not None and not stream.usable():
+            stream.close()
+            stream = None
+        if stream is None:
+            stream = JsonRpcStream(self, url, self.max_in_flight)
+            self.streams[url] = stream
+        return stream
+
+    def route(self, message):
+        '''
+        Returns the pending request context of the given response message
+        or None.
+        '''
+        return self.pending.get(message.id)
+
+    def _schedule_sweep(self):
+        if not self._deadlines:
+            return
+        deadline = self._deadlines[0][0]
+        if self._sweeper is not None:
+            if self._sweeper.deadline <= deadline:
+                return
+            self._sweeper.cancel()
+        self._sweeper = call_later(deadline - time.time(), self.sweep)
+
+    def sweep(self):
+        '''
+        Expires pending requests which are past their deadlines.
+        '''
+        self._sweeper = None
+        now = time.time()
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] <= now:
+            request_id = heapq.heappop(deadlines)[1]
+            context = self.pending.get(request_id)
+            if context is not None and context.deadline <= now:
+                context.expire()
+        self._schedule_sweep()
+
     def notify(self, notification):
-        logger.debug('Send notification: url=%r, method=%r, parmas=%r'
-                      % (self.url, notification.method, notification.params))
+        logger.debug('Send notification: url=%r, method=%r, parmas=%r',
+                     self.url, notification.method, notification.params)
         context = JsonRpcContext(self, notification)
         context.send_notification()
         return context
 
     def request(self, request, on_result=None, on_error=None):
-        logger.debug('Send request: url=%r, method=%r, parmas=%r'
-                      % (self.url, request.method, request.params))
-        context = JsonRpcContext(self, request)
+        logger.debug('Send request: url=%r, method=%r, parmas=%r',
+                     self.url, request.method, request.params)
+        if self.cache is not None and self.cache.ttl(request.method):
+            return self._request_cached(request, on_result, on_error)
+        return self._send_request(request, on_result, on_error)
+
+    def _send_request(self, request, on_result=None, on_error=None):
+        if self.retry_budget is None and self.hedging is None:
+            context = JsonRpcContext(self, request)
+        else:
+            context = JsonRpcCall(self, request)
         context.send_request(on_result, on_error)
         return context
 
+    def _request_cached(self, request, on_result, on_error):
+        cache = self.cache
+        key = cache.key(self.url, request)
+        if key is None:
+            return self._send_request(request, on_result, on_error)
+        call = JsonRpcCachedCall(request, on_result, on_error)
+        entry = cache.get(key)
+        if entry is not None:
+            if entry.expires <= time.time() and key not in cache.inflight:
+                logger.debug('Revalidate cached result: method=%r',
+                             request.method)
+                self._fetch(key, request)
+            call.hit(entry.result)
+            return call
+        context = cache.inflight.get(key)
+        if context is None:
+            context = self._fetch(key, request)
+        else:
+            cache.coalesced += 1
+        call.follow(context)
+        return call
+
+    def _fetch(self, key, request):
+        context = self._send_request(request)
+        if not context.done():
+            self.cache.inflight[key] = context
+        context.add_done_callback(functools.partial(self.cache.finish, key))
+        return context
+
+    def fanout(self, method, endpoints, params=None, quorum=None, first=None,
+                     timeout=None, on_result=None, on_error=None):
+        '''
+        Calls the given method of the given endpoints concurrently and
+        returns a fanout of their results (see JsonRpcFanout). Endpoints are
+        URLs, called with the given params, or a dict of params by URLs.
+        Persistent connections are reused if the client keeps them alive.
+        '''
+        logger.debug('Send fanout: method=%r, endpoints=%d', method,
+                     len(endpoints))
+        fanout = JsonRpcFanout(self, method, endpoints, params,
+                               quorum=quorum, first=first, timeout=timeout,
+                               on_result=on_result, on_error=on_error)
+        fanout.send_requests()
+        return fanout
+
+    def call(self, request, timeout=None):
+        '''
+        Sends the given request and returns its result, running the event
+        loop until it is received. Raises a JsonRpcError exception if the
+        request fails.
+        '''
+        context = self.request(request)
+        try:
+            return context.result(timeout)
+        except TimeoutError:
+            context.cancel()
+            raise
+
@@ -0,0 +1,81 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Definitions of deadlines of Json-RPC requests.
+
+Clients send the time left until the deadline of a request in milliseconds
+in the "Request-Timeout" HTTP header, so clocks of clients and servers do
+not need to be in sync. Client requests sent while a server handles a
+request with a deadline, e.g. by its interface methods, inherit the
+deadline.
+'''
+
+import time
+
+# The HTTP header of the propagated time left until a deadline
+DEADLINE_HEADER = 'Request-Timeout'
+
+# The deadline of the currently handled request or None
+_current = None
+
+def current_deadline():
+    '''
+    Returns the deadline of the currently handled request or None.
+    '''
+    return _current
+
+def activate_deadline(deadline, func, *args, **kwargs):
+    '''
+    Calls the given function with the given deadline as the current one.
+    '''
+    global _current
+    previous, _current = _current, deadline
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _current = previous
+
+def remaining_time(deadline, now=None):
+    '''
+    Returns the time left until the given deadline in seconds, or None if
+    there is no deadline.
+    '''
+    if deadline is None:
+        return None
+    return max(0.0, deadline - (now or time.time()))
+
+def encode_deadline(deadline, now=None):
+    '''
+    Returns the header value of the given deadline.
+    '''
+    return '%d' % (remaining_time(deadline, now) * 1000)
+
+def decode_deadline(value, now=None):
+    '''
+    Returns a deadline of the given header value or None if it is invalid.
+    '''
+    try:
+        timeout = int(value.strip())
+    except (AttributeError, ValueError):
+        return None
+    if timeout < 0:
+        return None
+    return (now or time.time()) + timeout / 1000.0
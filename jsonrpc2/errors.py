@@ -87,7 +87,37 @@ class JsonRpcResponseError(JsonRpcError):
 
 # Protocol error:
 
+# The code of protocol errors of timed out requests, ETIMEDOUT of Linux
+TIMEOUT_CODE = 110
+
 class JsonRpcProtocolError(JsonRpcError):
     def __init__(self, code, message, id=None, data=None):
         JsonRpcError.__init__(self, code, message, id=id, data=data)
 
+
+# Server errors:
+
+class JsonRpcOverloadError(JsonRpcError):
+    def __init__(self, id=None, data=None):
+        JsonRpcError.__init__(self, 32001, 'Server overloaded.', id, data=data)
+
+class JsonRpcDeadlineError(JsonRpcError):
+    def __init__(self, id=None, data=None):
+        JsonRpcError.__init__(self, 32003, 'Deadline exceeded.', id, data=data)
+
+
+# Client errors, which are never sent by servers, so their codes are
+# positive like ones of protocol errors rather than reserved server ones:
+
+class JsonRpcCircuitOpenError(JsonRpcError):
+    def __init__(self, id=None, data=None):
+        JsonRpcError.__init__(self, 1001, 'Circuit open.', id, data=data)
+
+class JsonRpcQuorumError(JsonRpcError):
+    def __init__(self, id=None, data=None):
+        JsonRpcError.__init__(self, 1002, 'Quorum not reached.', id, data=data)
+
+class JsonRpcDuplicateIdError(JsonRpcError):
+    def __init__(self, id=None, data=None):
+        JsonRpcError.__init__(self, 1003, 'Duplicate request ID.', id,
+                              data=data)
@@ -0,0 +1,400 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Definitions of Json-RPC futures and tasks running coroutines.
+
+Coroutines are either native coroutines (async def) awaiting futures, or
+generators yielding them. A generator returns its result by raising
+Return(value), as a return statement with a value is not valid in Python 2
+generators:
+
+    def power(self, x, n):
+        result = x
+        for i in range(n - 1):
+            result = yield self.client.multiply([result, x])
+        raise Return(result)
+
+Outside of the event loop, results of futures are waited for by running
+the loop until they are done:
+
+    results = gather(client.foo(), client.bar()).result(timeout=5)
+'''
+
+import time
+from collections import deque
+
+from . import base
+from . import logger
+from .base import call_later
+
+# States of futures
+PENDING = 'pending'
+FINISHED = 'finished'
+CANCELLED = 'cancelled'
+
+__metaclass__ = type
+
+class CancelledError(Exception):
+    '''
+    Raised by results of cancelled futures and into cancelled coroutines.
+    '''
+    pass
+
+
+class TimeoutError(Exception):
+    '''
+    Raised by results of futures which are not done in time.
+    '''
+    pass
+
+
+class Return(Exception):
+    '''
+    Raised by generator coroutines to return the given value.
+    '''
+    def __init__(self, value=None):
+        Exception.__init__(self, value)
+        self.value = value
+
+
+class _FutureIterator:
+    # An iterator of a future, which yields the future until it is done and
+    # then stops with its result as the value of await and yield from.
+    def __init__(self, future):
+        self.future = future
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.future.done():
+            return self.future
+        raise StopIteration(self.future.result())
+
+    next = __next__
+
+    def send(self, value):
+        return self.__next__()
+
+
+class JsonRpcFuture:
+    '''
+    A class of results which are not available yet.
+
+    Done callbacks are called with the future when it gets a result, an
+    error or is cancelled. The optional canceller is called when a pending
+    future is cancelled to abort the underlying operation.
+    '''
+    def __init__(self, canceller=None):
+        self._state = PENDING
+        self._value = None
+        self._error = None
+        self._callbacks = []
+        self._canceller = canceller
+
+    def done(self):
+        return self._state != PENDING
+
+    def cancelled(self):
+        return self._state == CANCELLED
+
+    def result(self, timeout=None):
+        '''
+        Returns the result of the future or raises its error.
+
+        A pending future is waited for up to the given timeout in seconds
+        by running the event loop, so it must not be called by callbacks of
+        the loop. Raises TimeoutError if the future is not done in time and
+        RuntimeError if the loop has nothing left to run.
+        '''
+        self._wait(timeout)
+        if self._state == CANCELLED:
+            raise CancelledError()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def exception(self, timeout=None):
+        '''
+        Returns the error of the future or None, waiting for it like
+        result().
+        '''
+        self._wait(timeout)
+        if self._state == CANCELLED:
+            raise CancelledError()
+        return self._error
+
+    def _wait(self, timeout):
+        if self._state != PENDING:
+            return
+        if wait([self], timeout)[1]:
+            if base.active():
+                raise TimeoutError()
+            raise RuntimeError('Result is not ready.')
+
+    def add_done_callback(self, callback):
+        '''
+        Adds a callback which is called with the future when it is done, or
+        immediately if it is done already.
+        '''
+        if self._state == PENDING:
+            self._callbacks.append(callback)
+        else:
+            self._run_callback(callback)
+
+    def remove_done_callback(self, callback):
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def set_result(self, result):
+        '''
+        Sets the result of the future, unless it is done already.
+        '''
+        if self._state != PENDING:
+            return
+        self._value = result
+        self._finish(FINISHED)
+
+    def set_exception(self, error):
+        '''
+        Sets the error of the future, unless it is done already.
+        '''
+        if self._state != PENDING:
+            return
+        self._error = error
+        self._finish(FINISHED)
+
+    def cancel(self):
+        '''
+        Cancels the pending future. Returns False if it is done already.
+        '''
+        if self._state != PENDING:
+            return False
+        canceller, self._canceller = self._canceller, None
+        if canceller is not None:
+            canceller()
+        self._finish(CANCELLED)
+        return True
+
+    def _finish(self, state):
+        self._state = state
+        self._canceller = None
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._run_callback(callback)
+
+    def _run_callback(self, callback):
+        try:
+            callback(self)
+        except Exception:
+            logger.exception('Future callback error')
+
+    def __iter__(self):
+        return _FutureIterator(self)
+
+    __await__ = __iter__
+
+
+def _outcome(future):
+    # Returns the result and the error of the given done future.
+    if future.cancelled():
+        return None, CancelledError()
+    error = future.exception()
+    if error is not None:
+        return None, error
+    return future.result(), None
+
+
+class JsonRpcTask(JsonRpcFuture):
+    '''
+    A class of futures of coroutine results.
+
+    The coroutine is run until it awaits a pending future, and resumed with
+    the result or error of the future when it is done. Cancelling a task
+    cancels the awaited future and raises CancelledError into the coroutine.
+    '''
+    def __init__(self, coroutine):
+        JsonRpcFuture.__init__(self)
+        self._coroutine = coroutine
+        self._waiting = None
+        self._stepping = False
+        self._must_cancel = False
+        self._step()
+
+    def _step(self, value=None, error=None):
+        # Futures which are done already are awaited by this loop rather
+        # than by their callbacks, so that runs of them do not recurse.
+        while True:
+            self._waiting = None
+            self._stepping = True
+            try:
+                if error is None:
+                    awaited = self._coroutine.send(value)
+                else:
+                    awaited = self._coroutine.throw(error)
+            except StopIteration as err:
+                self._stepping = False
+                self.set_result(getattr(err, 'value',
+                                        err.args[0] if err.args else None))
+                return
+            except Return as err:
+                self._stepping = False
+                self.set_result(err.value)
+                return
+            except CancelledError:
+                self._stepping = False
+                JsonRpcFuture.cancel(self)
+                return
+            except Exception as err:
+                self._stepping = False
+                self.set_exception(err)
+                return
+            self._stepping = False
+            if not isinstance(awaited, JsonRpcFuture):
+                value = None
+                error = TypeError('Coroutines must await futures, got %r'
+                                  % (awaited,))
+                continue
+            if self._must_cancel:
+                self._must_cancel = False
+                if not awaited.cancel():
+                    value, error = None, CancelledError()
+                    continue
+            if awaited.done():
+                value, error = _outcome(awaited)
+                continue
+            self._waiting = awaited
+            awaited.add_done_callback(self._wakeup)
+            return
+
+    def _wakeup(self, future):
+        if self._state != PENDING or future is not self._waiting:
+            return
+        self._step(*_outcome(future))
+
+    def cancel(self):
+        '''
+        Cancels the task. Returns False if it is done already.
+        '''
+        if self._state != PENDING:
+            return False
+        if self._stepping:
+            # Cancelled by the coroutine itself, cancel the next future.
+            self._must_cancel = True
+            return True
+        waiting = self._waiting
+        if waiting is None or not waiting.cancel():
+            self._step(error=CancelledError())
+        return True
+
+
+def wait(futures, timeout=None):
+    '''
+    Runs the event loop until all the given futures are done, the given
+    timeout in seconds passes, or the loop has nothing left to run.
+
+    Returns a set of done futures and a set of pending ones.
+    '''
+    deadline = timeout is not None and time.time() + timeout
+    pending = set(future for future in futures if not future.done())
+    done = set(futures) - pending
+    while pending and base.active():
+        poll_timeout = 1
+        if deadline:
+            poll_timeout = deadline - time.time()
+            if poll_timeout <= 0:
+                break
+        base.loop(timeout=min(poll_timeout, 1), count=1)
+        for future in list(pending):
+            if future.done():
+                pending.remove(future)
+                done.add(future)
+    return done, pending
+
+def as_completed(futures, timeout=None):
+    '''
+    Yields the given futures as they are done, running the event loop
+    between them. Raises TimeoutError if they are not done in time.
+    '''
+    futures = set(futures)
+    finished = deque()
+    for future in futures:
+        future.add_done_callback(finished.append)
+    deadline = timeout is not None and time.time() + timeout
+    try:
+        for i in range(len(futures)):
+            while not finished:
+                poll_timeout = 1
+                if deadline:
+                    poll_timeout = deadline - time.time()
+                    if poll_timeout <= 0:
+                        raise TimeoutError()
+                if not base.active():
+                    raise RuntimeError('Result is not ready.')
+                base.loop(timeout=min(poll_timeout, 1), count=1)
+            yield finished.popleft()
+    finally:
+        for future in futures:
+            future.remove_done_callback(finished.append)
+
+def gather(*futures):
+    '''
+    Returns a future of a list of results of the given futures, in their
+    order. It gets the first error of the futures, and cancelling it cancels
+    the futures which are not done.
+    '''
+    def cancel():
+        for future in futures:
+            future.cancel()
+
+    def on_done(future):
+        if gathered.done():
+            return
+        if future.cancelled():
+            gathered.set_exception(CancelledError())
+        elif future.exception() is not None:
+            gathered.set_exception(future.exception())
+        elif all(future.done() for future in futures):
+            gathered.set_result([future.result() for future in futures])
+
+    gathered = JsonRpcFuture(canceller=cancel)
+    if not futures:
+        gathered.set_result([])
+    for future in futures:
+        future.add_done_callback(on_done)
+    return gathered
+
+
+def is_coroutine(obj):
+    '''
+    Checks if the given object is a coroutine or a generator.
+    '''
+    return hasattr(obj, 'send') and hasattr(obj, 'throw')
+
+def sleep(delay, result=None):
+    '''
+    Returns a future which gets the given result after the given delay in
+    seconds, which lets coroutines yield to the event loop.
+    '''
+    future = JsonRpcFuture()
+    timer = call_later(delay, future.set_result, result)
+    future.add_done_callback(lambda future: timer.cancel())
+    return future
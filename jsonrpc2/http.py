@@ -21,9 +21,12 @@
 Definitions of HTTP helper classes for Json-RPC client side.
 '''
 
+import ssl
 import time
+import select
 import socket
 import asyncore
+from collections import OrderedDict
 from six import PY3
 import six.moves.http_client as http_client
 import six.moves.urllib.request as urllib_request
@@ -31,6 +34,8 @@ import six.moves.urllib.response as urllib_response
 import six.moves.urllib.error as urllib_error
 
 from . import logger
+from .errors import TIMEOUT_CODE
+from .resolver import is_ip_address, create_connection
 
 HTTP_HEADERS = {
     'Content-Type': 'application/json-rpc',
@@ -67,7 +72,7 @@ class HttpDispatcher(asyncore.dispatcher):
             if self.response.context:
                 self.response.context.on_result()
         finally:
-            if self.response.will_close:
+            if self.response.will_close or not self.response.isclosed():
                 self.response.close()
 
     def handle_write(self):
@@ -75,7 +80,12 @@ class HttpDispatcher(asyncore.dispatcher):
         Handles a request timeout for the response dispatcher.
         '''
         logger.warning('Handle response time out')
-        raise urllib_error.URLError((110, 'Connection timed out'))
+        try:
+            if self.response.context:
+                self.response.context.on_error(urllib_error.URLError(
+                                    (TIMEOUT_CODE, 'Connection timed out')))
+        finally:
+            self.response.close()
 
     def handle_error(self):
         logger.exception('Handle response error')
@@ -91,6 +101,10 @@ class HttpDispatcher(asyncore.dispatcher):
 class HttpResponse(http_client.HTTPResponse):
     '''
     A class of asynchronous HTTP responses.
+
+    A response of a pooled connection, which is read completely and kept
+    alive by the server, releases the connection to its pool when it is
+    closed.
     '''
     usecount = 1
 
@@ -98,7 +112,11 @@ class HttpResponse(http_client.HTTPResponse):
         http_client.HTTPResponse.__init__(self, sock, debuglevel=0,
                                           method=method)
         self._dispatcher = HttpDispatcher(sock, self)
+        self._released = False
         self.context = None
+        # The pool and the connection to release
+        self.pool = None
+        self.connection = None
 
     def connect(self, context, timeout=None):
         self.context = context
@@ -106,7 +124,15 @@ class HttpResponse(http_client.HTTPResponse):
 
     def close(self):
         http_client.HTTPResponse.close(self)
-        self._dispatcher.close()
+        if self._released:
+            return
+        self._released = True
+        if (self.pool is not None and not self.will_close and
+            self.length == 0):
+            self._dispatcher.del_channel()
+            self.pool.put(self.connection)
+        else:
+            self._dispatcher.close()
 
     def _reuse(self):
         self.usecount += 1
@@ -126,11 +152,32 @@ class HttpConnectionBase:
     '''
     response_class = HttpResponse
 
+    # A DNS cache of addresses of hosts or None
+    _dns_cache = None
+
+    def connect(self):
+        '''
+        Based on httplib.HTTPConnection.connect(), connects to addresses of
+        the host cached by the DNS cache of the connection if it has one.
+        '''
+        cache = self._dns_cache
+        if cache is None or is_ip_address(self.host):
+            http_client.HTTPConnection.connect(self)
+            return
+        self.sock = create_connection(cache.addresses(self.host, self.port),
+                                      self.timeout, self.source_address)
+        if self._tunnel_host:
+            self._tunnel()
+
     def getresponse(self):
         '''
         Based on httplib.HTTPConnection.getresponse().
         '''
-        return self.response_class(self.sock, method=self._method)
+        response = self.response_class(self.sock, method=self._method)
+        # Responses are read asynchronously, so the connection is ready for
+        # a next request as soon as its pool gets it back.
+        self._HTTPConnection__state = http_client._CS_IDLE
+        return response
 
 class HttpConnection(HttpConnectionBase, http_client.HTTPConnection):
     '''
@@ -142,14 +189,142 @@ class HttpsConnection(HttpConnectionBase, http_client.HTTPSConnection):
     '''
     A class of HTTPS connections.
     '''
-    __init__ = http_client.HTTPSConnection.__init__
+    def __init__(self, host, sessions=None, **kwargs):
+        http_client.HTTPSConnection.__init__(self, host, **kwargs)
+        self._sessions = sessions
+
+    def connect(self):
+        '''
+        Based on httplib.HTTPSConnection.connect(), resumes a cached TLS
+        session of the server if there is one, which requires Python 3.6
+        (see TlsSessionCache).
+        '''
+        HttpConnectionBase.connect(self)
+
+        server_hostname = self._tunnel_host or self.host
+        kwargs = {'server_hostname': server_hostname}
+        key = (server_hostname, self.port)
+        if self._sessions is not None:
+            session = self._sessions.get(key)
+            if session is not None:
+                kwargs['session'] = session
+        self.sock = self._context.wrap_socket(self.sock, **kwargs)
+        if self._sessions is not None:
+            self._sessions.put(key, getattr(self.sock, 'session', None))
+
+
+class TlsSessionCache:
+    '''
+    A class of client side TLS session caches.
+
+    Sessions are stored per server to be resumed by new connections, so
+    reconnecting clients skip full handshakes.
+
+    The ssl module has session objects only since Python 3.6. On Python 2
+    the cache stays empty and client connections never resume sessions,
+    every one of them makes a full handshake. Servers resume sessions of
+    other clients regardless.
+    '''
+    supported = hasattr(ssl, 'SSLSession')
+
+    def __init__(self, size=256):
+        self.size = size
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, key):
+        session = self._sessions.pop(key, None)
+        if session is not None:
+            self._sessions[key] = session
+        return session
+
+    def put(self, key, session):
+        if session is None or not self.supported:
+            return
+        self._sessions.pop(key, None)
+        self._sessions[key] = session
+        while len(self._sessions) > self.size:
+            self._sessions.popitem(last=False)
+
+    def clear(self):
+        self._sessions.clear()
+
+
+class HttpConnectionPool:
+    '''
+    A class of pools of idle persistent HTTP connections.
+
+    Connections are kept per class and host, up to the given number of
+    them, and closed when they have been idle longer than the given time in
+    seconds or when their servers closed them.
+    '''
+    def __init__(self, size=8, idle_timeout=15):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.reused = 0
+        self._idle = {}
+
+    def __len__(self):
+        return sum(len(connections) for connections in self._idle.values())
+
+    def get(self, connection_class, host):
+        '''
+        Returns an idle connection of the given class and host or None.
+        '''
+        connections = self._idle.get((connection_class, host))
+        now = time.time()
+        while connections:
+            released, connection = connections.pop()
+            if now - released < self.idle_timeout and _is_idle(connection):
+                self.reused += 1
+                return connection
+            connection.close()
+        return None
+
+    def put(self, connection):
+        '''
+        Adds the given connection to idle ones.
+        '''
+        key = (connection.__class__, connection._pool_host)
+        connections = self._idle.setdefault(key, [])
+        if len(connections) >= self.size:
+            connection.close()
+            return
+        connections.append((time.time(), connection))
+
+    def clear(self):
+        '''
+        Closes all idle connections.
+        '''
+        for connections in self._idle.values():
+            for released, connection in connections:
+                connection.close()
+        self._idle = {}
+
+def _is_idle(connection):
+    # Idle connections are not readable, unless they were closed or got
+    # unexpected data.
+    try:
+        return not select.select([connection.sock], [], [], 0)[0]
+    except (select.error, socket.error, TypeError, ValueError):
+        return False
 
 
 class HttpHandlerBase:
     '''
     A base class for asynchronous HTTP request handlers.
+
+    Connections are kept alive and reused if the handler has a pool of
+    connections, and connect to addresses cached by its DNS cache if it has
+    one. Pooled connections to addresses which are not resolved any more are
+    closed.
     '''
-    def do_open(self, connection_class, request):
+    pool = None
+    dns_cache = None
+
+    def do_open(self, connection_class, request, **connection_args):
         '''
         Based on urllib2.AbstractHTTPHandler.do_open().
         '''
@@ -160,8 +335,26 @@ class HttpHandlerBase:
         if not host:
             raise urllib_error.URLError('no host given')
 
-        connection = connection_class(host, timeout=request.timeout)
-        connection.set_debuglevel(self._debuglevel)
+        pool = self.pool
+        if request._tunnel_host:
+            pool = None
+        connection = None
+        if pool is not None:
+            connection = pool.get(connection_class, host)
+            while connection is not None and not self._resolved(connection):
+                logger.debug('Close connection of moved host: %s', host)
+                connection.close()
+                connection = pool.get(connection_class, host)
+        reused = connection is not None
+        if connection is None:
+            connection = connection_class(host, timeout=request.timeout,
+                                          **connection_args)
+            connection.set_debuglevel(self._debuglevel)
+            connection._pool_host = host
+            connection._dns_cache = self.dns_cache
+        else:
+            # Sockets are non-blocking while responses are read.
+            connection.sock.settimeout(request.timeout)
 
         headers = dict(request.headers)
         headers.update(request.unredirected_hdrs)
@@ -170,8 +363,8 @@ class HttpHandlerBase:
         # It will try to read all remaining data from the socket,
         # which will block while the server waits for the next request.
         # So make sure the connection gets closed after the (only)
-        # request.
-        headers['Connection'] = 'close'
+        # request, unless the connection is pooled.
+        headers['Connection'] = 'close' if pool is None else 'keep-alive'
         headers = dict((name.title(), val) for name, val in headers.items())
 
         if request._tunnel_host:
@@ -192,14 +385,47 @@ class HttpHandlerBase:
             connection.request(request.get_method(), selector,
                                request.data, headers)
         except socket.error as err: # XXX what error?
+            connection.close()
+            if reused:
+                # The server closed the idle connection, try another one.
+                return self.do_open(connection_class, request,
+                                    **connection_args)
             raise urllib_error.URLError(err)
-        return connection.getresponse()
+        response = connection.getresponse()
+        if pool is not None:
+            response.pool = pool
+            response.connection = connection
+        return response
+
+    def _resolved(self, connection):
+        # Checks if the connection is connected to a cached address of its
+        # host.
+        cache = self.dns_cache
+        if cache is None or is_ip_address(connection.host):
+            return True
+        try:
+            addresses = cache.cached(connection.host, connection.port)
+        except socket.error:
+            # The host cannot be resolved now, the connection still works.
+            return True
+        if addresses is None:
+            return True
+        try:
+            peer = connection.sock.getpeername()
+        except socket.error:
+            return False
+        return any(sockaddr[:2] == peer[:2]
+                   for family, socktype, proto, canonname, sockaddr
+                   in addresses)
 
 class HttpHandler(HttpHandlerBase, urllib_request.HTTPHandler):
     '''
     A class of asynchronous HTTP request handlers.
     '''
-    __init__ = urllib_request.HTTPHandler.__init__
+    def __init__(self, debuglevel=0, pool=None, dns_cache=None):
+        urllib_request.HTTPHandler.__init__(self, debuglevel)
+        self.pool = pool
+        self.dns_cache = dns_cache
 
     def http_open(self, request):
         return self.do_open(HttpConnection, request)
@@ -208,17 +434,32 @@ class HttpsHandler(HttpHandlerBase, urllib_request.HTTPSHandler):
     '''
     A class of asynchronous HTTPS request handlers.
     '''
-    __init__ = urllib_request.HTTPSHandler.__init__
+    def __init__(self, debuglevel=0, context=None, sessions=None, pool=None,
+                       dns_cache=None):
+        urllib_request.HTTPSHandler.__init__(self, debuglevel)
+        self._context = context
+        self._sessions = sessions
+        self.pool = pool
+        self.dns_cache = dns_cache
 
     def https_open(self, request):
-        return self.do_open(HttpsConnection, request)
+        return self.do_open(HttpsConnection, request,
+                            context=self._context, sessions=self._sessions)
 
 
-class HttpRequestContext:
+class HttpOpener(urllib_request.OpenerDirector):
     '''
-    A class of HTTP request contexts.
+    A class of HTTP connection openers.
+
+    An opener and its chain of handlers are built once and shared by all
+    request contexts of a client. Response processors are not run by the
+    opener, but by request contexts when responses are received.
     '''
-    _handler_classes = [
+    #: A DNS cache which hosts of requests are resolved by before they are
+    #: opened, or None
+    dns_cache = None
+
+    handler_classes = [
         urllib_request.ProxyHandler,
         urllib_request.HTTPDefaultErrorHandler,
         urllib_request.HTTPRedirectHandler,
@@ -226,38 +467,109 @@ class HttpRequestContext:
         HttpsHandler
     ]
 
-    def __init__(self, url, data, handler=None):
+    def __init__(self, handler=None):
+        urllib_request.OpenerDirector.__init__(self)
+        for handler_class in self.handler_classes:
+            self.add_handler(self.create_handler(handler_class))
+        if handler:
+            self.add_handler(handler)
+        self.processors = self.process_response
+        self.process_response = {}
+
+    def create_handler(self, handler_class):
+        '''
+        Creates a handler of the given class for the connection opener.
+        '''
+        return handler_class()
+
+
+# The opener of request contexts which are not given one
+_default_opener = None
+
+def _get_default_opener():
+    global _default_opener
+    if _default_opener is None:
+        _default_opener = HttpOpener()
+    return _default_opener
+
+
+class HttpRequestContext:
+    '''
+    A class of HTTP request contexts, which keep the state of a request
+    opened by a shared opener.
+
+    Contexts which are not given an opener share a default one. A handler
+    given instead of an opener, as the former signature took, is added to
+    an opener of its own.
+    '''
+    #: Are timeouts of responses handled by their dispatchers
+    response_timeouts = True
+
+    def __init__(self, url, data, opener=None):
         self._request = urllib_request.Request(url, data, HTTP_HEADERS)
         self._response = None
         self._on_result = None
         self._on_error = None
-        # Connection opener
-        self._opener = urllib_request.OpenerDirector()
-        self._processors = {}
-        self._setup_opener(handler)
-
-    def _setup_opener(self, handler=None):
+        self._on_open = None
+        if opener is None:
+            opener = _get_default_opener()
+        elif isinstance(opener, urllib_request.BaseHandler):
+            opener = HttpOpener(opener)
+        self._opener = opener
+        self._timeout = None
+        # A future of the host address being resolved or None
+        self._resolving = None
+
+    def _run(self, on_result=None, on_error=None, timeout=None,
+                   on_open=None):
         '''
-        Sets up a corresponding HTTP connection opener.
+        Opens the request, when its host is resolved if the opener has a
+        DNS cache. The given open callback is called when it is sent.
         '''
-        for handler_class in self._handler_classes:
-            self._opener.add_handler(handler_class())
-        if handler:
-            self._opener.add_handler(handler)
-        self._processors = self._opener.process_response
-        self._opener.process_response = {}
-
-    def _run(self, on_result=None, on_error=None, timeout=None):
         if on_result:
             self._on_result = on_result
         if on_error:
             self._on_error = on_error
+        self._on_open = on_open
+        self._timeout = timeout
+        cache = self._opener.dns_cache
+        if cache is not None:
+            future = cache.resolve_url(self._request.get_full_url())
+            if not future.done():
+                self._resolving = future
+                future.add_done_callback(self._resolved)
+                return
+        self._open()
+
+    def _resolved(self, future):
+        self._resolving = None
+        self._open()
+
+    def _open(self):
+        timeout = self._timeout
         try:
             self._response = self._opener.open(self._request, timeout=timeout)
         except urllib_error.URLError as err:
             self.on_error(err)
         else:
-            self._response.connect(self, timeout=timeout)
+            self._response.connect(self, timeout=self._response_timeout())
+        if self._on_open:
+            self._on_open()
+
+    def _response_timeout(self):
+        # Returns the timeout of the response dispatcher.
+        return self._timeout if self.response_timeouts else None
+
+    def abort(self):
+        '''
+        Closes the response of the request, or stops waiting for its host to
+        be resolved.
+        '''
+        if self._resolving is not None:
+            self._resolving.remove_done_callback(self._resolved)
+            self._resolving = None
+        if self._response is not None:
+            self._response.close()
 
     def closed(self):
         return self._response.isclosed() if self._response else True
@@ -275,9 +587,9 @@ class HttpRequestContext:
         protocol = self._request.get_type()
         method_name = protocol + '_response'
         try:
-            for processor in self._processors.get(protocol, []):
+            for processor in self._opener.processors.get(protocol, []):
                 method = getattr(processor, method_name)
-                result = method(self.request, result)
+                result = method(self, result)
                 if result:
                     break
         except Exception as err:
@@ -19,25 +19,116 @@
 
 '''
 Defintion of a logger for Json-RPC classes and functions.
+
+Messages are formatted lazily, so arguments are passed separately from the
+format string, e.g. logger.debug('Loads message: %s', data). Levels are
+resolved when the logger is set up: functions of disabled levels are bound
+to a fake logging function which neither formats nor stringifies anything.
 '''
 
 import logging
+import itertools
+
+from six.moves import reprlib
 
 LOG_FORMAT = '%(asctime)s [%(name)s] %(filename)s:%(lineno)d - %(message)s'
 
 LOG_FUNCS = ['debug', 'info', 'warning', 'error', 'exception', 'critical']
 
+LOG_LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+    'exception': logging.ERROR,
+    'critical': logging.CRITICAL,
+}
+
 _logger = None
 
+# A filter of debug messages
+_filter = None
+
+__metaclass__ = type
+
 def _log(*args, **kwargs):
     '''
     The fake logging function.
     '''
     pass
 
-def setup(level=None):
+
+class Truncated:
+    '''
+    A lazy representation of a logged argument which is truncated to the
+    given number of characters when the message is formatted.
+    '''
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        value = self.value
+        if isinstance(value, (bytes, type(u''))):
+            text = value[:self.limit + 1]
+        else:
+            # Avoid stringifying large containers as a whole
+            r = reprlib.Repr()
+            r.maxlevel = 3
+            r.maxdict = r.maxlist = r.maxtuple = r.maxset = 32
+            r.maxstring = r.maxother = r.maxlong = self.limit
+            text = r.repr(value)
+        if len(text) > self.limit:
+            return '%s...' % text[:self.limit]
+        return '%s' % text
+
+    __repr__ = __str__
+
+
+class DebugFilter(logging.Filter):
+    '''
+    A filter of debug messages which truncates their arguments to max_payload
+    characters and passes only every sample-th message.
+    '''
+    def __init__(self, max_payload=None, sample=None):
+        logging.Filter.__init__(self)
+        self.max_payload = max_payload
+        self.sample = sample
+        self._counter = itertools.count(1)
+
+    def filter(self, record):
+        if record.levelno != logging.DEBUG:
+            return True
+        if self.sample and next(self._counter) % self.sample:
+            return False
+        if self.max_payload and record.args:
+            args = record.args
+            if isinstance(args, dict):
+                if '%(' in record.msg:
+                    return True
+                # A single dictionary argument, like a dumped message
+                args = (args,)
+            record.args = tuple(Truncated(arg, self.max_payload)
+                                for arg in args)
+        return True
+
+
+def _bind():
+    for name in LOG_FUNCS:
+        if _logger is not None and _logger.isEnabledFor(LOG_LEVELS[name]):
+            globals()[name] = getattr(_logger, name)
+        else:
+            globals()[name] = _log
+
+def setup(level=None, max_payload=None, sample=None):
     '''
     Sets up a logger instance with the given logging level.
+
+    Arguments of debug messages are truncated to max_payload characters if it
+    is given, and only every sample-th debug message is logged if sample is
+    given.
     '''
     global _logger
 
@@ -52,13 +143,34 @@ def setup(level=None):
     handler.setFormatter(formatter)
     _logger = logging.getLogger('Json-RPC2')
     _logger.addHandler(handler)
-    _logger.setLevel(level)
+    configure(level, max_payload, sample)
 
-    for name in LOG_FUNCS:
-        globals()[name] = getattr(_logger, name)
+def configure(level=None, max_payload=None, sample=None):
+    '''
+    Changes the logging level and options of debug messages of the set up
+    logger and resolves its logging functions again.
+    '''
+    global _filter
 
+    if _logger is None:
+        return setup(level, max_payload, sample)
 
-if _logger is None:
-    for name in LOG_FUNCS:
-        globals()[name] = _log
+    if level is not None:
+        _logger.setLevel(level)
+    if _filter is not None:
+        _logger.removeFilter(_filter)
+        _filter = None
+    if max_payload or sample:
+        _filter = DebugFilter(max_payload, sample)
+        _logger.addFilter(_filter)
+    _bind()
 
+def enabled(level):
+    '''
+    Returns True if messages of the given logging level are logged.
+    '''
+    return _logger is not None and _logger.isEnabledFor(level)
+
+
+if _logger is None:
+    _bind()
@@ -0,0 +1,396 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''
+Definitions of multiplexed Json-RPC streams.
+
+A stream is an HTTP connection upgraded to the "jsonrpc-stream" protocol,
+which carries requests and responses as JSON messages ended by newlines.
+Unlike pipelined HTTP requests, which are answered in order, responses of
+a stream are sent as soon as they are ready and matched to their requests
+by IDs.
+'''
+
+import sys
+import errno
+import select
+import socket
+import asyncore
+from collections import deque
+from six.moves.urllib.parse import urlsplit
+
+from . import logger
+from .base import loads, loads_raw_result, call_later, JsonRpcResponse
+from .resolver import is_ip_address, url_address
+from .errors import TIMEOUT_CODE, JsonRpcError, JsonRpcProtocolError
+
+# The protocol of the Upgrade HTTP header of multiplexed streams
+MULTIPLEX_PROTOCOL = 'jsonrpc-stream'
+
+# The request upgrading a connection to a multiplexed stream
+UPGRADE_REQUEST = ('POST %s HTTP/1.1\r\n'
+                   'Host: %s\r\n'
+                   'User-Agent: Python-JsonRPC2\r\n'
+                   'Content-Type: application/json-rpc\r\n'
+                   'Content-Length: 0\r\n'
+                   'Connection: Upgrade\r\n'
+                   'Upgrade: ' + MULTIPLEX_PROTOCOL + '\r\n'
+                   '\r\n')
+
+# The response of an upgraded connection
+UPGRADE_RESPONSE = ('HTTP/1.1 101 Switching Protocols\r\n'
+                    'Connection: Upgrade\r\n'
+                    'Upgrade: ' + MULTIPLEX_PROTOCOL + '\r\n'
+                    '\r\n')
+
+__metaclass__ = type
+
+
+def _connection_error(error):
+    # Returns a protocol error of the given socket error.
+    code = getattr(error, 'errno', None) or 400
+    return JsonRpcProtocolError(code, getattr(error, 'strerror', None) or
+                                      '%s' % error)
+
+
+class JsonRpcStream(asyncore.dispatcher):
+    '''
+    A class of client side multiplexed Json-RPC streams.
+
+    A stream connects without blocking the event loop, its host is resolved
+    by the DNS cache of its client if it has one. Requests are queued until
+    the stream is upgraded, then up to max_in_flight requests are sent
+    without waiting for responses and further ones stay queued until
+    responses of sent ones are received or their requests expire. Pending
+    requests fail when the stream is closed.
+
+    The stream leaves the event loop while it has no pending requests, like
+    pooled connections do, and it is replaced when its server closes it in
+    the meantime.
+    '''
+    def __init__(self, client, url, max_in_flight=64):
+        asyncore.dispatcher.__init__(self)
+        parts = urlsplit(url)
+        if parts.scheme != 'http':
+            raise ValueError('Multiplexed streams require http URLs: %r' % url)
+        self.client = client
+        self.url = url
+        self.host, self.port = url_address(url)
+        self.max_in_flight = max_in_flight
+        # Contexts of sent requests by request IDs
+        self.in_flight = {}
+        # Contexts of requests waiting to be sent
+        self.queue = deque()
+        self.read_buffer = ''
+        self.write_buffer = UPGRADE_REQUEST % (parts.path or '/',
+                                               parts.netloc)
+        # Notifications held until the connection is upgraded
+        self._held = ''
+        self.upgraded = False
+        self.closed = False
+        self.sent = 0
+        self.received = 0
+        self.peak = 0
+        # Resolved addresses which are left to connect to, None until the
+        # host is resolved
+        self._addresses = None
+        self._opened = False
+        self._resolving = None
+        self._connect_timer = None
+        self._attached = False
+
+    def __repr__(self):
+        return '<%s(%r, %d in flight) at %#x>' % (self.__class__.__name__,
+                                                 self.url,
+                                                 len(self.in_flight), id(self))
+
+    def _open(self):
+        # Resolves the host of the stream and connects to it.
+        if self._opened:
+            return
+        self._opened = True
+        cache = self.client.dns_cache
+        if cache is not None and not is_ip_address(self.host):
+            future = cache.resolve(self.host, self.port)
+            if not future.done():
+                self._resolving = future
+                future.add_done_callback(self._resolved)
+                return
+        self._resolved(None)
+
+    def _resolved(self, future):
+        self._resolving = None
+        if self.closed:
+            return
+        cache = self.client.dns_cache
+        try:
+            if cache is not None and not is_ip_address(self.host):
+                addresses = cache.addresses(self.host, self.port)
+            else:
+                addresses = socket.getaddrinfo(self.host, self.port, 0,
+                                               socket.SOCK_STREAM)
+        except socket.error as err:
+            self.close(_connection_error(err))
+            return
+        self._addresses = list(addresses)
+        if self.client.timeout:
+            self._connect_timer = call_later(self.client.timeout,
+                                             self._connect_expired)
+        self._connect_next(socket.error('getaddrinfo returns an empty list'))
+
+    def _connect_next(self, error):
+        # Connects to the next resolved address, or fails with the given
+        # error of the previous one if there are no more addresses.
+        while self._addresses:
+            family, socktype, proto, _, sockaddr = self._addresses.pop(0)
+            if self.socket is not None:
+                self.detach()
+                self.socket.close()
+            try:
+                self.create_socket(family, socktype)
+                self._attached = True
+                self.connect(sockaddr)
+                return
+            except socket.error as err:
+                error = err
+        self.close(_connection_error(error))
+
+    def _connect_expired(self):
+        self._connect_timer = None
+        if not self.connected:
+            self.close(JsonRpcProtocolError(TIMEOUT_CODE,
+                                            'Connection timed out'))
+
+    def handle_connect(self):
+        logger.debug('Stream connected: %r', self)
+        self._addresses = []
+        if self._connect_timer is not None:
+            self._connect_timer.cancel()
+            self._connect_timer = None
+
+    def attach(self):
+        if not self._attached and self._fileno is not None:
+            asyncore.socket_map[self._fileno] = self
+            self._attached = True
+
+    def detach(self):
+        # Unlike del_channel(), the file number is kept to attach it again.
+        asyncore.socket_map.pop(self._fileno, None)
+        self._attached = False
+
+    def usable(self):
+        '''
+        Checks if the stream can take requests. A detached stream is not
+        readable, unless its server closed it or sent unexpected data.
+        '''
+        if self.closed:
+            return False
+        if self._attached or self.socket is None:
+            return True
+        try:
+            return not select.select([self.socket], [], [], 0)[0]
+        except (select.error, socket.error, ValueError):
+            return False
+
+    def idle(self):
+        return (self.upgraded and not self.in_flight and not self.queue and
+                not self.write_buffer)
+
+    def submit(self, context):
+        '''
+        Queues the request of the given context, which is sent when the
+        stream is upgraded and there are less than max_in_flight requests in
+        flight.
+        '''
+        context.add_done_callback(self._finish)
+        self.queue.append(context)
+        self.attach()
+        self._send_queued()
+        self._open()
+
+    def notify(self, context):
+        '''
+        Sends the notification of the given context.
+        '''
+        self.attach()
+        self._write(context.data)
+        self._open()
+
+    def _send_queued(self):
+        while (self.upgraded and self.queue and
+               len(self.in_flight) < self.max_in_flight):
+            context = self.queue.popleft()
+            if not context.done():
+                self._send(context)
+
+    def _send(self, context):
+        self.in_flight[context.request.id] = context
+        self.peak = max(self.peak, len(self.in_flight))
+        self._write(context.data)
+
+    def _write(self, data):
+        self.sent += 1
+        if self.upgraded:
+            self.write_buffer += data + '\n'
+        else:
+            self._held += data + '\n'
+
+    def _finish(self, context):
+        request_id = context.request.id
+        if self.in_flight.get(request_id) is context:
+            del self.in_flight[request_id]
+        elif context in self.queue:
+            self.queue.remove(context)
+        self._send_queued()
+        if self.idle():
+            self.detach()
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        # A connecting socket is writable when it is connected or failed.
+        return not self.connected or bool(self.write_buffer)
+
+    def handle_write(self):
+        num_sent = self.send(self.write_buffer)
+        self.write_buffer = self.write_buffer[num_sent:]
+        if self.idle():
+            self.detach()
+
+    def handle_read(self):
+        data = self.recv(65536)
+        if not data:
+            return
+        self.read_buffer += data
+        if not self.upgraded and not self._upgrade():
+            return
+        lines = self.read_buffer.split('\n')
+        self.read_buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                self._receive(line)
+
+    def _upgrade(self):
+        head, separator, rest = self.read_buffer.partition('\r\n\r\n')
+        if not separator:
+            return False
+        status = head.split('\r\n', 1)[0].split(None, 2)
+        if len(status) < 2 or status[1] != '101':
+            code = int(status[1]) if len(status) > 1 and \
+                                     status[1].isdigit() else 400
+            reason = status[2] if len(status) > 2 else 'Bad response'
+            logger.warning('Stream not upgraded: url=%r, status=%s %s',
+                           self.url, code, reason)
+            self.close(JsonRpcProtocolError(code, reason))
+            return False
+        logger.debug('Stream upgraded: %r', self)
+        self.upgraded = True
+        self.read_buffer = rest
+        self.write_buffer += self._held
+        self._held = ''
+        self._send_queued()
+        return True
+
+    def _receive(self, data):
+        client = self.client
+        error = None
+        try:
+            if client.raw_results:
+                message = loads_raw_result(data, encoding=client.encoding)
+            else:
+                message = loads(data, [JsonRpcResponse],
+                                encoding=client.encoding)
+        except JsonRpcError as err:
+            message = error = err
+        self.received += 1
+        if message.id is None:
+            # The failed request cannot be told, like one of a malformed
+            # message, so the stream is not trusted any more.
+            if error is None:
+                error = JsonRpcProtocolError(errno.EPROTO,
+                                             'Response without ID')
+            logger.warning('Stream error without ID: url=%r, error=%s',
+                           self.url, error)
+            self.close(error)
+            return
+        context = self.in_flight.pop(message.id, None)
+        if context is None:
+            logger.debug('Drop response of abandoned request: id=%r',
+                         message.id)
+            return
+        try:
+            if error is None:
+                context.on_message(message)
+                return
+        except Exception as err:
+            error = err
+        context.on_error(error)
+
+    def handle_close(self):
+        self.close()
+
+    def handle_error(self):
+        error = sys.exc_info()[1]
+        if isinstance(error, socket.error):
+            if not self.connected and self._addresses:
+                logger.debug('Stream connect error: url=%r, error=%s',
+                             self.url, error)
+                self._connect_next(error)
+                return
+            logger.warning('Stream error: url=%r, error=%s', self.url, error)
+            self.close(_connection_error(error))
+            return
+        logger.exception('Handle stream error')
+        error = asyncore.compact_traceback()[2]
+        self.close(JsonRpcProtocolError(errno.ECONNRESET, error))
+
+    def close(self, error=None):
+        '''
+        Closes the stream and fails its pending requests with the given
+        error.
+        '''
+        self.closed = True
+        if self.client.streams.get(self.url) is self:
+            del self.client.streams[self.url]
+        if self._resolving is not None:
+            self._resolving.remove_done_callback(self._resolved)
+            self._resolving = None
+        if self._connect_timer is not None:
+            self._connect_timer.cancel()
+            self._connect_timer = None
+        if self.socket is not None:
+            self.detach()
+            asyncore.dispatcher.close(self)
+        if error is None:
+            error = JsonRpcProtocolError(errno.ECONNRESET, 'Stream closed')
+        contexts = list(self.in_flight.values()) + list(self.queue)
+        self.in_flight = {}
+        self.queue.clear()
+        for context in contexts:
+            context.on_error(JsonRpcProtocolError(error.code, error.message))
+
+    def stats(self):
+        return {
+            'in_flight': len(self.in_flight),
+            'queued': len(self.queue),
+            'peak': self.peak,
+            'sent': self.sent,
+            'received': self.received,
+        }
@@ -0,0 +1,192 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''
+Definitions of sampling profilers of Json-RPC servers.
+'''
+
+import os
+import signal
+import pstats
+import cProfile
+
+from . import logger
+
+# The name of samples which do not belong to any request
+NO_METHOD = '<none>'
+
+__metaclass__ = type
+
+class JsonRpcProfiler:
+    '''
+    A class of Json-RPC server profilers.
+
+    The profiler runs in two modes which can be used together:
+     * cProfile - every N-th request is profiled with cProfile, from parsing
+       its HTTP headers to serializing its response. Results are aggregated
+       per method into pstats.Stats objects.
+     * stack sampling - stacks of the main thread are sampled on a SIGPROF
+       interval timer and counted per method of the handled request. Results
+       can be dumped in the folded format of flamegraph tools.
+
+    A profiler is enabled by setting it as the profiler attribute of a
+    server and disabled by setting None. When it is disabled, request
+    handlers only test the attribute once per request.
+    '''
+    def __init__(self, every=100):
+        self.every = every
+        self.requests = 0
+        self.profiled = 0
+        self._stats = {}
+        self._stacks = {}
+        self._active = False
+        self._interval = None
+        self._signal_handler = None
+
+    # cProfile mode
+
+    def sample(self):
+        '''
+        Counts a new request and returns a profile if it should be profiled,
+        otherwise None.
+        '''
+        self.requests += 1
+        if not self.every or self.requests % self.every:
+            return None
+        return cProfile.Profile()
+
+    def run(self, profile, func, *args, **kwargs):
+        '''
+        Calls the given function with the given profile enabled.
+        '''
+        if self._active:
+            # Profiles of nested requests are not supported by cProfile.
+            return func(*args, **kwargs)
+        self._active = True
+        profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            self._active = False
+
+    def collect(self, profile, method=None):
+        '''
+        Adds the given finished profile to statistics of the given method.
+        '''
+        method = method or NO_METHOD
+        self.profiled += 1
+        stats = self._stats.get(method)
+        if stats is None:
+            self._stats[method] = pstats.Stats(profile)
+        else:
+            stats.add(profile)
+
+    def methods(self):
+        '''
+        Returns names of methods which have collected statistics.
+        '''
+        return sorted(set(self._stats) | set(self._stacks))
+
+    def stats(self, method):
+        '''
+        Returns pstats.Stats of the given method or None.
+        '''
+        return self._stats.get(method)
+
+    def dump_stats(self, directory):
+        '''
+        Dumps statistics of every method to a "<method>.prof" file in the
+        given directory, to be loaded by pstats. Returns the file paths.
+        '''
+        paths = []
+        for method, stats in sorted(self._stats.items()):
+            name = ''.join(c if c.isalnum() or c in '._-' else '_'
+                           for c in method)
+            path = os.path.join(directory, '%s.prof' % name)
+            stats.dump_stats(path)
+            paths.append(path)
+        return paths
+
+    # Stack sampling mode
+
+    def start(self, interval=0.01):
+        '''
+        Starts sampling stacks every given interval of CPU time in seconds.
+        '''
+        if self._interval is not None:
+            return
+        self._interval = interval
+        self._signal_handler = signal.signal(signal.SIGPROF,
+                                             self._sample_stack)
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+
+    def stop(self):
+        '''
+        Stops sampling stacks.
+        '''
+        if self._interval is None:
+            return
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._signal_handler or signal.SIG_DFL)
+        self._interval = None
+        self._signal_handler = None
+
+    def _sample_stack(self, signum, frame):
+        method = None
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('%s (%s:%d)' % (code.co_name,
+                                         os.path.basename(code.co_filename),
+                                         code.co_firstlineno))
+            if method is None:
+                request = getattr(frame.f_locals.get('self'), 'inflight', None)
+                method = getattr(request, 'method', None)
+            frame = frame.f_back
+        stack.reverse()
+        stacks = self._stacks.setdefault(method or NO_METHOD, {})
+        key = ';'.join(stack)
+        stacks[key] = stacks.get(key, 0) + 1
+
+    def stacks(self, method):
+        '''
+        Returns counts of sampled stacks of the given method.
+        '''
+        return dict(self._stacks.get(method, {}))
+
+    def dump_stacks(self, path):
+        '''
+        Dumps sampled stacks of all methods to the given file in the folded
+        format ("method;frame;...;frame count" lines).
+        '''
+        with open(path, 'w') as fp:
+            for method, stacks in sorted(self._stacks.items()):
+                for stack, count in sorted(stacks.items()):
+                    fp.write('%s;%s %d\n' % (method, stack, count))
+
+    def reset(self):
+        '''
+        Drops all collected statistics and samples.
+        '''
+        self.requests = 0
+        self.profiled = 0
+        self._stats = {}
+        self._stacks = {}
+        logger.debug('Reset profiler: %r', self)
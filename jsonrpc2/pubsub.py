@@ -0,0 +1,228 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''
+Definitions of Json-RPC server side subscriptions and publishers.
+'''
+
+from collections import deque
+
+from . import logger
+from .base import _gen_id, JsonRpcNotification
+
+# Backpressure policies of slow subscribers
+POLICY_DROP = 'drop'
+POLICY_DROP_OLDEST = 'drop_oldest'
+POLICY_COALESCE = 'coalesce'
+POLICY_CLOSE = 'close'
+
+POLICIES = (POLICY_DROP, POLICY_DROP_OLDEST, POLICY_COALESCE, POLICY_CLOSE)
+
+__metaclass__ = type
+
+def encode_chunk(data):
+    '''
+    Encodes the given data as a chunk of HTTP chunked transfer coding.
+    '''
+    return '%x\r\n%s\r\n' % (len(data), data)
+
+# The last chunk of HTTP chunked transfer coding
+LAST_CHUNK = '0\r\n\r\n'
+
+
+class JsonRpcSubscription:
+    '''
+    A class of Json-RPC subscriptions.
+
+    A subscription keeps a queue of encoded notifications which have not been
+    written to a subscriber connection yet. When the queue is full the given
+    policy decides what happens to a new notification:
+     * drop - the new notification is dropped,
+     * drop_oldest - the oldest queued notification is dropped,
+     * coalesce - all queued notifications are replaced with the new one,
+     * close - the subscription is closed.
+    '''
+    def __init__(self, publisher, topic, policy=None, max_queued=None,
+                       max_bytes=None):
+        policy = policy or publisher.policy
+        if policy not in POLICIES:
+            raise ValueError('Unknown subscription policy: %r' % policy)
+        self.id = _gen_id()
+        self.publisher = publisher
+        self.topic = topic
+        self.policy = policy
+        self.max_queued = max_queued or publisher.max_queued
+        self.max_bytes = max_bytes or publisher.max_bytes
+        self.queue = deque()
+        self.queued_bytes = 0
+        self.dropped = 0
+        self.sent = 0
+        self.closed = False
+        self._handler = None
+
+    def __repr__(self):
+        return '<%s(%s, %r) at %#x>' % (self.__class__.__name__, self.id,
+                                        self.topic, id(self))
+
+    def attach(self, handler):
+        '''
+        Attaches a request handler which writes out queued notifications.
+        '''
+        self._handler = handler
+
+    def _full(self, size):
+        if len(self.queue) >= self.max_queued:
+            return True
+        if self.max_bytes and self.queue:
+            return self.queued_bytes + size > self.max_bytes
+        return False
+
+    def push(self, chunk):
+        '''
+        Queues the given encoded notification chunk.
+
+        The same chunk object is shared by all subscribers of a topic.
+        '''
+        if self.closed:
+            return False
+        size = len(chunk)
+        if self._full(size):
+            self.dropped += 1
+            if self.policy == POLICY_DROP:
+                return False
+            elif self.policy == POLICY_DROP_OLDEST:
+                while self.queue and self._full(size):
+                    self.queued_bytes -= len(self.queue.popleft())
+            elif self.policy == POLICY_COALESCE:
+                self.dropped += len(self.queue) - 1
+                self.queue.clear()
+                self.queued_bytes = 0
+            else:
+                logger.debug('Close slow subscription: %r', self)
+                self.close()
+                return False
+        self.queue.append(chunk)
+        self.queued_bytes += size
+        return True
+
+    def pending(self):
+        return bool(self.queue)
+
+    def pop(self, size=65536):
+        '''
+        Removes queued chunks up to the given size in bytes (at least one
+        chunk) and returns them joined.
+        '''
+        chunks = []
+        total = 0
+        while self.queue and (not chunks or total < size):
+            chunk = self.queue.popleft()
+            chunks.append(chunk)
+            total += len(chunk)
+        self.queued_bytes -= total
+        self.sent += len(chunks)
+        return ''.join(chunks)
+
+    def close(self):
+        '''
+        Closes the subscription and the stream of its handler.
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        self.publisher.unsubscribe(self)
+        self.queue.clear()
+        self.queued_bytes = 0
+        handler, self._handler = self._handler, None
+        if handler is not None:
+            handler.end_stream()
+
+
+class JsonRpcPublisher:
+    '''
+    A class of Json-RPC publishers which fan out notifications to all
+    subscribers of a topic.
+    '''
+    #: Default backpressure policy of subscriptions
+    policy = POLICY_DROP_OLDEST
+
+    #: Default maximum number of queued notifications per subscription
+    max_queued = 100
+
+    #: Default maximum size of queued notifications per subscription
+    max_bytes = None
+
+    #: A class of Json-RPC subscriptions
+    subscription_class = JsonRpcSubscription
+
+    def __init__(self, encoding=None):
+        self.encoding = encoding or 'utf-8'
+        self.topics = {}
+
+    def subscribe(self, topic, policy=None, max_queued=None, max_bytes=None):
+        '''
+        Creates a new subscription of the given topic.
+        '''
+        subscription = self.subscription_class(self, topic, policy=policy,
+                                               max_queued=max_queued,
+                                               max_bytes=max_bytes)
+        self.topics.setdefault(topic, []).append(subscription)
+        logger.debug('Subscribe: %r', subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        '''
+        Removes the given subscription from its topic.
+        '''
+        subscriptions = self.topics.get(subscription.topic, [])
+        if subscription in subscriptions:
+            subscriptions.remove(subscription)
+            logger.debug('Unsubscribe: %r', subscription)
+        if not subscriptions:
+            self.topics.pop(subscription.topic, None)
+
+    def subscribers(self, topic):
+        return len(self.topics.get(topic, []))
+
+    def publish(self, topic, params=None, method=None):
+        '''
+        Publishes a notification to all subscribers of the given topic.
+
+        The notification is serialized once and the same encoded chunk is
+        queued for every subscriber. Returns the number of subscribers which
+        accepted the notification.
+        '''
+        subscriptions = self.topics.get(topic)
+        if not subscriptions:
+            return 0
+        notification = JsonRpcNotification(method or topic, params)
+        chunk = encode_chunk(notification.dumps(encoding=self.encoding))
+        accepted = 0
+        for subscription in list(subscriptions):
+            if subscription.push(chunk):
+                accepted += 1
+        return accepted
+
+    def close(self):
+        '''
+        Closes all subscriptions.
+        '''
+        for subscriptions in list(self.topics.values()):
+            for subscription in list(subscriptions):
+                subscription.close()
@@ -0,0 +1,320 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Definitions of DNS caches of Json-RPC clients.
+'''
+
+import time
+import socket
+import asyncore
+import threading
+from collections import deque
+from six.moves import queue
+from six.moves.urllib.parse import urlsplit
+
+from . import logger
+from .future import JsonRpcFuture
+
+# Default ports of URL schemes
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+__metaclass__ = type
+
+def is_ip_address(host):
+    '''
+    Checks if the given host is an IPv4 or IPv6 address.
+    '''
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+            return True
+        except (socket.error, ValueError):
+            pass
+    return False
+
+def url_address(url):
+    '''
+    Returns the (host, port) address of the given URL.
+    '''
+    parts = urlsplit(url)
+    return parts.hostname, parts.port or DEFAULT_PORTS.get(parts.scheme, 80)
+
+def create_connection(addresses, timeout=None, source_address=None):
+    '''
+    Based on socket.create_connection(), connects to the first reachable
+    one of the given resolved addresses.
+    '''
+    error = None
+    for family, socktype, proto, canonname, sockaddr in addresses:
+        sock = None
+        try:
+            sock = socket.socket(family, socktype, proto)
+            if timeout is not None:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except socket.error as err:
+            error = err
+            if sock is not None:
+                sock.close()
+    if error is not None:
+        raise error
+    raise socket.error('getaddrinfo returns an empty list')
+
+
+class DnsEntry:
+    '''
+    A class of cached resolved addresses or resolution errors.
+    '''
+    __slots__ = ('addresses', 'error', 'expires')
+
+    def __init__(self, addresses, error, expires):
+        self.addresses = addresses
+        self.error = error
+        self.expires = expires
+
+
+class _Waker(asyncore.dispatcher):
+    # A channel of the event loop, which is woken up by resolver threads
+    # writing to the other end of a socket pair.
+    def __init__(self, cache):
+        self._reader, self._writer = socket.socketpair()
+        asyncore.dispatcher.__init__(self, self._reader)
+        self.detach()
+        self.cache = cache
+
+    def attach(self):
+        asyncore.socket_map[self._fileno] = self
+
+    def detach(self):
+        # Unlike del_channel(), the file number is kept to attach it again.
+        asyncore.socket_map.pop(self._fileno, None)
+
+    def writable(self):
+        return False
+
+    def wake(self):
+        try:
+            self._writer.send(b'\0')
+        except socket.error:
+            # The pair buffer is full, the loop is woken up anyway.
+            pass
+
+    def handle_read(self):
+        try:
+            self.recv(4096)
+        except socket.error:
+            pass
+        self.cache.process()
+
+    def handle_error(self):
+        logger.exception('DNS cache error')
+
+    def close(self):
+        asyncore.dispatcher.close(self)
+        self._writer.close()
+
+
+class DnsCache:
+    '''
+    A class of DNS caches of Json-RPC clients.
+
+    Addresses of hosts are resolved by getaddrinfo() in the given number of
+    background threads, so the event loop is not blocked. Resolved addresses
+    are cached for the given TTL in seconds and resolution errors for the
+    negative TTL. Expired addresses are still used while they are resolved
+    again, for up to the given stale time.
+    '''
+    def __init__(self, ttl=60, negative_ttl=5, stale_ttl=300, workers=2,
+                       max_entries=1024):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.workers = workers
+        self.max_entries = max_entries
+        # Entries of (host, port) addresses
+        self.entries = {}
+        # Futures of addresses being resolved
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self._queue = queue.Queue()
+        self._done = deque()
+        self._threads = []
+        self._waker = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _resolve(self, host, port):
+        return socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+
+    def _work(self):
+        while True:
+            address = self._queue.get()
+            try:
+                result, error = self._resolve(*address), None
+            except Exception as err:
+                result, error = None, err
+            self._done.append((address, result, error))
+            self._waker.wake()
+
+    def _start(self, address):
+        future = self.pending.get(address)
+        if future is not None:
+            return future
+        if self._waker is None:
+            self._waker = _Waker(self)
+        if not self.pending:
+            # The loop is kept running until all hosts are resolved.
+            self._waker.attach()
+        future = self.pending[address] = JsonRpcFuture()
+        if len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work,
+                                      name='jsonrpc2-resolver')
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        self._queue.put(address)
+        return future
+
+    def process(self):
+        '''
+        Stores addresses resolved by background threads and finishes their
+        futures. Called by the event loop.
+        '''
+        while self._done:
+            address, result, error = self._done.popleft()
+            self.store(address, result, error)
+            future = self.pending.pop(address, None)
+            if future is not None:
+                future.set_result(result)
+        if not self.pending and self._waker is not None:
+            self._waker.detach()
+
+    def store(self, address, addresses, error=None, now=None):
+        '''
+        Caches the given resolved addresses or resolution error of the given
+        (host, port) address.
+        '''
+        now = now or time.time()
+        if error is None:
+            entry = DnsEntry(addresses, None, now + self.ttl)
+        else:
+            logger.warning('Resolve host error: %s:%s: %s',
+                           address[0], address[1], error)
+            self.failures += 1
+            previous = self.entries.get(address)
+            if (previous is not None and previous.error is None and
+                now < previous.expires + self.stale_ttl):
+                # Stale addresses are better than none.
+                return
+            entry = DnsEntry(None, error, now + self.negative_ttl)
+        if address not in self.entries and len(self.entries) >= \
+           self.max_entries:
+            oldest = min(self.entries, key=lambda a: self.entries[a].expires)
+            del self.entries[oldest]
+        self.entries[address] = entry
+
+    def cached(self, host, port):
+        '''
+        Returns cached addresses of the given host and port, resolving them
+        again in the background if they expired. Returns None if there are
+        none and raises the cached error if the host could not be resolved.
+        '''
+        entry = self.entries.get((host, port))
+        now = time.time()
+        if entry is None or now >= entry.expires + (
+                0 if entry.error is not None else self.stale_ttl):
+            self.misses += 1
+            return None
+        self.hits += 1
+        if now >= entry.expires:
+            self._start((host, port))
+        if entry.error is not None:
+            raise entry.error
+        return entry.addresses
+
+    def resolve(self, host, port):
+        '''
+        Returns a future which is done when addresses of the given host and
+        port are cached or could not be resolved.
+        '''
+        if is_ip_address(host):
+            future = JsonRpcFuture()
+            future.set_result(None)
+            return future
+        try:
+            addresses = self.cached(host, port)
+        except socket.error:
+            addresses = ()
+        if addresses is None:
+            return self._start((host, port))
+        future = JsonRpcFuture()
+        future.set_result(addresses)
+        return future
+
+    def resolve_url(self, url):
+        return self.resolve(*url_address(url))
+
+    def resolve_now(self, host, port):
+        '''
+        Resolves the given host and port in the calling thread and caches
+        the result, used when it is not cached before connecting.
+        '''
+        try:
+            addresses = self._resolve(host, port)
+        except socket.error as err:
+            self.store((host, port), None, err)
+            raise
+        self.store((host, port), addresses)
+        return addresses
+
+    def addresses(self, host, port):
+        '''
+        Returns cached or resolved addresses of the given host and port.
+        '''
+        addresses = self.cached(host, port)
+        if addresses is None:
+            addresses = self.resolve_now(host, port)
+        return addresses
+
+    def prefetch(self, urls):
+        '''
+        Starts resolving hosts of the given URLs which are not cached.
+        '''
+        for url in urls:
+            self.resolve_url(url)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'pending': len(self.pending),
+            'hits': self.hits,
+            'misses': self.misses,
+            'failures': self.failures
+        }
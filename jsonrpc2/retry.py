@@ -0,0 +1,165 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Definitions of retry budgets, hedging policies and call statistics of
+Json-RPC clients.
+'''
+
+import time
+import errno
+from collections import deque
+
+from .errors import JsonRpcProtocolError, JsonRpcCircuitOpenError
+from .balancer import is_endpoint_failure
+
+# Errors of connections which requests could not be sent by
+_UNREACHED_ERRNOS = frozenset((errno.ECONNREFUSED, errno.EHOSTUNREACH,
+                               errno.ENETUNREACH))
+
+__metaclass__ = type
+
+def is_retryable(error, idempotent=False):
+    '''
+    Checks if a request which failed with the given error can be retried.
+    Requests of idempotent methods are retried after any failure of their
+    endpoints, others only if they could not be sent.
+    '''
+    if isinstance(error, JsonRpcCircuitOpenError):
+        return True
+    if not isinstance(error, JsonRpcProtocolError):
+        return False
+    if error.code in _UNREACHED_ERRNOS:
+        return True
+    return idempotent and is_endpoint_failure(error)
+
+
+class RetryBudget:
+    '''
+    A class of token bucket budgets of retries and hedged requests.
+
+    Every request deposits the given ratio of a token and the bucket gets
+    the given minimum number of tokens per second, up to its capacity. Every
+    retry or hedged request withdraws a token, so they are limited to the
+    ratio of requests when all of them fail.
+    '''
+    #: The maximum number of retries of a request
+    max_retries = 2
+
+    def __init__(self, ratio=0.1, min_per_second=1, capacity=10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.withdrawn = 0
+        self.rejected = 0
+        self._refilled = time.time()
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + self.min_per_second *
+                          max(0, now - self._refilled))
+        self._refilled = now
+
+    def deposit(self):
+        '''
+        Deposits tokens of a sent request.
+        '''
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self):
+        '''
+        Withdraws a token of a retry. Returns False if there is none left.
+        '''
+        self._refill()
+        if self.tokens < 1:
+            self.rejected += 1
+            return False
+        self.tokens -= 1
+        self.withdrawn += 1
+        return True
+
+
+class HedgePolicy:
+    '''
+    A class of policies of hedged requests.
+
+    A hedged duplicate of a request of an idempotent method is sent to
+    another endpoint when no response is received after the given delay in
+    seconds, or the given percentile of latencies of the method when it has
+    enough samples. The first response is taken and other requests are
+    cancelled.
+    '''
+    def __init__(self, delay=None, percentile=None, max_hedges=1,
+                       min_samples=20):
+        if delay is None and percentile is None:
+            raise ValueError('Hedging needs a delay or a percentile')
+        self.delay = delay
+        self.percentile = percentile
+        self.max_hedges = max_hedges
+        self.min_samples = min_samples
+
+    def hedge_delay(self, stats):
+        '''
+        Returns a delay of hedged requests of a method with the given
+        statistics, or None if they should not be sent.
+        '''
+        if (self.percentile is not None and
+            len(stats.latencies) >= self.min_samples):
+            return stats.percentile(self.percentile)
+        return self.delay
+
+
+class MethodStats:
+    '''
+    A class of statistics of calls of a method.
+    '''
+    def __init__(self, samples=100):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        # Latencies of recent successful calls
+        self.latencies = deque(maxlen=samples)
+
+    def percentile(self, percentile):
+        '''
+        Returns the given percentile of recent latencies or None.
+        '''
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        index = int(round(percentile / 100.0 * (len(latencies) - 1)))
+        return latencies[max(0, min(index, len(latencies) - 1))]
+
+    def stats(self):
+        requests = self.requests or 1
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'retry_rate': float(self.retries) / requests,
+            'hedge_rate': float(self.hedges) / requests,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99)
+        }
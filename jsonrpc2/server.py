@@ -21,27 +21,86 @@
 Definitions of Json-RPC server side classes.
 '''
 
+import re
+import ssl
 import time
 import email
+import signal
 import socket
 import asyncore
 
 from . import logger
-from .base import dumps, loads, VERSION, \
-                 JsonRpcNotification, JsonRpcRequest, JsonRpcResponse
+from .base import dumps, loads, call_later, VERSION, \
+                 JsonRpcNotification, JsonRpcRequest
+from .acl import compile_acl
+from .future import JsonRpcTask, is_coroutine
+from .templates import RESULT_TEMPLATE, HttpHeadTemplate, error_template
+from .pubsub import encode_chunk, LAST_CHUNK, JsonRpcPublisher
+from .multiplex import MULTIPLEX_PROTOCOL, UPGRADE_RESPONSE
+from .deadline import DEADLINE_HEADER, activate_deadline, decode_deadline
 from .errors import JsonRpcError, JsonRpcInternalError, \
-                   JsonRpcMethodNotFoundError, JsonRpcInvalidParamsError
+                   JsonRpcMethodNotFoundError, JsonRpcInvalidParamsError, \
+                   JsonRpcDeadlineError, JsonRpcOverloadError
+
+# OpenSSL option disabling session tickets, not exported by older Pythons
+OP_NO_TICKET = getattr(ssl, 'OP_NO_TICKET', 0x4000)
+
+# The method member of a partially received request body
+_METHOD_RE = re.compile(r'"method"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+# The size of a request body prefix searched for the method
+_METHOD_SCAN_SIZE = 4096
+
+# Templates of heads of HTTP responses
+_head_templates = {}
 
 __metaclass__ = type
 
+def create_ssl_context(certfile, keyfile=None, cafile=None,
+                       session_tickets=True):
+    '''
+    Creates an SSL context for Json-RPC servers from the given certificate
+    chain.
+
+    Sessions of the context are cached by OpenSSL, so the same context should
+    be shared by all connections of a server to let reconnecting clients
+    resume their sessions by ID or, if enabled, by session tickets.
+    '''
+    context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    context.options |= ssl.OP_NO_SSLv2 | ssl.OP_NO_SSLv3
+    context.load_cert_chain(certfile, keyfile)
+    if cafile:
+        context.load_verify_locations(cafile)
+        context.verify_mode = ssl.CERT_REQUIRED
+    if session_tickets:
+        context.options &= ~OP_NO_TICKET
+    else:
+        context.options |= OP_NO_TICKET
+    return context
+
+
 class JsonRpcIface:
     '''
     A base class for Json-RPC method interfaces.
+
+    Methods return their results, or None to send them later by _on_result()
+    or _on_error(). Methods may be coroutines as well, either native ones or
+    generators, awaiting futures like results of client requests (see
+    jsonrpc2.future). Their results and errors are sent when they finish and
+    they are cancelled when the connection is closed or the request times
+    out.
+
+    The deadline of the request sent by its client, if any, is available as
+    the deadline attribute and client requests sent by methods inherit it.
     '''
     def __init__(self, server, request, handler):
         self.server = server
         self.request = request
         self._handler = handler
+        self._task = None
+        # The subscription started by the request or None
+        self._subscription = None
+        self.deadline = handler.deadline
 
     def __call__(self):
         '''
@@ -50,8 +109,8 @@ class JsonRpcIface:
         method_name = self.request.method
         params = self.request.params
         method = getattr(self, method_name, None)
-        logger.debug('Call request: method=%s, params=%s'
-                      % (method_name, params))
+        logger.debug('Call request: method=%s, params=%s',
+                     method_name, params)
         try:
             if not callable(method) or method_name.startswith('_'):
                 data = {'method': method_name}
@@ -72,15 +131,43 @@ class JsonRpcIface:
         except Exception as err:
             self._on_error(err)
         else:
-            if result is not None:
+            if is_coroutine(result):
+                self._run_task(result)
+            elif result is not None:
                 self._on_result(result)
 
+    def _run_task(self, coroutine):
+        '''
+        Runs the given coroutine of the current request as a task.
+        '''
+        task = JsonRpcTask(coroutine)
+        if not task.done() and not isinstance(self.request,
+                                              JsonRpcNotification):
+            self._task = task
+            self._handler.start_task(task)
+        task.add_done_callback(self._on_task_done)
+        return task
+
+    def _on_task_done(self, task):
+        if task.cancelled() or (task is self._task and
+                                task is not self._handler.task):
+            # The request has been abandoned.
+            return
+        error = task.exception()
+        if error is not None:
+            self._on_error(error)
+        else:
+            self._on_result(task.result())
+
     def _on_result(self, result):
         '''
         A callback method that dispatches the given result of a requested
         method to a client.
         '''
-        logger.debug('Call request: result=%s' % result)
+        if self._subscription is not None:
+            # The subscription ID has been sent as the result already.
+            return
+        logger.debug('Call request: result=%s', result)
         self._handler.on_result(self.request, result)
         self._handled = True
 
@@ -89,10 +176,30 @@ class JsonRpcIface:
         A callback method that dispatches the given error of a requested
         method to a client.
         '''
-        logger.debug('Call request: error=%s' % error)
+        logger.debug('Call request: error=%s', error)
         self._handler.on_error(self.request, error)
         self._handled = True
 
+    def _subscribe(self, topic, policy=None, max_queued=None, max_bytes=None):
+        '''
+        Subscribes the client of the current request to the given topic.
+
+        The subscription ID is sent to the client as the result of the request
+        and the connection is kept open to stream published notifications.
+        Results the method returns afterwards, like the subscription, are
+        not sent.
+        '''
+        if isinstance(self.request, JsonRpcNotification):
+            raise JsonRpcError(message='Notifications cannot subscribe.')
+        subscription = self.server.publisher.subscribe(topic, policy=policy,
+                                                       max_queued=max_queued,
+                                                       max_bytes=max_bytes)
+        logger.debug('Call request: subscription=%r', subscription)
+        self._handler.start_stream(self.request, subscription)
+        self._subscription = subscription
+        self._handled = True
+        return subscription
+
 
 class ParsingHTTPError(Exception):
     def __init__(self, code, message):
@@ -101,9 +208,69 @@ class ParsingHTTPError(Exception):
         self.message = message
 
 
-class JsonRpcRequestHandler(asyncore.dispatcher):
+class JsonRpcExchange:
+    '''
+    A class of exchanges of requests of multiplexed streams.
+
+    An exchange stands in for the request handler of its request, so that
+    requests of a stream are handled concurrently and their responses are
+    written as soon as they are ready.
+    '''
+    # Deadlines are not sent by multiplexed streams.
+    deadline = None
+
+    def __init__(self, handler, request):
+        self.handler = handler
+        self.request = request
+        self.task = None
+
+    def start_task(self, task):
+        self.task = task
+
+    def cancel_task(self):
+        task, self.task = self.task, None
+        if task is not None:
+            task.cancel()
+
+    def finish(self):
+        '''
+        Forgets the exchange when its request is handled.
+        '''
+        self.task = None
+        self.handler.finish_exchange(self)
+
+    def on_result(self, request, result):
+        if not isinstance(request, JsonRpcNotification):
+            handler = self.handler
+            handler.send_frame(RESULT_TEMPLATE.render(handler.server.encoding,
+                                                      id=request.id,
+                                                      result=result))
+        self.finish()
+
+    def on_error(self, request, error):
+        if not isinstance(request, JsonRpcNotification):
+            handler = self.handler
+            handler.send_frame(handler.encode_error(
+                                        handler.jsonrpc_error(request, error)))
+        self.finish()
+
+    def start_stream(self, request, subscription):
+        subscription.close()
+        raise JsonRpcError(message='Subscriptions are not supported by '
+                                   'multiplexed streams.')
+
+
+class JsonRpcRequestHandler(asyncore.dispatcher, object):
     '''
     A class of Json-RPC request handlers.
+
+    The handler is a new-style class, unlike asyncore dispatchers of Python
+    2, so the size of its write buffer is accounted by a property.
+
+    A connection upgraded to a multiplexed stream (see jsonrpc2.multiplex)
+    carries requests and responses as JSON messages ended by newlines.
+    Requests of the stream are dispatched as soon as they are received and
+    handled by exchanges.
     '''
     # The server software version
     server_version = 'JsonRPC2/%s' % VERSION
@@ -111,6 +278,8 @@ class JsonRpcRequestHandler(asyncore.dispatcher):
     # The supported version of the HTTP protocol
     protocol_version = 'HTTP/1.1'
 
+    _write_buffer = ''
+
     def __init__(self, sock, server, timeout=5):
         asyncore.dispatcher.__init__(self, sock)
         self.server = server
@@ -119,86 +288,726 @@ class JsonRpcRequestHandler(asyncore.dispatcher):
         self._readable = True
         self._writable = False
         self.read_buffer = ''
+        # Is reading paused by the write buffer above its high watermark
+        self.paused = False
         self.write_buffer = ''
         self.timeout = time.time() + timeout
+        self._timeout = timeout
         self.content_len = None
+        # The method resolved from the partially received body, if any
+        self.body_method = None
+        # The start time and timeout of receiving the current request
+        self._receive_start = None
+        self._request_timeout = None
+        self.stream = None
+        # Exchanges of pending requests of a multiplexed stream, or None
+        # if the connection is not upgraded
+        self.exchanges = None
+        # Should the connection be kept open after the current request
+        self.keep_alive = False
+        # The request being handled, until its response is written
+        self.inflight = None
+        # The deadline of the current request sent by its client or None
+        self.deadline = None
+        # The task of the current request if its method is a coroutine
+        self.task = None
+        # The number of handled requests
+        self.handled = 0
+        # The profile of the current request if it is sampled
+        self.profile = None
+        self.profiler = None
+        # The span of the current request if it is traced
+        self.trace = None
+        self.tracer = None
+        # Start and end times of accepting the connection if it is traced
+        self.accept_times = None
+        self._trace_start = None
+        self._spans = {}
+        server.connections.add(self)
+        # The TLS handshake state: None if done, otherwise the awaited event
+        self._handshake = None
+        if isinstance(sock, ssl.SSLSocket):
+            self._handshake = 'read'
+
+    @property
+    def write_buffer(self):
+        return self._write_buffer
+
+    @write_buffer.setter
+    def write_buffer(self, data):
+        delta = len(data) - len(self._write_buffer)
+        self._write_buffer = data
+        if not delta:
+            return
+        server = self.server
+        if self.paused:
+            if len(data) <= server.connection_low_watermark:
+                self.paused = False
+        elif (server.connection_high_watermark and
+              len(data) >= server.connection_high_watermark):
+            self.paused = True
+        server.buffer_changed(delta)
 
     def readable(self):
+        if self._handshake is not None:
+            return self._handshake == 'read'
+        if self.paused:
+            return False
+        if (self.server.paused and self.content_len is None and
+            self.stream is None):
+            # Do not start new requests until the server resumes.
+            return False
         return self._readable
 
     def writable(self):
+        if self._handshake is not None:
+            return self._handshake == 'write' or self.timeout < time.time()
+        if self.stream is not None:
+            return bool(self.write_buffer) or self.stream.pending()
+        if self.exchanges is not None:
+            return bool(self.write_buffer)
         return self._writable or self.timeout < time.time()
 
+    def do_handshake(self):
+        '''
+        Advances a non-blocking TLS handshake of the connection.
+        '''
+        try:
+            self.socket.do_handshake()
+        except ssl.SSLWantReadError:
+            self._handshake = 'read'
+        except ssl.SSLWantWriteError:
+            self._handshake = 'write'
+        except (ssl.SSLError, socket.error) as err:
+            self.log_message('TLS handshake error: %s', err)
+            self.close()
+        else:
+            self._handshake = None
+            self.log_message('TLS handshake: %s, session reused: %s',
+                             self.socket.version(),
+                             getattr(self.socket, 'session_reused', None))
+
+    def recv(self, buffer_size):
+        try:
+            data = asyncore.dispatcher.recv(self, buffer_size)
+            # Read data already decrypted by the TLS layer, as it will not
+            # be signaled by the socket.
+            while (data and self._handshake is None and
+                   isinstance(self.socket, ssl.SSLSocket) and
+                   self.socket.pending()):
+                data += self.socket.recv(self.socket.pending())
+            return data
+        except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            return ''
+
+    def send(self, data):
+        try:
+            return asyncore.dispatcher.send(self, data)
+        except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            return 0
+
     def handle_read(self):
+        if self._handshake is not None:
+            self.do_handshake()
+            return
+        if self.stream is not None:
+            # Only a closed connection is expected from a subscriber.
+            self.recv(8192)
+            return
+        if self.exchanges is not None:
+            self.read_buffer += self.recv(65536)
+            self.process_frames()
+            return
         if self.content_len is None:
+            if not self.read_buffer:
+                self.begin_request()
             self.read_buffer += self.recv(8192)
+        else:
+            self.data += self.recv(8192)
+        self.limit_receive_time()
+        if self.profile is None:
+            self.process_request()
+        else:
+            self.profiler.run(self.profile, self.process_request)
+
+    def begin_request(self):
+        '''
+        Starts profiling and tracing of a new request if they are enabled.
+        '''
+        server = self.server
+        if server.profiler is not None:
+            self.profiler = server.profiler
+            self.profile = self.profiler.sample()
+        if server.tracer is not None:
+            self.tracer = server.tracer
+            self._trace_start = time.time()
+
+    def limit_receive_time(self):
+        '''
+        Shortens the timeout of the request being received so that it is
+        rejected if its bytes trickle slower than the minimum receive rate.
+        '''
+        if self._receive_start is None:
+            self._receive_start = time.time()
+            self._request_timeout = self.timeout
+        rate = self.server.min_receive_rate
+        if not rate:
+            return
+        received = len(self.read_buffer) + len(self.data)
+        deadline = (self._receive_start + self.server.receive_grace +
+                    float(received) / rate)
+        self.timeout = min(self._request_timeout, deadline)
+
+    def check_body_size(self):
+        '''
+        Checks the announced size of the request body against the limit of
+        its method, which is resolved from the beginning of the body as soon
+        as it is received. Returns False if the request is rejected.
+        '''
+        server = self.server
+        if self.body_method is None and server.method_body_sizes:
+            prefix = self.data[:_METHOD_SCAN_SIZE]
+            m = _METHOD_RE.search(prefix)
+            if m is not None:
+                self.body_method = m.group(1)
+            elif len(prefix) >= min(_METHOD_SCAN_SIZE, self.content_len):
+                # The method cannot be resolved lazily.
+                self.body_method = ''
+        if self.content_len <= server.body_limit(self.body_method or None):
+            return True
+        self.reject_request(413, 'Request Entity Too Large')
+        return False
+
+    def reject_request(self, code, message):
+        '''
+        Sends the given HTTP error without reading the rest of the request
+        and closes the connection.
+        '''
+        self.log_message('"%s" rejected: %s %s', self.path, code, message)
+        self._readable = False
+        self.keep_alive = False
+        self.read_buffer = ''
+        self.data = ''
+        self.send_http_error(code, message)
 
+    def process_request(self):
+        '''
+        Parses the buffered request and dispatches it once it is complete.
+        '''
+        if self.content_len is None:
+            if self.tracer is not None:
+                parse_start = time.time()
             try:
                 if not self.parse_http_request(self.read_buffer):
                     # Failed to parse headers. Wait for next portion.
+                    if len(self.read_buffer) > self.server.max_header_size:
+                        self.reject_request(431, 'Request Header Fields '
+                                                 'Too Large')
                     return
             except ParsingHTTPError as err:
                 self._readable = False
+                self.keep_alive = False
                 self.send_http_error(err.code, err.message)
                 return
             except Exception as err:
                 self.log_message('Exception: %s', err)
                 self._readable = False
+                self.keep_alive = False
                 self.send_http_error(500, 'Internal Server Error')
                 return
-        else:
-            self.data += self.recv(8192)
+            self.read_buffer = ''
+            if self.upgrading():
+                self.start_exchanges()
+                return
+            self.deadline = decode_deadline(self.headers.get(DEADLINE_HEADER))
+            if self.tracer is not None:
+                self.start_trace(parse_start)
 
+        if self.body_method is None and not self.check_body_size():
+            return
         if len(self.data) < self.content_len:
             return
         elif len(self.data) > self.content_len:
+            # Keep pipelined data of the next request.
+            self.read_buffer = self.data[self.content_len:]
             self.data = self.data[:self.content_len]
 
         self._readable = False
+        if self._receive_start is not None:
+            # The request is received, its method is not rate limited.
+            self.timeout = self._request_timeout
+            self._receive_start = None
+        if self.deadline is not None:
+            # The request is aborted when its client gives up on it.
+            self.timeout = min(self.timeout, self.deadline)
+        if self.trace is not None:
+            self._spans.pop('http.body').finish()
+            self.tracer.activate(self.trace, self.dispatch)
+        else:
+            self.dispatch()
+
+    def upgrading(self):
+        '''
+        Checks if the parsed request upgrades the connection to a multiplexed
+        stream.
+        '''
+        return (self.server.multiplexing and not self.server.draining and
+                self.protocol_version == 'HTTP/1.1' and
+                self.headers.get('upgrade', '').lower() == MULTIPLEX_PROTOCOL)
+
+    def start_exchanges(self):
+        '''
+        Upgrades the connection to a multiplexed stream.
+        '''
+        self.log_message('"%s" 101 multiplexed', self.path)
+        self.profile = self.profiler = None
+        self.tracer = None
+        self.exchanges = set()
+        self.read_buffer, self.data = self.data, ''
+        self.content_len = None
+        self.write_buffer += UPGRADE_RESPONSE
+        self.process_frames()
+
+    def process_frames(self):
+        '''
+        Dispatches requests of the multiplexed stream which are received
+        completely. While the connection or the server is paused, the rest
+        of them are kept until write buffers drain.
+        '''
+        frames = self.read_buffer.split('\n')
+        self.read_buffer = frames.pop()
+        if len(self.read_buffer) > self.server.max_body_size:
+            self.log_message('"%s" multiplexed request too large', self.path)
+            self.close()
+            return
+        for index, frame in enumerate(frames):
+            if not self.connected:
+                return
+            if self.paused or self.server.paused:
+                frames.append(self.read_buffer)
+                self.read_buffer = '\n'.join(frames[index:])
+                return
+            if frame.strip():
+                self.dispatch_frame(frame)
+
+    def dispatch_frame(self, data):
+        '''
+        Calls an interface method of the given request of the multiplexed
+        stream.
+        '''
         request = None
+        exchange = None
         try:
-            request = loads(self.data, [JsonRpcNotification, JsonRpcRequest],
+            request = loads(data, [JsonRpcNotification, JsonRpcRequest],
                             encoding=self.server.encoding)
+            if self.server.draining:
+                # Requests received while the server drains are shed, so
+                # that clients know they are not handled.
+                self.log_message('"%s" multiplexed request shed', self.path)
+                if isinstance(request, JsonRpcRequest):
+                    self.send_frame(self.encode_error(
+                                        JsonRpcOverloadError(request.id)))
+                return
+            exchange = JsonRpcExchange(self, request)
+            if not isinstance(request, JsonRpcNotification):
+                self.exchanges.add(exchange)
+            self.server.interface(self.server, request, exchange)()
+        except Exception as err:
+            if exchange is not None:
+                exchange.on_error(request, err)
+            else:
+                self.send_frame(self.encode_error(
+                                        self.jsonrpc_error(request, err)))
+
+    def send_frame(self, data):
+        '''
+        Writes the given response to the multiplexed stream.
+        '''
+        if self.connected:
+            self.write_buffer += data + '\n'
+
+    def finish_exchange(self, exchange):
+        '''
+        Forgets the given exchange of a handled request.
+        '''
+        self.exchanges.discard(exchange)
+        if (self.server.draining and not self.exchanges and
+            not self.write_buffer and self.connected):
+            self.close()
+
+    def start_trace(self, parse_start):
+        '''
+        Starts the span of the current request, continuing the trace of the
+        request headers, and spans of its parsed headers.
+        '''
+        tracer = self.tracer
+        parent = tracer.extract(self.headers.get(tracer.header))
+        start = self._trace_start
+        accept_times, self.accept_times = self.accept_times, None
+        if accept_times is not None:
+            # The first request of a connection covers accepting it.
+            start = accept_times[0]
+        self.trace = trace = tracer.start_span('jsonrpc.request', parent,
+                                               start=start, path=self.path)
+        if accept_times is not None:
+            trace.child('accept', start=accept_times[0]).finish(
+                                                    end=accept_times[1])
+        trace.child('http.headers', start=parse_start).finish()
+        self._spans['http.body'] = trace.child('http.body')
+
+    def finish_trace(self, **tags):
+        '''
+        Finishes all spans of the current request.
+        '''
+        if self.trace is None:
+            self.tracer = None
+            return
+        for span in self._spans.values():
+            span.finish()
+        self._spans = {}
+        self.trace.finish(**tags)
+        self.trace = None
+        self.tracer = None
+
+    def dispatch(self):
+        '''
+        Calls an interface method of the received Json-RPC request.
+        '''
+        request = None
+        trace = self.trace
+        try:
+            if trace is None:
+                request = loads(self.data,
+                                [JsonRpcNotification, JsonRpcRequest],
+                                encoding=self.server.encoding)
+            else:
+                span = trace.child('jsonrpc.loads')
+                request = loads(self.data,
+                                [JsonRpcNotification, JsonRpcRequest],
+                                encoding=self.server.encoding)
+                span.finish()
+                trace.tags['method'] = request.method
+            if (self.server.method_body_sizes and
+                self.body_method != request.method and
+                self.content_len > self.server.body_limit(request.method)):
+                # The method was not resolved before the body was received.
+                request = None
+                self.reject_request(413, 'Request Entity Too Large')
+                return
+            self.inflight = request
+            if self.deadline is not None and self.deadline <= time.time():
+                # The client has given up on the request already.
+                raise JsonRpcDeadlineError(data={'method': request.method})
             method = self.server.interface(self.server, request, self)
-            method()
+            if trace is None:
+                self.call_method(method)
+            else:
+                span = trace.child('jsonrpc.dispatch')
+                self._spans['jsonrpc.method'] = trace.child('jsonrpc.method')
+                self.call_method(method)
+                span.finish()
         except Exception as err:
             self.on_error(request, err)
         finally:
             if isinstance(request, JsonRpcNotification):
-                self.close()
+                self.finish_notification()
+
+    def call_method(self, method):
+        '''
+        Calls the given interface method with the deadline of the current
+        request as the one inherited by client requests.
+        '''
+        if self.deadline is None:
+            method()
+        else:
+            activate_deadline(self.deadline, method)
 
     def handle_write(self):
+        if self._handshake is not None:
+            if self.timeout < time.time():
+                self.log_message('TLS handshake timed out')
+                self.close()
+            else:
+                self.do_handshake()
+            return
+        if self.stream is not None:
+            self.handle_stream_write()
+            return
+        if self.exchanges is not None:
+            self.handle_frames_write()
+            return
         if not self._writable:
             # Triggered by timeout.
+            if self.handled and self.idle():
+                # An idle persistent connection.
+                self.close()
+                return
             self.write_buffer = ''
+            self.keep_alive = False
+            self.cancel_task()
             self.send_http_error(408, 'Request timed out')
         num_sent = 0
-        num_sent = asyncore.dispatcher.send(self, self.write_buffer)
+        num_sent = self.send(self.write_buffer)
         self.write_buffer = self.write_buffer[num_sent:]
         if not self.write_buffer:
+            self.finish_response()
+
+    def finish_response(self):
+        '''
+        Finishes the written response and either closes the connection or
+        waits for the next request on a persistent connection.
+        '''
+        self.collect_profile()
+        if self.trace is not None:
+            self.finish_trace()
+        self.inflight = None
+        self.task = None
+        self.handled += 1
+        if not self.keep_alive or self.server.draining:
+            self.close()
+            return
+        self.reset()
+        if self.read_buffer and not self.server.paused:
+            self.process_pipelined()
+
+    def process_pipelined(self):
+        '''
+        Begins the pipelined request of the read buffer and processes it,
+        like a request which starts on a fresh read.
+        '''
+        self.begin_request()
+        if self.profile is None:
+            self.process_request()
+        else:
+            self.profiler.run(self.profile, self.process_request)
+
+    def resume(self):
+        '''
+        Resumes processing of pipelined requests, or of requests kept by the
+        multiplexed stream, unless the connection or the server is paused.
+        '''
+        if self.exchanges is not None:
+            if (not self.paused and not self.server.paused and
+                '\n' in self.read_buffer):
+                self.process_frames()
+            return
+        if (self.read_buffer and self.inflight is None and
+            self.content_len is None and self.stream is None and
+            self.exchanges is None and not self.write_buffer):
+            self.process_pipelined()
+
+    def finish_notification(self):
+        '''
+        Finishes the handled notification which has no response.
+        '''
+        if not self.keep_alive or self.server.draining:
+            self.collect_profile()
+            if self.trace is not None:
+                self.finish_trace()
+            self.inflight = None
+            self.close()
+            return
+        # Keep the persistent connection in sync with an empty response.
+        self.add_base_response(204, 'No Content')
+        self.add_content()
+        self._writable = True
+
+    def collect_profile(self):
+        '''
+        Passes the profile of the current request to the profiler.
+        '''
+        if self.profile is None:
+            return
+        method = getattr(self.inflight, 'method', None)
+        self.profiler.collect(self.profile, method)
+        self.profile = None
+        self.profiler = None
+
+    def reset(self):
+        '''
+        Resets the state of the handler to read the next request.
+        '''
+        self.path = '/'
+        self.data = ''
+        self.content_len = None
+        self.body_method = None
+        self._receive_start = None
+        self.deadline = None
+        self.keep_alive = False
+        self._readable = True
+        self._writable = False
+        self.timeout = time.time() + self._timeout
+
+    def idle(self):
+        '''
+        Checks if the handler neither handles nor reads any request.
+        '''
+        return (self.inflight is None and self.stream is None and
+                not self.exchanges and self.content_len is None and
+                not self.read_buffer and not self.write_buffer)
+
+    def handle_frames_write(self):
+        '''
+        Writes out responses of the multiplexed stream.
+        '''
+        num_sent = self.send(self.write_buffer)
+        self.write_buffer = self.write_buffer[num_sent:]
+        if (not self.write_buffer and not self.exchanges and
+            self.server.draining):
             self.close()
+            return
+        self.resume()
+
+    def handle_stream_write(self):
+        '''
+        Writes out notifications queued by the subscription stream.
+        '''
+        if not self.write_buffer:
+            self.write_buffer = self.stream.pop()
+        num_sent = self.send(self.write_buffer)
+        self.write_buffer = self.write_buffer[num_sent:]
+
+    def start_stream(self, request, subscription):
+        '''
+        Sends the given subscription ID as the result of the given request
+        and keeps the connection open to stream notifications of the
+        subscription using chunked transfer coding.
+        '''
+        if self.protocol_version != 'HTTP/1.1':
+            raise JsonRpcError(message='Subscriptions require HTTP/1.1.')
+        data = RESULT_TEMPLATE.render(self.server.encoding, id=request.id,
+                                      result=subscription.id)
+        self.add_base_response(200, 'OK')
+        self.add_header('Content-Type', 'application/json-rpc')
+        self.add_header('Transfer-Encoding', 'chunked')
+        self.write_buffer += '\r\n' + encode_chunk(data)
+        self.log_message('"%s" %s stream %s', self.path, '200', subscription.id)
+        self.stream = subscription
+        subscription.attach(self)
+        # Watch the connection to detect a closed subscriber.
+        self._readable = True
+
+    def end_stream(self):
+        '''
+        Ends the stream of notifications and closes the connection.
+        '''
+        if self.stream is None:
+            return
+        self.stream = None
+        self.write_buffer += LAST_CHUNK
+        self._writable = True
+
+    def start_task(self, task):
+        '''
+        Watches the given task of the current request to cancel it when the
+        request is abandoned.
+        '''
+        self.task = task
+
+    def cancel_task(self):
+        '''
+        Cancels the task of the current request if it is still running.
+        '''
+        task, self.task = self.task, None
+        if task is not None and task.cancel():
+            self.log_message('"%s" task cancelled', self.path)
+
+    def handle_close(self):
+        self.close()
+
+    def close(self):
+        self.cancel_task()
+        if self.exchanges:
+            exchanges, self.exchanges = self.exchanges, set()
+            for exchange in exchanges:
+                exchange.cancel_task()
+        if self.stream is not None:
+            stream, self.stream = self.stream, None
+            stream.close()
+        if self.trace is not None:
+            self.finish_trace(error='connection closed')
+        self.write_buffer = ''
+        asyncore.dispatcher.close(self)
+        self.server.handler_closed(self)
 
     def log_message(self, format, *args):
-        logger.debug(format % args)
+        logger.debug(format, *args)
 
     def on_result(self, request, result):
+        if self.trace is not None:
+            self.trace_result()
         if isinstance(request, JsonRpcNotification):
             return
-        response = JsonRpcResponse(request.id, result)
-        data = response.dumps(encoding=self.server.encoding)
+        if self.profile is not None:
+            self.profiler.run(self.profile, self.send_jsonrpc_result,
+                              request, result)
+        else:
+            self.send_jsonrpc_result(request, result)
+
+    def trace_result(self, **tags):
+        '''
+        Finishes the span of the method execution, which may be deferred.
+        '''
+        span = self._spans.pop('jsonrpc.method', None)
+        if span is not None:
+            span.finish(**tags)
+
+    def send_jsonrpc_result(self, request, result):
+        if self.trace is None:
+            data = RESULT_TEMPLATE.render(self.server.encoding,
+                                          id=request.id, result=result)
+        else:
+            span = self.trace.child('jsonrpc.dumps')
+            data = RESULT_TEMPLATE.render(self.server.encoding,
+                                          id=request.id, result=result)
+            span.finish()
         self.send_http_result(data)
 
     def on_error(self, request, error):
+        if self.trace is not None:
+            self.trace_result(error='%s' % error)
         if isinstance(request, JsonRpcNotification):
             return
+        if self.profile is not None:
+            self.profiler.run(self.profile, self.send_jsonrpc_error,
+                              request, error)
+        else:
+            self.send_jsonrpc_error(request, error)
+
+    def jsonrpc_error(self, request, error):
+        '''
+        Returns the given error of the given request as a Json-RPC error.
+        '''
         if not isinstance(error, JsonRpcError):
             data = {'exception': '%s' % error}
             error = JsonRpcInternalError(data=data)
         if request:
             error.id = request.id
-        data = dumps(error.marshal(), encoding=self.server.encoding)
+        return error
+
+    def send_jsonrpc_error(self, request, error):
+        error = self.jsonrpc_error(request, error)
+        if self.trace is None:
+            data = self.encode_error(error)
+        else:
+            span = self.trace.child('jsonrpc.dumps')
+            data = self.encode_error(error)
+            span.finish()
         self.send_http_result(data)
 
+    def encode_error(self, error):
+        '''
+        Encodes a response of the given error, using a template of canned
+        errors.
+        '''
+        template = error_template(error)
+        if template is None:
+            return dumps(error.marshal(), encoding=self.server.encoding)
+        if error.data:
+            return template.render(self.server.encoding, id=error.id,
+                                   data=error.data)
+        return template.render(self.server.encoding, id=error.id)
+
     def parse_http_request(self, request_string):
         if not request_string:
             return False
@@ -222,15 +1031,31 @@ class JsonRpcRequestHandler(asyncore.dispatcher):
         if len(parts) < 2:
             return False
 
-        parts = parts[1].split('\r\n\r\n')
+        parts = parts[1].split('\r\n\r\n', 1)
 
         if len(parts) < 2:
             return False
 
+        if len(parts[0]) > self.server.max_header_size:
+            raise ParsingHTTPError(431, 'Request Header Fields Too Large')
         self.headers = email.message_from_string(parts[0])
 
-        self.content_len = int(self.headers.get('content-length', 0))
+        try:
+            content_len = int(self.headers.get('content-length', 0))
+        except ValueError:
+            content_len = -1
+        if content_len < 0:
+            raise ParsingHTTPError(400, 'Bad Content-Length')
+        self.content_len = content_len
         self.data = parts[1]
+
+        connection = self.headers.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            keep_alive = connection == 'keep-alive'
+        else:
+            keep_alive = connection != 'close'
+        self.keep_alive = (keep_alive and self.server.keep_alive and
+                           not self.server.draining)
         return True
 
     def send_http_result(self, data):
@@ -238,6 +1063,8 @@ class JsonRpcRequestHandler(asyncore.dispatcher):
         self.add_content(data, 'application/json-rpc')
         self.log_message('"%s" %s %s', self.path, '200', str(len(data)))
         self._writable = True
+        if self.trace is not None:
+            self._spans['http.write'] = self.trace.child('http.write')
 
     def send_http_error(self, code, message):
         self.add_base_response(code, message)
@@ -257,13 +1084,17 @@ class JsonRpcRequestHandler(asyncore.dispatcher):
         self._writable = True
 
     def add_base_response(self, code, message):
-        self.write_buffer += "%s %d %s\r\n" % \
-                             (self.protocol_version, code, message)
-        self.add_header('Server', self.server_version)
-        self.add_header('User-Agent', 'Python-JsonRPC2')
-        self.add_header(
-            'Date', time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime()))
-        self.add_header('Connection', 'close')
+        key = (self.server_version, self.protocol_version, code, message,
+               self.keep_alive)
+        template = _head_templates.get(key)
+        if template is None:
+            template = HttpHeadTemplate(self.protocol_version, code, message, [
+                ('Server', self.server_version),
+                ('User-Agent', 'Python-JsonRPC2'),
+                ('Connection', 'keep-alive' if self.keep_alive else 'close')
+            ])
+            _head_templates[key] = template
+        self.write_buffer += template.render()
 
     def add_header(self, keyword, value):
         self.write_buffer += "%s: %s\r\n" % (keyword, value)
@@ -278,41 +1109,88 @@ class JsonRpcRequestHandler(asyncore.dispatcher):
         self.write_buffer += "\r\n%s" % content
 
 
-class JsonRpcServer(asyncore.dispatcher):
+def format_address(address):
     '''
-    A class of Json-RPC servers.
+    Formats the given socket address of the AF_INET or AF_INET6 family.
     '''
-    #: A class of Json-RPC request handlers
-    handler_class = JsonRpcRequestHandler
+    if ':' in address[0]:
+        return '[%s]:%d' % address[:2]
+    return '%s:%d' % address[:2]
 
-    def __init__(self, address, interface, timeout=5,
-                       encoding=None, logging=None, allowed_ips=None):
-        if (not isinstance(interface, type) or
-            not issubclass(interface, JsonRpcIface)):
-            raise TypeError('Interface must be JsonRpcIface subclass')
 
+class JsonRpcListener(asyncore.dispatcher, object):
+    '''
+    A class of Json-RPC server listeners.
+
+    A listener accepts connections on a single address and runs request
+    handlers of its server for them. Options which are not given are taken
+    from the server.
+    '''
+    def __init__(self, server, address, backlog=0, ssl_context=None,
+                       allowed_ips=None, handler_class=None, dualstack=False):
+        self.server = server
+        self.backlog = backlog
+        self.ssl_context = ssl_context
         self.allowed_ips = allowed_ips
-        self.interface = interface
-        self.timeout = timeout
-        self.encoding = encoding or 'utf-8'
-        logger.setup(logging)
+        self.handler_class = handler_class
+        self.accepted = 0
+        self.rejected = 0
 
+        host, port = address[:2]
+        # Hosts are bound as IPv4 ones unless they are IPv6 addresses or
+        # wildcard hosts of dual-stack listeners, so the family does not
+        # depend on the order of resolved addresses.
+        family = socket.AF_INET
+        if ':' in (host or '') or (dualstack and not host):
+            family = socket.AF_INET6
+        sockaddr = socket.getaddrinfo(host or None, port, family,
+                                      socket.SOCK_STREAM, 0,
+                                      socket.AI_PASSIVE)[0][4]
+        asyncore.dispatcher.__init__(self)
+        self.create_socket(family, socket.SOCK_STREAM)
         try:
-            asyncore.dispatcher.__init__(self)
-            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            if family == socket.AF_INET6 and hasattr(socket, 'IPV6_V6ONLY'):
+                self.socket.setsockopt(socket.IPPROTO_IPV6,
+                                       socket.IPV6_V6ONLY, not dualstack)
             self.set_reuse_addr()
-            self.bind(address)
-            self.listen(0)
+            self.bind(sockaddr)
+            self.listen(backlog)
         except Exception:
-            logger.exception('Server run error')
+            self.close()
             raise
 
     def __repr__(self):
-        addr = '%s:%d' % self.addr
+        addr = format_address(self.addr) if self.addr else 'closed'
         return '<%s(%s) at %#x>' % (self.__class__.__name__, addr, id(self))
 
     __str__ = __repr__
 
+    @property
+    def allowed_ips(self):
+        '''
+        Rules of the ACL of the listener, assigning them recompiles it.
+        '''
+        return self._allowed_ips
+
+    @allowed_ips.setter
+    def allowed_ips(self, rules):
+        self._allowed_ips = rules
+        self.acl = compile_acl(rules)
+
+    def option(self, name):
+        '''
+        Returns the value of the given listener option, falling back to the
+        server one.
+        '''
+        value = getattr(self, name)
+        if value is None:
+            value = getattr(self.server, name)
+        return value
+
+    def readable(self):
+        # Stop accepting connections while the server is paused.
+        return not self.server.paused
+
     def handle_accept(self):
         '''
         Runs a handler for a new Json-RPC request.
@@ -320,16 +1198,352 @@ class JsonRpcServer(asyncore.dispatcher):
         accept_result = self.accept()
         if accept_result is not None:
             sock, address = accept_result
-            if self.allowed_ips is None or address[0] in self.allowed_ips:
-                logger.debug('Handle client: %s:%d' % address)
-                self.handler_class(sock, self, timeout=self.timeout)
+            if self.server.tracer is not None:
+                accept_start = time.time()
+            acl = self.option('acl')
+            if acl is None or acl.check(address[0]):
+                logger.debug('Handle client: %s', format_address(address))
+                self.accepted += 1
+                ssl_context = self.option('ssl_context')
+                if ssl_context is not None:
+                    sock = ssl_context.wrap_socket(sock, server_side=True,
+                                                   do_handshake_on_connect=False)
+                handler_class = self.option('handler_class')
+                handler = handler_class(sock, self.server,
+                                        timeout=self.server.timeout)
+                if self.server.tracer is not None:
+                    handler.accept_times = (accept_start, time.time())
             else:
-                logger.debug('Rejecting connection from: %s:%d' % address)
+                logger.debug('Rejecting connection from: %s',
+                             format_address(address))
+                self.rejected += 1
                 sock.close()
 
     def handle_error(self):
         logger.exception('Unhandled server error')
 
+    def handle_close(self):
+        logger.info('Handle close listener: %r', self)
+        self.close()
+
+
+class JsonRpcServer:
+    '''
+    A class of Json-RPC servers.
+
+    A server owns one or more listeners which all feed the same interface.
+    The listener of the given address is created by the constructor, more
+    of them can be added by add_listener().
+
+    Rules of the allowed_ips ACL, like "10.0.0.0/16" or "!10.0.5.0/24", are
+    compiled into the acl attribute, which can be reloaded at runtime by
+    server.acl.load(rules) or by assigning allowed_ips. Addresses which do
+    not match any rule are denied, unless allowed_ips is None.
+    '''
+    #: A class of Json-RPC request handlers
+    handler_class = JsonRpcRequestHandler
+
+    #: A class of Json-RPC server listeners
+    listener_class = JsonRpcListener
+
+    #: Watermarks of write buffers of all connections in bytes: above the
+    #: high one the server stops accepting connections and starting new
+    #: requests until the buffers drain below the low one
+    high_watermark = 16 * 1024 * 1024
+    low_watermark = 4 * 1024 * 1024
+
+    #: Maximum sizes of request headers and bodies in bytes, see
+    #: method_body_sizes for limits of specific methods
+    max_header_size = 64 * 1024
+    max_body_size = 16 * 1024 * 1024
+
+    #: Requests have to be received at least at the given rate in bytes per
+    #: second after the given grace period in seconds, otherwise they time
+    #: out
+    min_receive_rate = 1024
+    receive_grace = 2.0
+
+    #: Watermarks of the write buffer of a connection in bytes: above the
+    #: high one the connection is not read until it drains below the low one
+    connection_high_watermark = 1024 * 1024
+    connection_low_watermark = 256 * 1024
+
+    #: Can connections be upgraded to multiplexed streams
+    multiplexing = True
+
+    def __init__(self, address, interface, timeout=5,
+                       encoding=None, logging=None, allowed_ips=None,
+                       ssl_context=None, backlog=0, dualstack=False,
+                       keep_alive=False):
+        if (not isinstance(interface, type) or
+            not issubclass(interface, JsonRpcIface)):
+            raise TypeError('Interface must be JsonRpcIface subclass')
+
+        # Connections are accepted from addresses allowed by the ACL,
+        # see jsonrpc2.acl.JsonRpcAcl
+        self.allowed_ips = allowed_ips
+        self.ssl_context = ssl_context
+        self.interface = interface
+        self.timeout = timeout
+        self.encoding = encoding or 'utf-8'
+        self.keep_alive = keep_alive
+        # A profiler of requests, see jsonrpc2.profiler.JsonRpcProfiler
+        self.profiler = None
+        # A tracer of requests, see jsonrpc2.tracing.JsonRpcTracer
+        self.tracer = None
+        self.publisher = JsonRpcPublisher(encoding=self.encoding)
+        self.listeners = []
+        # Open connections of all listeners
+        self.connections = set()
+        self.draining = False
+        self.abandoned = None
+        self._drain_timer = None
+        self._drain_callback = None
+        # Maximum body sizes of requests of specific methods, replacing
+        # max_body_size
+        self.method_body_sizes = {}
+        # The size of write buffers of all connections in bytes
+        self.buffered = 0
+        self.paused = False
+        logger.setup(logging)
+
+        if address is not None:
+            self.add_listener(address, backlog=backlog, dualstack=dualstack)
+
+    def __repr__(self):
+        addrs = ', '.join(format_address(listener.addr)
+                          for listener in self.listeners)
+        return '<%s(%s) at %#x>' % (self.__class__.__name__, addrs, id(self))
+
+    __str__ = __repr__
+
+    @property
+    def allowed_ips(self):
+        '''
+        Rules of the ACL of the server, assigning them recompiles it.
+        '''
+        return self._allowed_ips
+
+    @allowed_ips.setter
+    def allowed_ips(self, rules):
+        self._allowed_ips = rules
+        self.acl = compile_acl(rules)
+
+    @property
+    def addr(self):
+        '''
+        The address of the first listener.
+        '''
+        return self.listeners[0].addr if self.listeners else None
+
+    def add_listener(self, address, **options):
+        '''
+        Creates a new listener of the given address (host, port). Host names
+        are bound to IPv4 addresses, IPv6 ones are bound when they are given
+        as IPv6 addresses. The listener options are: backlog, ssl_context,
+        allowed_ips (a list of ACL rules or a JsonRpcAcl), handler_class and
+        dualstack (accepting IPv4 connections on an IPv6 wildcard address).
+        '''
+        try:
+            listener = self.listener_class(self, address, **options)
+        except Exception:
+            logger.exception('Server run error')
+            raise
+        self.listeners.append(listener)
+        return listener
+
+    def remove_listener(self, listener):
+        '''
+        Closes the given listener and removes it from the server.
+        '''
+        listener.close()
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def stats(self):
+        '''
+        Returns connection counters of the server summed over its listeners.
+        '''
+        return {
+            'listeners': len(self.listeners),
+            'accepted': sum(l.accepted for l in self.listeners),
+            'rejected': sum(l.rejected for l in self.listeners)
+        }
+
+    def body_limit(self, method=None):
+        '''
+        Returns the maximum body size of requests of the given method, or of
+        any method if it is not known.
+        '''
+        if method is None:
+            return max([self.max_body_size] +
+                       list(self.method_body_sizes.values()))
+        return self.method_body_sizes.get(method, self.max_body_size)
+
+    def buffer_stats(self):
+        '''
+        Returns gauges of write buffers of the server connections.
+        '''
+        return {
+            'buffered': self.buffered,
+            'paused': self.paused,
+            'paused_connections': sum(1 for handler in self.connections
+                                      if handler.paused)
+        }
+
+    def buffer_changed(self, delta):
+        '''
+        Counts the given change of the size of a connection write buffer and
+        pauses or resumes the server according to its watermarks.
+        '''
+        self.buffered += delta
+        if self.paused:
+            if self.buffered <= self.low_watermark:
+                self.resume()
+        elif self.high_watermark and self.buffered >= self.high_watermark:
+            self.pause()
+
+    def pause(self):
+        '''
+        Pauses accepting connections, reading new requests and publishing
+        notifications.
+        '''
+        if self.paused:
+            return
+        logger.info('Pause server: %r, buffered %d bytes', self,
+                    self.buffered)
+        self.paused = True
+
+    def resume(self):
+        '''
+        Resumes the paused server.
+        '''
+        if not self.paused:
+            return
+        logger.info('Resume server: %r, buffered %d bytes', self,
+                    self.buffered)
+        self.paused = False
+        for handler in list(self.connections):
+            handler.resume()
+
+    def session_stats(self):
+        '''
+        Returns statistics of the TLS session caches or None if the server
+        speaks plaintext.
+        '''
+        contexts = []
+        for listener in self.listeners:
+            context = listener.option('ssl_context')
+            if context is not None and context not in contexts:
+                contexts.append(context)
+        if not contexts:
+            return None
+        stats = {}
+        for context in contexts:
+            for name, value in context.session_stats().items():
+                stats[name] = stats.get(name, 0) + value
+        return stats
+
+    def publish(self, topic, params=None, method=None):
+        '''
+        Publishes a notification to all subscribers of the given topic.
+
+        Returns the number of subscribers which accepted the notification, or
+        None if it was dropped because the server is paused.
+        '''
+        if self.paused:
+            for subscription in self.publisher.topics.get(topic, []):
+                subscription.dropped += 1
+            logger.debug('Drop notification of paused server: %r', topic)
+            return None
+        return self.publisher.publish(topic, params, method=method)
+
+    def handler_closed(self, handler):
+        '''
+        Forgets the given closed request handler.
+        '''
+        self.connections.discard(handler)
+        if self.draining:
+            self._check_drained()
+
+    def drain(self, timeout=30, callback=None):
+        '''
+        Drains the server: stops accepting connections, closes idle ones,
+        ends subscription streams and lets in-flight requests finish, and
+        responses of persistent connections are sent with
+        "Connection: close". Requests received by multiplexed streams in the
+        meantime fail with JsonRpcOverloadError errors.
+
+        When all connections are closed or the given timeout in seconds
+        expires, the given callback is called with a list of abandoned
+        requests, which is stored as the abandoned attribute as well.
+        '''
+        if self.draining:
+            return
+        logger.info('Drain server: %r', self)
+        self.draining = True
+        self._drain_callback = callback
+        self.close()
+        self.publisher.close()
+        for handler in list(self.connections):
+            handler.keep_alive = False
+            if handler.idle():
+                handler.close()
+        if self.connections:
+            self._drain_timer = call_later(timeout, self._drain_expired)
+        self._check_drained()
+
+    def drain_on_signal(self, signum=signal.SIGTERM, timeout=30,
+                        callback=None):
+        '''
+        Installs a handler of the given signal which drains the server.
+        Returns the previous signal handler.
+        '''
+        def handler(signum, frame):
+            # Drain from the event loop rather than from an interrupted call.
+            call_later(0, self.drain, timeout, callback)
+        return signal.signal(signum, handler)
+
+    def _check_drained(self):
+        if self.connections or self.abandoned is not None:
+            return
+        self._finish_drain([])
+
+    def _drain_expired(self):
+        self._drain_timer = None
+        abandoned = [handler.inflight for handler in self.connections
+                     if handler.inflight is not None]
+        for handler in self.connections:
+            abandoned.extend(exchange.request
+                             for exchange in handler.exchanges or ())
+        logger.warning('Drain timed out, abandoned %d request(s): %s',
+                       len(abandoned), ', '.join(
+                          '%s(id=%s)' % (request.method,
+                                         getattr(request, 'id', None))
+                          for request in abandoned))
+        # Mark the drain as finished before closing the handlers.
+        self.abandoned = abandoned
+        for handler in list(self.connections):
+            handler.close()
+        self._finish_drain(abandoned)
+
+    def _finish_drain(self, abandoned):
+        self.abandoned = abandoned
+        if self._drain_timer is not None:
+            self._drain_timer.cancel()
+            self._drain_timer = None
+        logger.info('Server drained: %r', self)
+        callback, self._drain_callback = self._drain_callback, None
+        if callback is not None:
+            callback(abandoned)
+
+    def close(self):
+        '''
+        Closes all listeners of the server.
+        '''
+        for listener in self.listeners:
+            listener.close()
+
     def handle_close(self):
         '''
         Closes the Json-RPC server.
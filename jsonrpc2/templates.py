@@ -0,0 +1,172 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Definitions of response templates which encode constant parts of responses
+once.
+
+A JSON template is created from a sample object whose variable members are
+Slot objects. Rendering only encodes values of the slots and splices them
+into the pre-encoded text.
+'''
+
+import json
+import time
+
+from .base import SPEC_VER, RawJson
+from .errors import JsonRpcParseError, InvalidJsonRpcError, \
+                    JsonRpcMethodNotFoundError, JsonRpcInvalidParamsError, \
+                    JsonRpcInternalError, JsonRpcOverloadError, \
+                    JsonRpcDeadlineError
+
+# Errors whose responses are rendered from cached templates
+CANNED_ERRORS = (
+    JsonRpcParseError,
+    InvalidJsonRpcError,
+    JsonRpcMethodNotFoundError,
+    JsonRpcInvalidParamsError,
+    JsonRpcInternalError,
+    JsonRpcOverloadError,
+    JsonRpcDeadlineError
+)
+
+__metaclass__ = type
+
+class Slot:
+    '''
+    A variable member of a JSON template.
+    '''
+    def __init__(self, name):
+        self.name = name
+
+
+class JsonTemplate:
+    '''
+    A class of pre-encoded JSON templates.
+    '''
+    def __init__(self, sample, encoding=None):
+        self.names = []
+        encoded = json.dumps(self._mark(sample), encoding=encoding or 'utf-8')
+        encoded = encoded.replace('%', '%%')
+        for index, name in enumerate(self.names):
+            marker = json.dumps(self._marker(index))
+            encoded = encoded.replace(marker, '%%(%s)s' % name)
+        self._format = encoded
+
+    def _marker(self, index):
+        return u'\x00%d\x00' % index
+
+    def _mark(self, value):
+        # Replaces slots of the given sample with unique string markers.
+        if isinstance(value, Slot):
+            self.names.append(value.name)
+            return self._marker(len(self.names) - 1)
+        if isinstance(value, dict):
+            return dict((key, self._mark(item)) for key, item in value.items())
+        if isinstance(value, (list, tuple)):
+            return [self._mark(item) for item in value]
+        return value
+
+    def render(self, encoding=None, **values):
+        '''
+        Encodes the given values of slots and returns the rendered template.
+        Values which are RawJson objects are spliced as they are.
+
+        Raises a JsonRpcParseError exception if a value cannot be encoded.
+        '''
+        encoding = encoding or 'utf-8'
+        encoded = {}
+        try:
+            for name, value in values.items():
+                if isinstance(value, RawJson):
+                    encoded[name] = value.data
+                else:
+                    encoded[name] = json.dumps(value, encoding=encoding)
+        except TypeError as err:
+            raise JsonRpcParseError(data={'exception': '%s' % err})
+        return self._format % encoded
+
+    def render_encoded(self, **encoded):
+        '''
+        Returns the template rendered with the given encoded values.
+        '''
+        return self._format % encoded
+
+
+# The template of Json-RPC responses
+RESULT_TEMPLATE = JsonTemplate({
+    'jsonrpc': SPEC_VER,
+    'result': Slot('result'),
+    'id': Slot('id')
+})
+
+_error_templates = {}
+
+def error_template(error):
+    '''
+    Returns a template of responses of the given error, which has an "id"
+    slot and a "data" slot if the error has data, or None if the error is
+    not a canned one.
+    '''
+    if type(error) not in CANNED_ERRORS:
+        return None
+    key = (error.code, error.message, bool(error.data))
+    template = _error_templates.get(key)
+    if template is None:
+        marshaled = {'code': error.code, 'message': error.message}
+        if error.data:
+            marshaled['data'] = Slot('data')
+        template = JsonTemplate({
+            'jsonrpc': SPEC_VER,
+            'error': marshaled,
+            'id': Slot('id')
+        })
+        _error_templates[key] = template
+    return template
+
+
+class HttpHeadTemplate:
+    '''
+    A class of pre-encoded heads of HTTP responses, in which only the Date
+    and Content-Length headers are rendered.
+    '''
+    def __init__(self, version, code, message, headers):
+        head = ['%s %d %s' % (version, code, message)]
+        head.extend('%s: %s' % header for header in headers)
+        self._format = '\r\n'.join(head).replace('%', '%%') + \
+                       '\r\nDate: %s\r\n'
+
+    def render(self):
+        return self._format % http_date()
+
+
+_date = (None, None)
+
+def http_date():
+    '''
+    Returns the current date in the HTTP format, formatted once per second.
+    '''
+    global _date
+
+    now = int(time.time())
+    if _date[0] != now:
+        _date = (now, time.strftime('%a, %d %b %Y %H:%M:%S GMT',
+                                    time.gmtime(now)))
+    return _date[1]
@@ -0,0 +1,177 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''
+Definitions of tracing hooks of Json-RPC clients and servers.
+
+Spans are propagated between clients and servers in the W3C Trace Context
+"traceparent" HTTP header.
+'''
+
+import re
+import time
+import random
+
+# The HTTP header of the propagated trace context
+TRACE_HEADER = 'Traceparent'
+
+_TRACEPARENT_RE = re.compile(
+    r'^[ \t]*00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})[ \t]*$')
+
+__metaclass__ = type
+
+def _gen_trace_id():
+    return '%032x' % random.getrandbits(128)
+
+def _gen_span_id():
+    return '%016x' % random.getrandbits(64)
+
+
+class SpanContext:
+    '''
+    A class of span contexts identifying spans of a trace.
+    '''
+    def __init__(self, trace_id, span_id, sampled=True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def __repr__(self):
+        return '<%s(%s/%s)>' % (self.__class__.__name__,
+                                self.trace_id, self.span_id)
+
+    def header(self):
+        '''
+        Returns the value of the trace context header of the span.
+        '''
+        return '00-%s-%s-%s' % (self.trace_id, self.span_id,
+                                '01' if self.sampled else '00')
+
+
+class Span(SpanContext):
+    '''
+    A class of timed spans.
+    '''
+    def __init__(self, tracer, name, parent=None, start=None, tags=None):
+        if parent is None:
+            SpanContext.__init__(self, _gen_trace_id(), _gen_span_id())
+            self.parent_id = None
+        else:
+            SpanContext.__init__(self, parent.trace_id, _gen_span_id(),
+                                 parent.sampled)
+            self.parent_id = parent.span_id
+        self.tracer = tracer
+        self.name = name
+        self.start = start or time.time()
+        self.end = None
+        self.tags = tags or {}
+
+    def __repr__(self):
+        return '<%s(%s, %s/%s)>' % (self.__class__.__name__, self.name,
+                                    self.trace_id, self.span_id)
+
+    @property
+    def duration(self):
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    def child(self, name, start=None, **tags):
+        '''
+        Starts a child span with the given name.
+        '''
+        return self.tracer.start_span(name, self, start=start, **tags)
+
+    def finish(self, end=None, **tags):
+        '''
+        Finishes the span and passes it to its tracer. Following calls are
+        ignored.
+        '''
+        if self.end is not None:
+            return
+        self.end = end or time.time()
+        self.tags.update(tags)
+        self.tracer.finish_span(self)
+
+
+class JsonRpcTracer:
+    '''
+    A base class for Json-RPC tracers.
+
+    A tracer is installed as the tracer attribute of a server or passed to
+    a client. Subclasses export finished spans by overriding finish_span().
+
+    Server spans of a request are children of the "jsonrpc.request" span:
+    accept, http.headers, http.body, jsonrpc.loads, jsonrpc.dispatch,
+    jsonrpc.method, jsonrpc.dumps and http.write. Client spans of a request
+    are children of the "jsonrpc.call" span: jsonrpc.dumps, http.send,
+    http.wait and jsonrpc.loads.
+    '''
+    #: The HTTP header of the propagated trace context
+    header = TRACE_HEADER
+
+    #: A class of spans
+    span_class = Span
+
+    def __init__(self):
+        # The span of the currently running request callback, used as the
+        # parent of nested client calls
+        self.current = None
+
+    def start_span(self, name, parent=None, start=None, **tags):
+        '''
+        Starts a new span with the given name and parent span or span
+        context.
+        '''
+        return self.span_class(self, name, parent, start=start, tags=tags)
+
+    def finish_span(self, span):
+        '''
+        Handles the given finished span.
+        '''
+        pass
+
+    def extract(self, value):
+        '''
+        Returns a span context of the given trace context header value or
+        None if it is invalid.
+        '''
+        m = _TRACEPARENT_RE.match(value or '')
+        if m is None:
+            return None
+        trace_id, span_id, flags = m.groups()
+        if trace_id == '0' * 32 or span_id == '0' * 16:
+            return None
+        return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1))
+
+    def inject(self, span):
+        '''
+        Returns the trace context header value of the given span.
+        '''
+        return span.header()
+
+    def activate(self, span, func, *args, **kwargs):
+        '''
+        Calls the given function with the given span as the current one.
+        '''
+        current, self.current = self.current, span
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.current = current
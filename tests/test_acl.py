@@ -0,0 +1,136 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Provides unit tests for the Json-RPC2 acl.py module.
+'''
+
+import socket
+import unittest
+
+from jsonrpc2 import acl
+
+
+class AclRuleTest(unittest.TestCase):
+    def test_network(self):
+        rule = acl.AclRule('10.1.2.3/16')
+        self.assertEqual(rule.family, socket.AF_INET)
+        self.assertEqual(rule.first, 0x0a010000)
+        self.assertEqual(rule.last, 0x0a01ffff)
+        self.assertEqual(rule.action, acl.ALLOW)
+
+    def test_host(self):
+        rule = acl.AclRule('2001:db8::1')
+        self.assertEqual(rule.family, socket.AF_INET6)
+        self.assertEqual(rule.prefixlen, 128)
+        self.assertEqual(rule.first, rule.last)
+
+    def test_parse_deny(self):
+        rule = acl.AclRule.parse(' !192.168.0.0/24')
+        self.assertEqual(rule.action, acl.DENY)
+        self.assertEqual(rule.prefixlen, 24)
+
+    def test_invalid(self):
+        for network in ('10.0.0.256', '10.0.0.0/33', '10.0.0.0/x',
+                        'localhost', '::1/129'):
+            self.assertRaises(ValueError, acl.AclRule, network)
+        self.assertRaises(ValueError, acl.AclRule, '10.0.0.1', 'reject')
+
+
+class AclTest(unittest.TestCase):
+    def test_allowed_hosts(self):
+        rules = acl.JsonRpcAcl(['10.0.0.1', '10.0.0.3'])
+        self.assertTrue(rules.check('10.0.0.1'))
+        self.assertFalse(rules.check('10.0.0.2'))
+        self.assertTrue('10.0.0.3' in rules)
+
+    def test_networks(self):
+        rules = acl.JsonRpcAcl(['10.0.0.0/16', '!10.0.5.0/24',
+                                '10.0.5.7', '192.168.1.0/24'])
+        self.assertTrue(rules.check('10.0.4.255'))
+        self.assertFalse(rules.check('10.0.5.1'))
+        self.assertTrue(rules.check('10.0.5.7'))
+        self.assertTrue(rules.check('10.0.6.0'))
+        self.assertFalse(rules.check('10.1.0.0'))
+        self.assertTrue(rules.check('192.168.1.200'))
+        self.assertFalse(rules.check('192.168.2.1'))
+
+    def test_deny_only(self):
+        rules = acl.JsonRpcAcl(['!10.0.0.0/8'])
+        self.assertFalse(rules.check('10.2.3.4'))
+        self.assertTrue(rules.check('11.0.0.1'))
+
+    def test_default(self):
+        rules = acl.JsonRpcAcl(['!10.0.0.0/8'], default=acl.DENY)
+        self.assertFalse(rules.check('11.0.0.1'))
+        self.assertTrue(acl.JsonRpcAcl([]).check('11.0.0.1'))
+
+    def test_deny_wins(self):
+        rules = acl.JsonRpcAcl(['10.0.0.0/8', '!10.0.0.0/8'])
+        self.assertFalse(rules.check('10.0.0.1'))
+
+    def test_ipv6(self):
+        rules = acl.JsonRpcAcl(['2001:db8::/32', '!2001:db8:1::/48', '::1'])
+        self.assertTrue(rules.check('2001:db8::5'))
+        self.assertFalse(rules.check('2001:db8:1::5'))
+        self.assertTrue(rules.check('::1'))
+        self.assertFalse(rules.check('fe80::1%eth0'))
+        self.assertFalse(rules.check('10.0.0.1'))
+
+    def test_ipv4_mapped(self):
+        rules = acl.JsonRpcAcl(['127.0.0.0/8'])
+        self.assertTrue(rules.check('::ffff:127.0.0.1'))
+
+    def test_invalid_address(self):
+        rules = acl.JsonRpcAcl(['!10.0.0.0/8'])
+        self.assertFalse(rules.check('invalid'))
+
+    def test_many_rules(self):
+        hosts = ['10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255)
+                 for i in range(0, 20000, 7)]
+        rules = acl.JsonRpcAcl(hosts + ['172.16.0.0/12'])
+        for host in hosts[::50]:
+            self.assertTrue(rules.check(host))
+        self.assertFalse(rules.check('10.0.0.1'))
+        self.assertTrue(rules.check('172.20.1.1'))
+
+    def test_hits(self):
+        rules = acl.JsonRpcAcl(['10.0.0.0/16', '!10.0.5.0/24'])
+        for address in ('10.0.0.1', '10.0.0.2', '10.0.5.1', '11.0.0.1'):
+            rules.check(address)
+        self.assertEqual(rules.stats(), [('10.0.0.0/16', acl.ALLOW, 2),
+                                         ('10.0.5.0/24', acl.DENY, 1),
+                                         (None, acl.DENY, 1)])
+
+    def test_reload(self):
+        rules = acl.JsonRpcAcl(['10.0.0.0/16', '10.1.0.0/16'])
+        rules.check('10.0.0.1')
+        rules.check('10.1.0.1')
+        rules.load(['10.0.0.0/16', '!10.1.0.0/16'])
+        self.assertFalse(rules.check('10.1.0.1'))
+        self.assertEqual([hits for _, _, hits in rules.stats()], [1, 1, 0])
+
+    def test_compile_acl(self):
+        rules = acl.JsonRpcAcl(['10.0.0.1'])
+        self.assertTrue(acl.compile_acl(rules) is rules)
+        self.assertEqual(acl.compile_acl(None), None)
+        self.assertTrue(acl.compile_acl(['10.0.0.1']).check('10.0.0.1'))
+        self.assertFalse(acl.compile_acl([]).check('10.0.0.1'))
+        self.assertFalse(acl.compile_acl(['!10.0.0.0/8']).check('11.0.0.1'))
@@ -0,0 +1,246 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Provides unit tests for the Json-RPC2 balancer.py module.
+'''
+
+import time
+import random
+import unittest
+
+from jsonrpc2 import base
+from jsonrpc2 import errors
+from jsonrpc2 import server
+from jsonrpc2 import balancer
+from jsonrpc2.client import JsonRpcClient
+
+URLS = ['http://a', 'http://b', 'http://c']
+
+
+class TestIface(server.JsonRpcIface):
+    def test_port(self):
+        return self.server.port
+
+
+def request(params=None):
+    return base.JsonRpcRequest('foo', params)
+
+def timeout_error():
+    return errors.JsonRpcProtocolError(110, 'Connection timed out')
+
+
+class PoliciesTest(unittest.TestCase):
+    def _select(self, lb, count, params=None):
+        urls = []
+        for i in range(count):
+            endpoint = lb.select(request(params))
+            lb.start(endpoint)
+            urls.append(endpoint.url)
+        return urls
+
+    def test_round_robin(self):
+        lb = balancer.JsonRpcBalancer(URLS)
+        self.assertEqual(self._select(lb, 4), URLS + URLS[:1])
+
+    def test_least_outstanding(self):
+        lb = balancer.JsonRpcBalancer(URLS, balancer.LEAST_OUTSTANDING)
+        self.assertEqual(sorted(self._select(lb, 3)), URLS)
+        lb.finish(lb.endpoints[1], 0.1)
+        self.assertEqual(self._select(lb, 1), ['http://b'])
+
+    def test_p2c_ewma(self):
+        lb = balancer.JsonRpcBalancer(URLS[:2], balancer.P2C_EWMA)
+        lb.endpoints[0].update_ewma(0.5, 10)
+        lb.endpoints[1].update_ewma(0.1, 10)
+        self.assertEqual(set(self._select(lb, 3)), set(['http://b']))
+        # Pending requests weight latencies.
+        lb.endpoints[1].outstanding = 10
+        self.assertEqual(self._select(lb, 1), ['http://a'])
+
+    def test_ewma(self):
+        endpoint = balancer.Endpoint('http://a')
+        endpoint.update_ewma(1.0, 10, now=100)
+        self.assertEqual(endpoint.ewma, 1.0)
+        endpoint.update_ewma(0.0, 10, now=110)
+        self.assertAlmostEqual(endpoint.ewma, 0.3679, places=4)
+
+    def test_consistent_hash(self):
+        policy = balancer.ConsistentHash('user')
+        lb = balancer.JsonRpcBalancer(URLS, policy)
+        keys = ['user%d' % i for i in range(100)]
+        chosen = dict((key, lb.select(request({'user': key})).url)
+                      for key in keys)
+        self.assertEqual(set(chosen.values()), set(URLS))
+        for key in keys:
+            self.assertEqual(lb.select(request({'user': key})).url,
+                             chosen[key])
+        # Only keys of a removed endpoint move.
+        lb.update(URLS[:2])
+        for key in keys:
+            url = lb.select(request({'user': key})).url
+            if chosen[key] != 'http://c':
+                self.assertEqual(url, chosen[key])
+            else:
+                self.assertNotEqual(url, 'http://c')
+
+    def test_consistent_hash_key(self):
+        policy = balancer.ConsistentHash(lambda request: request.params[1])
+        self.assertEqual(policy.request_key(request([1, 'key'])), 'key')
+        policy = balancer.ConsistentHash(0)
+        self.assertEqual(policy.request_key(request([1, 'key'])), 1)
+        self.assertEqual(policy.request_key(request(None)), None)
+
+    def test_consistent_hash_random(self):
+        policy = balancer.ConsistentHash('user', random=random.Random(1))
+        lb = balancer.JsonRpcBalancer(URLS, policy)
+        urls = [lb.select(request()).url for i in range(10)]
+        policy.random.seed(1)
+        self.assertEqual([lb.select(request()).url for i in range(10)], urls)
+
+    def test_default_policy(self):
+        policy = balancer.BalancingPolicy(random.Random(1))
+        lb = balancer.JsonRpcBalancer(URLS, policy)
+        urls = self._select(lb, 10)
+        self.assertEqual(set(urls) - set(URLS), set())
+        policy.random.seed(1)
+        self.assertEqual(self._select(lb, 10), urls)
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, balancer.JsonRpcBalancer, URLS, 'foo')
+        self.assertRaises(ValueError, balancer.JsonRpcBalancer, [])
+
+
+class EjectionTest(unittest.TestCase):
+    def setUp(self):
+        self.lb = balancer.JsonRpcBalancer(URLS[:2])
+        self.lb.max_failures = 2
+        self.endpoint = self.lb.endpoints[0]
+
+    def _fail(self, count, error=None):
+        for i in range(count):
+            self.lb.start(self.endpoint)
+            self.lb.finish(self.endpoint, 0.1, error or timeout_error())
+
+    def test_eject(self):
+        self._fail(1)
+        self.assertFalse(self.endpoint.ejected())
+        self._fail(1)
+        self.assertTrue(self.endpoint.ejected())
+        self.assertEqual([self.lb.select(request()).url for i in range(3)],
+                         ['http://b'] * 3)
+        self.assertEqual(self.lb.stats()[0]['failures'], 2)
+
+    def test_backoff(self):
+        self._fail(2)
+        self.assertTrue(self.endpoint.ejected_until - time.time() <= 10)
+        self.endpoint.ejected_until = 0
+        self._fail(1)
+        self.assertTrue(self.endpoint.ejected_until - time.time() > 15)
+
+    def test_success_resets(self):
+        self._fail(1)
+        self.lb.start(self.endpoint)
+        self.lb.finish(self.endpoint, 0.1)
+        self._fail(1)
+        self.assertFalse(self.endpoint.ejected())
+
+    def test_request_errors(self):
+        self._fail(3, errors.JsonRpcError())
+        self._fail(3, errors.JsonRpcProtocolError(404, 'Not Found'))
+        self.assertFalse(self.endpoint.ejected())
+        self.assertTrue(balancer.is_endpoint_failure(
+            errors.JsonRpcProtocolError(503, 'Service Unavailable')))
+
+    def test_all_ejected(self):
+        for endpoint in self.lb.endpoints:
+            self.endpoint = endpoint
+            self._fail(2)
+        self.assertEqual(sorted(self.lb.select(request()).url
+                                for i in range(2)), URLS[:2])
+
+
+class ResolverTest(unittest.TestCase):
+    def test_resolve(self):
+        resolved = [URLS[:2]]
+        lb = balancer.JsonRpcBalancer(lambda: resolved[0])
+        endpoint = lb.endpoints[0]
+        resolved[0] = URLS
+        lb.select(request())
+        self.assertEqual(len(lb.endpoints), 2)
+        lb.resolve_interval = 0
+        lb.select(request())
+        self.assertEqual([e.url for e in lb.endpoints], URLS)
+        self.assertTrue(lb.endpoints[0] is endpoint)
+
+    def test_resolve_error(self):
+        def resolver():
+            if calls:
+                raise IOError('failed')
+            calls.append(1)
+            return URLS
+
+        calls = []
+        lb = balancer.JsonRpcBalancer(resolver)
+        lb.resolve_interval = 0
+        self.assertEqual(lb.select(request()).url, 'http://a')
+        self.assertEqual(len(lb.endpoints), 3)
+
+
+class ClientBalancingTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.servers = []
+        for port in (self.port, self.port + 1):
+            self.servers.append(server.JsonRpcServer(('localhost', port),
+                                                     TestIface, timeout=1))
+            self.servers[-1].port = port
+
+    def tearDown(self):
+        for srv in self.servers:
+            srv.close()
+
+    def test_round_robin(self):
+        client = JsonRpcClient(['http://localhost:%d' % srv.port
+                                for srv in self.servers],
+                               timeout=1, blocking=True)
+        ports = [client.test_port([]) for i in range(4)]
+        self.assertEqual(ports, [self.port, self.port + 1] * 2)
+        self.assertEqual([e['requests'] for e in client.balancer.stats()],
+                         [2, 2])
+        self.assertEqual([e['outstanding']
+                          for e in client.balancer.stats()], [0, 0])
+        client.pool.clear()
+
+    def test_eject_unavailable(self):
+        self.servers[1].close()
+        lb = balancer.JsonRpcBalancer(['http://localhost:%d' % srv.port
+                                       for srv in self.servers])
+        lb.max_failures = 1
+        client = JsonRpcClient(None, timeout=1, balancer=lb)
+        ports = []
+        for i in range(3):
+            try:
+                ports.append(client.request(request=base.JsonRpcRequest(
+                    'test_port', [])).result(timeout=1))
+            except errors.JsonRpcError:
+                ports.append(None)
+        self.assertEqual(ports, [self.port, None, self.port])
+        self.assertTrue(lb.endpoints[1].ejected())
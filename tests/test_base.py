@@ -22,6 +22,7 @@ Provides unit tests for the Json-RPC2 base.py module.
 '''
 
 import json
+import time
 import unittest
 
 from jsonrpc2 import base
@@ -97,6 +98,18 @@ class MessagesTest(unittest.TestCase):
         }
         self.assertEqual(json.loads(request.dumps()), result)
 
+    def test_gen_id_unique(self):
+        ids = [base._gen_id() for i in range(1000)]
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_slots(self):
+        for msg in (base.JsonRpcNotification('foo', None),
+                    base.JsonRpcRequest('foo', None),
+                    base.JsonRpcResponse('1', None)):
+            self.assertFalse(hasattr(msg, '__dict__'))
+            self.assertRaises(AttributeError, setattr, msg, 'foo', 1)
+            self.assertEqual(sorted(msg.marshal()), sorted(msg.__slots__))
+
     def test_dumps_response(self):
         params = {
             'a': 1,
@@ -112,6 +125,12 @@ class MessagesTest(unittest.TestCase):
 
 
 class FunctionsTest(unittest.TestCase):
+    def test_dumps_not_modified(self):
+        message = {'method': 'foo', 'params': None}
+        self.assertEqual(json.loads(base.dumps(message))['jsonrpc'],
+                         base.SPEC_VER)
+        self.assertEqual(message, {'method': 'foo', 'params': None})
+
     def test_dumps(self):
         message = {
             'content': '_test_content_'
@@ -166,6 +185,30 @@ class FunctionsTest(unittest.TestCase):
         self.assertRaises(errors.JsonRpcParseError, base.loads,
                           json.dumps(message), [base.JsonRpcResponse])
 
+    def test_loads_unexpected_class(self):
+        message = {
+            'jsonrpc': base.SPEC_VER,
+            'method': 'foo',
+            'params': None
+        }
+        self.assertRaises(errors.JsonRpcParseError, base.loads,
+                          json.dumps(message), [base.JsonRpcRequest])
+        msg = base.loads(json.dumps(message), [base.JsonRpcRequest,
+                                               base.JsonRpcNotification])
+        self.assertTrue(isinstance(msg, base.JsonRpcNotification))
+
+    def test_loads_invalid_error(self):
+        message = {
+            'jsonrpc': base.SPEC_VER,
+            'error': {'code': -39999, 'message': 'Test', 'extra': 1},
+            'id': '_test_id_'
+        }
+        self.assertRaises(errors.JsonRpcParseError, base.loads,
+                          json.dumps(message), [base.JsonRpcResponse])
+        message['error'] = 'Test'
+        self.assertRaises(errors.JsonRpcParseError, base.loads,
+                          json.dumps(message), [base.JsonRpcResponse])
+
     def test_loads_invalid_message(self):
         message = {
             'method': 'foo',
@@ -189,3 +232,107 @@ class FunctionsTest(unittest.TestCase):
         self.assertRaises(errors.JsonRpcParseError,
                           base.loads, json.dumps(message)[5:5])
 
+
+class RawJsonTest(unittest.TestCase):
+    def test_value(self):
+        raw = base.RawJson(u'{"a": [1, "\u0105"]}')
+        self.assertTrue(isinstance(raw.data, bytes))
+        self.assertEqual(raw.value, {'a': [1, u'\u0105']})
+        self.assertEqual(raw, base.RawJson(raw.data))
+        self.assertNotEqual(raw, base.RawJson('{}'))
+
+    def test_loads_raw_result(self):
+        data = '{"jsonrpc": "2.0", "result": {"id": 2, "x": [1]}, "id": 1}'
+        response = base.loads_raw_result(data)
+        self.assertTrue(isinstance(response, base.JsonRpcResponse))
+        self.assertEqual(response.id, 1)
+        self.assertEqual(response.result.data, '{"id": 2, "x": [1]}')
+        self.assertEqual(response.result.value, {'id': 2, 'x': [1]})
+
+    def test_loads_raw_result_head_members(self):
+        data = '{"id": "abc", "jsonrpc": "2.0", "result": {"b": 1, "id": 2}}'
+        response = base.loads_raw_result(data)
+        self.assertEqual(response.id, 'abc')
+        self.assertEqual(response.result.data, '{"b": 1, "id": 2}')
+
+    def test_loads_raw_result_fallback(self):
+        data = '{"result": [1, 2], "error": null, "jsonrpc": "2.0", "id": 1}'
+        response = base.loads_raw_result(data)
+        self.assertEqual(response.id, 1)
+        self.assertEqual(response.result.data, '[1, 2]')
+        data = '{"result": 1, "x": 2, "jsonrpc": "2.0", "id": 1}'
+        self.assertRaises(errors.JsonRpcParseError, base.loads_raw_result,
+                          data)
+
+    def test_loads_raw_result_error(self):
+        message = {
+            'jsonrpc': base.SPEC_VER,
+            'error': {'code': -39999, 'message': 'Test error message'},
+            'id': '_test_id_'
+        }
+        self.assertRaises(errors.JsonRpcError, base.loads_raw_result,
+                          json.dumps(message))
+
+    def test_loads_raw_result_invalid(self):
+        self.assertRaises(errors.InvalidJsonRpcError, base.loads_raw_result,
+                          '{"jsonrpc": "1.0", "result": 1, "id": 1}')
+        self.assertRaises(errors.JsonRpcParseError, base.loads_raw_result,
+                          '{"jsonrpc": "2.0", "result": ')
+
+    def test_loads_raw_result_malformed(self):
+        for data in ['{"jsonrpc": "2.0", "result": {"a": 1}}, "id": 1}',
+                     '{"jsonrpc": "2.0", "result": [1, {"a": 2], "id": 1}',
+                     '{"jsonrpc": "2.0", "result": ["a"b"], "id": 1}',
+                     '{"jsonrpc": "2.0", "result": "a"b", "id": 1}',
+                     '{"jsonrpc": "2.0", "result": [1] 2, "id": 1}',
+                     '{"jsonrpc": "2.0", "result": [1], "id": 1} [2]']:
+            self.assertRaises(errors.JsonRpcParseError, base.loads_raw_result,
+                              data)
+
+    def test_loads_raw_result_skimmed(self):
+        data = ('{"jsonrpc": "2.0", "result": {"a": "]\\\\", "b": ["\\"["]},'
+                ' "id": 1}')
+        response = base.loads_raw_result(data)
+        self.assertTrue(response.result._value is base._UNDECODED)
+        self.assertEqual(response.result.value, {'a': ']\\', 'b': ['"[']})
+        # Results nested too deeply to be skimmed are decoded.
+        data = '{"jsonrpc": "2.0", "result": %s, "id": 1}' % (
+                    '[' * 100 + ']' * 100)
+        self.assertEqual(base.loads_raw_result(data).result.data,
+                         '[' * 100 + ']' * 100)
+        # Members of results are checked when they are decoded.
+        response = base.loads_raw_result(
+                        '{"jsonrpc": "2.0", "result": [1,, 2], "id": 1}')
+        self.assertEqual(response.result.data, '[1,, 2]')
+        self.assertRaises(ValueError, lambda: response.result.value)
+
+
+
+class TimersTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def _callback(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+
+    def test_call_later(self):
+        base.call_later(0.02, self._callback, 2)
+        base.call_later(0.01, self._callback, 1, a=1)
+        start = time.time()
+        base.loop()
+        self.assertTrue(time.time() - start >= 0.02)
+        self.assertEqual(self.calls, [((1,), {'a': 1}), ((2,), {})])
+
+    def test_cancel(self):
+        timer = base.call_later(0.01, self._callback, 1)
+        base.call_later(0.02, self._callback, 2)
+        timer.cancel()
+        timer.cancel()
+        base.loop()
+        self.assertEqual(self.calls, [((2,), {})])
+
+    def test_timer_error(self):
+        base.call_later(0, lambda: 1 / 0)
+        base.call_later(0, self._callback)
+        base.loop()
+        self.assertEqual(self.calls, [((), {})])
@@ -0,0 +1,165 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+
+'''
+Provides unit tests for the Json-RPC2 breaker.py module.
+'''
+
+import random
+import unittest
+
+from jsonrpc2 import base
+from jsonrpc2 import errors
+from jsonrpc2 import server
+from jsonrpc2 import breaker
+from jsonrpc2.client import JsonRpcClient
+
+
+class TestIface(server.JsonRpcIface):
+    def test_port(self):
+        return self.server.port
+
+
+def failure(code=111):
+    return errors.JsonRpcProtocolError(code, 'Connection failed')
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.changes = []
+        self.breakers = breaker.CircuitBreakers(
+            min_requests=4, error_rate=0.5, open_time=60, trial_requests=2,
+            on_state_change=lambda b, previous, state:
+                self.changes.append((previous, state)))
+        self.breaker = self.breakers.get('http://a')
+
+    def _record(self, *errors_):
+        for error in errors_:
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(error)
+
+    def test_open(self):
+        self._record(None, failure(), None)
+        self.assertEqual(self.breaker.state, breaker.CLOSED)
+        self._record(failure())
+        self.assertEqual(self.breaker.state, breaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertFalse(self.breakers.available('http://a'))
+        self.assertEqual(self.breaker.rejected, 1)
+        self.assertEqual(self.changes, [(breaker.CLOSED, breaker.OPEN)])
+
+    def test_min_requests(self):
+        self._record(failure(), failure(), failure())
+        self.assertEqual(self.breaker.state, breaker.CLOSED)
+
+    def test_request_errors(self):
+        self._record(*[errors.JsonRpcError()] * 5)
+        self._record(failure(404))
+        self.assertEqual(self.breaker.state, breaker.CLOSED)
+
+    def test_window(self):
+        self._record(failure(), failure(), failure())
+        self.breaker.outcomes[0] = (0,) + self.breaker.outcomes[0][1:]
+        self._record(None)
+        self.assertEqual(self.breaker.state, breaker.CLOSED)
+        self.assertEqual(self.breaker.stats()['failures'], 2)
+
+    def test_timeout_rate(self):
+        self.breakers.error_rate = 1
+        self.breakers.timeout_rate = 0.25
+        self._record(None, None, None, failure(110))
+        self.assertEqual(self.breaker.state, breaker.OPEN)
+
+    def test_half_open(self):
+        self._record(*[failure()] * 4)
+        self.breaker.opened_at -= 60
+        self.assertTrue(self.breakers.available('http://a'))
+        self._record(None)
+        self.assertEqual(self.breaker.state, breaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(None)
+        self.assertEqual(self.breaker.state, breaker.CLOSED)
+        self.assertEqual(self.breakers.state_changes,
+                         {breaker.OPEN: 1, breaker.HALF_OPEN: 1,
+                          breaker.CLOSED: 1})
+
+    def test_half_open_failure(self):
+        self._record(*[failure()] * 4)
+        self.breaker.opened_at -= 60
+        self.assertTrue(self.breaker.allow())
+        self.breaker.cancel()
+        self._record(failure())
+        self.assertEqual(self.breaker.state, breaker.OPEN)
+        self.assertEqual([state for previous, state in self.changes],
+                         [breaker.OPEN, breaker.HALF_OPEN, breaker.OPEN])
+
+
+class ClientBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.url = 'http://localhost:%d' % self.port
+        self.breakers = breaker.CircuitBreakers(min_requests=2, open_time=60)
+
+    def test_fail_fast(self):
+        client = JsonRpcClient(self.url, timeout=1, breakers=self.breakers)
+        for i in range(2):
+            context = client.test_port([])
+            self.assertEqual(context.exception().code, 111)
+        context = client.test_port([])
+        self.assertTrue(isinstance(context.exception(),
+                                   errors.JsonRpcCircuitOpenError))
+        self.assertEqual(context.exception().id, context.request.id)
+        self.assertEqual(context.exception().code, 1001)
+        self.assertEqual(client.pending, {})
+
+        srv = server.JsonRpcServer(('localhost', self.port), TestIface,
+                                   timeout=1)
+        srv.port = self.port
+        try:
+            self.breakers.get(self.url).opened_at -= 60
+            self.assertEqual(client.test_port([]).result(timeout=1),
+                             self.port)
+            self.assertEqual(self.breakers.get(self.url).state,
+                             breaker.CLOSED)
+        finally:
+            srv.close()
+
+    def test_balanced(self):
+        srv = server.JsonRpcServer(('localhost', self.port + 1), TestIface,
+                                   timeout=1)
+        srv.port = self.port + 1
+        try:
+            client = JsonRpcClient([self.url, 'http://localhost:%d' %
+                                    srv.port], timeout=1,
+                                   breakers=self.breakers)
+            results = []
+            for i in range(6):
+                try:
+                    results.append(client.test_port([]).result(timeout=1))
+                except errors.JsonRpcError as error:
+                    results.append(error.code)
+            self.assertEqual(results, [111, srv.port, 111] +
+                                      [srv.port] * 3)
+            self.assertEqual(self.breakers.stats()[0]['state'],
+                             breaker.OPEN)
+        finally:
+            srv.close()
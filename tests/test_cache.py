@@ -0,0 +1,162 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+
+'''
+Provides unit tests for the Json-RPC2 cache.py module.
+'''
+
+import random
+import unittest
+
+from jsonrpc2 import base
+from jsonrpc2 import errors
+from jsonrpc2 import server
+from jsonrpc2.cache import JsonRpcCache
+from jsonrpc2.client import JsonRpcClient, JsonRpcCachedCall
+
+
+class TestIface(server.JsonRpcIface):
+    def test_count(self, *args):
+        self.server.count += 1
+        return self.server.count
+
+    def test_error(self):
+        self.server.count += 1
+        raise errors.JsonRpcError()
+
+
+def request(method='foo', params=None):
+    return base.JsonRpcRequest(method, params)
+
+
+class JsonRpcCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = JsonRpcCache({'foo': 10}, max_entries=2, stale_ttl=5)
+
+    def test_key(self):
+        key = self.cache.key('http://a', request(params={'a': 1, 'b': 2}))
+        self.assertEqual(key, self.cache.key('http://a',
+                                             request(params={'b': 2, 'a': 1})))
+        self.assertNotEqual(key, self.cache.key('http://b',
+                                                request(params={'a': 1,
+                                                                'b': 2})))
+        self.assertNotEqual(self.cache.key('http://a', request(params=[1])),
+                            self.cache.key('http://a', request(params=[2])))
+        self.assertEqual(self.cache.key('http://a',
+                                        request(params=[object()])), None)
+
+    def test_ttl(self):
+        key = self.cache.key('http://a', request())
+        self.assertEqual(self.cache.get(key), None)
+        self.cache.put(key, 'result', now=100)
+        self.assertEqual(self.cache.get(key, now=105).result, 'result')
+        self.assertEqual(self.cache.get(key, now=112).result, 'result')
+        self.assertEqual(self.cache.get(key, now=115), None)
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['stale_hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 2)
+
+    def test_uncached_method(self):
+        key = self.cache.key('http://a', request('bar'))
+        self.cache.put(key, 'result')
+        self.assertEqual(self.cache.ttl('bar'), None)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_lru(self):
+        keys = [self.cache.key('http://a', request(params=[i]))
+                for i in range(3)]
+        self.cache.put(keys[0], 0)
+        self.cache.put(keys[1], 1)
+        self.cache.get(keys[0])
+        self.cache.put(keys[2], 2)
+        self.assertEqual(self.cache.get(keys[1]), None)
+        self.assertEqual(self.cache.get(keys[0]).result, 0)
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_invalidate(self):
+        self.cache.put(self.cache.key('http://a', request()), 'result')
+        self.cache.invalidate('bar')
+        self.assertEqual(len(self.cache), 1)
+        self.cache.invalidate('foo')
+        self.assertEqual(len(self.cache), 0)
+
+
+class ClientCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.server = server.JsonRpcServer(('localhost', self.port),
+                                           TestIface, timeout=1, backlog=8)
+        self.server.count = 0
+        self.cache = JsonRpcCache({'test_count': 60, 'test_error': 60})
+        self.client = JsonRpcClient('http://localhost:%d' % self.port,
+                                    timeout=1, cache=self.cache)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_hit(self):
+        self.assertEqual(self.client.test_count([1]).result(timeout=1), 1)
+        results = []
+        call = self.client.test_count([1], on_result=results.append)
+        self.assertTrue(isinstance(call, JsonRpcCachedCall))
+        self.assertTrue(call.cached)
+        self.assertEqual(results, [])
+        self.assertEqual(call.result(timeout=1), 1)
+        self.assertEqual(results, [1])
+        self.assertEqual(self.client.pending, {})
+        self.assertEqual(self.client.test_count([2]).result(timeout=1), 2)
+        self.assertEqual(self.server.count, 2)
+
+    def test_coalesce(self):
+        calls = [self.client.test_count([1]) for i in range(3)]
+        self.assertEqual(len(self.client.pending), 1)
+        self.assertEqual([call.result(timeout=1) for call in calls],
+                         [1, 1, 1])
+        self.assertEqual(self.cache.coalesced, 2)
+        self.assertEqual(self.cache.inflight, {})
+
+    def test_stale_while_revalidate(self):
+        self.cache.stale_ttl = 60
+        self.assertEqual(self.client.test_count([]).result(timeout=1), 1)
+        for entry in self.cache.entries.values():
+            entry.expires = 0
+        call = self.client.test_count([])
+        self.assertEqual(call.result(), 1)
+        self.assertEqual(len(self.cache.inflight), 1)
+        revalidation = list(self.cache.inflight.values())[0]
+        self.client.test_count([])
+        self.assertEqual(len(self.client.pending), 1)
+        self.assertEqual(revalidation.result(timeout=1), 2)
+        self.assertEqual(self.server.count, 2)
+        self.assertEqual(self.client.test_count([]).result(), 2)
+
+    def test_errors(self):
+        for i in range(2):
+            call = self.client.test_error([])
+            self.assertRaises(errors.JsonRpcError, call.result, 1)
+        self.assertEqual(self.server.count, 2)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_uncached_method(self):
+        self.cache.ttls.pop('test_count')
+        self.assertFalse(isinstance(self.client.test_count([]),
+                                    JsonRpcCachedCall))
@@ -22,14 +22,17 @@ Provides unit tests for the Json-RPC2 client.py module.
 '''
 
 import json
+import time
 import random
 import socket
 import asyncore
 import unittest
 
 from jsonrpc2 import base
+from jsonrpc2 import http
 from jsonrpc2 import client
 from jsonrpc2 import errors
+from jsonrpc2 import server
 
 HTTP_REQ_LINE = 'POST / HTTP/1.1\r\n'
 
@@ -39,6 +42,7 @@ class TestServer(asyncore.dispatcher):
     def __init__(self, host='localhost', port=8080, timeout=1):
         asyncore.dispatcher.__init__(self)
         self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
         self.bind((host, port))
         self.listen(0)
 
@@ -150,6 +154,18 @@ class ClientBasicTest(ClientTestBase):
         self.assertEqual(self._result.id, context.request.id)
         self.assertEqual(self._result.code, 110)
 
+    def test_response_timeout_asyncore_loop(self):
+        self.client.timeout = 0.1
+        self.server.del_channel()
+        context = self.client.foo()
+        deadline = time.time() + 2
+        while not context.done() and time.time() < deadline:
+            # Timers are not run by asyncore.loop().
+            asyncore.loop(timeout=0.05, use_poll=True, count=1)
+        self.assertTrue(context.done())
+        self.assertEqual(context.exception().code, 110)
+        self.assertEqual(self.client.pending, {})
+
     def test_connection_refused(self):
         def on_error(error):
             self._result = error
@@ -218,6 +234,104 @@ Content-Length: %d\r
         self._assert_message(self._request, base.JsonRpcRequest)
         self.assertEqual(self._result, result)
 
+    def test_shared_opener(self):
+        contexts = [client.JsonRpcContext(self.client,
+                                          base.JsonRpcRequest('foo', None))
+                    for i in range(2)]
+        self.assertTrue(contexts[0]._opener is self.client.opener)
+        self.assertTrue(contexts[1]._opener is self.client.opener)
+        processors = self.client.opener.processors['http']
+        self.assertEqual([p.__class__ for p in processors],
+                         [client.JsonRpcProcessor])
+        self.assertEqual(self.client.opener.process_response, {})
+
+    def test_default_opener(self):
+        contexts = [http.HttpRequestContext(self.client.url, '{}')
+                    for i in range(2)]
+        self.assertTrue(isinstance(contexts[0]._opener, http.HttpOpener))
+        self.assertTrue(contexts[0]._opener is contexts[1]._opener)
+        processor = client.JsonRpcProcessor(self.client)
+        context = http.HttpRequestContext(self.client.url, '{}', processor)
+        self.assertTrue(context._opener is not contexts[0]._opener)
+        self.assertTrue(processor in context._opener.processors['http'])
+
+    def test_pending_requests(self):
+        def callback(data):
+            self._request_callback(data)
+            msg = base.JsonRpcResponse(self._request.id, None)
+            return self._format_response(msg)
+
+        self.client.timeout = 1
+        self.server.connect_callback(callback)
+        context = self.client.foo()
+        self.assertTrue(self.client.pending[context.request.id] is context)
+        self.assertTrue(self.client._sweeper is not None)
+        base.loop()
+        self.assertTrue(context.done())
+        self.assertEqual(self.client.pending, {})
+        self.assertEqual(self.client._sweeper, None)
+
+    def test_duplicate_request_id(self):
+        request = base.JsonRpcRequest('foo', None)
+        context = self.client.request(request)
+        errors_ = []
+        duplicate = self.client.request(
+                        base.JsonRpcRequest('bar', None, request.id),
+                        on_error=errors_.append)
+        self.assertTrue(isinstance(errors_[0], errors.JsonRpcDuplicateIdError))
+        self.assertEqual(errors_[0].id, request.id)
+        self.assertTrue(duplicate.exception() is errors_[0])
+        self.assertTrue(self.client.pending[request.id] is context)
+        context.cancel()
+        self.assertEqual(self.client.pending, {})
+
+    def test_sweep_expired(self):
+        def on_error(error):
+            errors_.append(error)
+
+        errors_ = []
+        # A server which never accepts connections
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('localhost', 0))
+        sock.listen(5)
+        self.client.url = 'http://localhost:%d' % sock.getsockname()[1]
+        contexts = []
+        try:
+            for timeout in (10, 0.05, 10):
+                self.client.timeout = timeout
+                contexts.append(self.client.foo(on_error=on_error))
+            base.loop(timeout=0.05, count=4)
+            self.assertEqual([c.done() for c in contexts],
+                             [False, True, False])
+            self.assertEqual([e.code for e in errors_], [110])
+            self.assertEqual(sorted(self.client.pending),
+                             sorted([contexts[0].request.id,
+                                     contexts[2].request.id]))
+        finally:
+            for context in contexts:
+                context.cancel()
+            sock.close()
+        self.assertEqual(self.client.pending, {})
+        self.assertEqual(self.client._sweeper, None)
+
+    def test_request_method_raw_result(self):
+        def callback(data):
+            self._request_callback(data)
+            msg = base.JsonRpcResponse(self._request.id, result)
+            return self._format_response(msg)
+
+        def on_result(result):
+            self._result = result
+
+        result = {'status': 'OK', 'id': 1}
+        self.client.raw_results = True
+        self.server.connect_callback(callback)
+        self.client.foo(on_result=on_result)
+        base.loop()
+        self._assert_message(self._request, base.JsonRpcRequest)
+        self._assert_message(self._result, base.RawJson)
+        self.assertEqual(self._result.value, result)
+
     def test_request_method_error(self):
         def callback(data):
             self._request_callback(data)
@@ -325,3 +439,197 @@ class ClientNotificationTest(ClientTestBase):
         self._assert_message(self._request, base.JsonRpcNotification)
         self.assertEqual(self._request.method, 'foo_dict')
         self.assertEqual(self._request.params, params)
+
+
+class TestConnection(http.HttpConnection):
+    def __init__(self, sock):
+        http.HttpConnection.__init__(self, 'localhost')
+        self.sock = sock
+        self._pool_host = 'localhost'
+
+
+class HttpConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = http.HttpConnectionPool(size=1)
+        self.socks = socket.socketpair()
+        self.connection = TestConnection(self.socks[0])
+
+    def tearDown(self):
+        for sock in self.socks:
+            sock.close()
+
+    def test_reuse(self):
+        self.assertEqual(self.pool.get(TestConnection, 'localhost'), None)
+        self.pool.put(self.connection)
+        self.assertEqual(len(self.pool), 1)
+        self.assertTrue(self.pool.get(TestConnection, 'localhost')
+                        is self.connection)
+        self.assertEqual(self.pool.reused, 1)
+        self.assertEqual(len(self.pool), 0)
+
+    def test_size(self):
+        self.pool.put(self.connection)
+        other = TestConnection(self.socks[1])
+        self.pool.put(other)
+        self.assertEqual(len(self.pool), 1)
+        self.assertEqual(other.sock, None)
+
+    def test_closed_by_server(self):
+        self.pool.put(self.connection)
+        self.socks[1].close()
+        self.assertEqual(self.pool.get(TestConnection, 'localhost'), None)
+        self.assertEqual(self.connection.sock, None)
+
+    def test_idle_timeout(self):
+        self.pool.idle_timeout = 0
+        self.pool.put(self.connection)
+        self.assertEqual(self.pool.get(TestConnection, 'localhost'), None)
+
+
+class TlsSessionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = http.TlsSessionCache(size=2)
+        self.cache.supported = True
+
+    def test_get_missing(self):
+        self.assertEqual(self.cache.get(('localhost', 443)), None)
+
+    def test_put_none(self):
+        self.cache.put(('localhost', 443), None)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_put_unsupported(self):
+        self.cache.supported = False
+        self.cache.put(('localhost', 443), 'session')
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used(self):
+        self.cache.put(('a', 443), 'a')
+        self.cache.put(('b', 443), 'b')
+        self.assertEqual(self.cache.get(('a', 443)), 'a')
+        self.cache.put(('c', 443), 'c')
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get(('b', 443)), None)
+        self.assertEqual(self.cache.get(('a', 443)), 'a')
+        self.assertEqual(self.cache.get(('c', 443)), 'c')
+
+    def test_client_https_handler(self):
+        jsonrpc_client = client.JsonRpcClient('https://localhost')
+        request = base.JsonRpcRequest('foo', None)
+        context = client.JsonRpcContext(jsonrpc_client, request)
+        handlers = [h for h in context._opener.handlers
+                    if isinstance(h, http.HttpsHandler)]
+        self.assertEqual(len(handlers), 1)
+        self.assertTrue(handlers[0]._sessions is jsonrpc_client.tls_sessions)
+
+
+class FanoutIface(server.JsonRpcIface):
+    def shard(self, delay, fail=False):
+        if fail:
+            raise errors.JsonRpcError(message='Shard failed.')
+        if delay is None:
+            return None
+        base.call_later(delay, self._on_result, self.server.port)
+
+
+class ClientFanoutTest(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+        for i in range(3):
+            port = random.randint(10000, 65000)
+            jsonrpc_server = server.JsonRpcServer(('localhost', port),
+                                                  FanoutIface, backlog=8,
+                                                  keep_alive=True)
+            jsonrpc_server.port = port
+            self.servers.append(jsonrpc_server)
+        self.urls = ['http://localhost:%d' % jsonrpc_server.port
+                     for jsonrpc_server in self.servers]
+        self.client = client.JsonRpcClient(self.urls[0], keep_alive=True,
+                                           timeout=5)
+
+    def tearDown(self):
+        for jsonrpc_server in self.servers:
+            for handler in list(jsonrpc_server.connections):
+                handler.close()
+            jsonrpc_server.close()
+        self.client.pool.clear()
+
+    def _params(self, *delays):
+        return dict(zip(self.urls, [[delay] for delay in delays]))
+
+    def test_all(self):
+        merged = []
+        fanout = self.client.fanout('shard', self._params(0.2, 0, 0.1),
+                                    on_result=lambda url, result:
+                                              merged.append(result))
+        results = fanout.result(2)
+        ports = [jsonrpc_server.port for jsonrpc_server in self.servers]
+        self.assertEqual(list(results), [self.urls[1], self.urls[2],
+                                         self.urls[0]])
+        self.assertEqual(merged, [ports[1], ports[2], ports[0]])
+        self.assertEqual(fanout.errors, {})
+        self.assertEqual(fanout.pending, [])
+
+    def test_same_params(self):
+        fanout = self.client.fanout('shard', self.urls, [0])
+        self.assertEqual(sorted(fanout.result(2).values()),
+                         sorted(s.port for s in self.servers))
+        fanout = self.client.fanout('shard', self.urls, [0])
+        fanout.result(2)
+        self.assertTrue(self.client.pool.reused >= 3)
+
+    def test_errors(self):
+        failed = []
+        params = self._params(0, 0, 0)
+        params[self.urls[1]] = [0, True]
+        fanout = self.client.fanout('shard', params,
+                                    on_error=lambda url, error:
+                                             failed.append(url))
+        self.assertEqual(sorted(fanout.result(2)),
+                         sorted([self.urls[0], self.urls[2]]))
+        self.assertEqual(list(fanout.errors), [self.urls[1]])
+        self.assertEqual(failed, [self.urls[1]])
+
+    def test_quorum(self):
+        fanout = self.client.fanout('shard', self._params(0, None, 0),
+                                    quorum=2)
+        self.assertEqual(sorted(fanout.result(2)),
+                         sorted([self.urls[0], self.urls[2]]))
+        self.assertEqual(fanout.pending, [self.urls[1]])
+
+    def test_quorum_failed(self):
+        params = self._params(None, 0, 0)
+        params[self.urls[1]] = params[self.urls[2]] = [0, True]
+        fanout = self.client.fanout('shard', params, quorum=2)
+        with self.assertRaises(errors.JsonRpcQuorumError) as cm:
+            fanout.result(2)
+        self.assertEqual(cm.exception.code, 1002)
+        self.assertEqual(len(cm.exception.data['errors']), 2)
+        self.assertEqual(cm.exception.data['pending'], [self.urls[0]])
+
+    def test_first(self):
+        fanout = self.client.fanout('shard', self._params(None, 0, 0.5),
+                                    first=1)
+        self.assertEqual(list(fanout.result(2)), [self.urls[1]])
+        self.assertEqual(sorted(fanout.pending),
+                         sorted([self.urls[0], self.urls[2]]))
+
+    def test_timeout(self):
+        fanout = self.client.fanout('shard', self._params(0, None, 0),
+                                    timeout=0.3)
+        self.assertEqual(sorted(fanout.result(2)),
+                         sorted([self.urls[0], self.urls[2]]))
+        self.assertEqual(fanout.pending, [self.urls[1]])
+
+    def test_quorum_timeout(self):
+        fanout = self.client.fanout('shard', self._params(0, None, None),
+                                    quorum=2, timeout=0.2)
+        with self.assertRaises(errors.JsonRpcQuorumError):
+            fanout.result(2)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            self.client.fanout('shard', self.urls, quorum=4)
+        with self.assertRaises(ValueError):
+            self.client.fanout('shard', self.urls, quorum=1, first=1)
+        self.assertEqual(self.client.fanout('shard', []).result(), {})
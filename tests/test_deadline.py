@@ -0,0 +1,145 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+
+'''
+Provides unit tests for the Json-RPC2 deadline.py module.
+'''
+
+import time
+import socket
+import random
+import unittest
+
+from jsonrpc2 import base
+from jsonrpc2 import errors
+from jsonrpc2 import server
+from jsonrpc2 import deadline
+from jsonrpc2.client import JsonRpcClient
+from jsonrpc2.future import JsonRpcFuture, Return
+
+
+class TestIface(server.JsonRpcIface):
+    def test_remaining(self):
+        return [deadline.remaining_time(self.deadline),
+                deadline.current_deadline() == self.deadline]
+
+    def test_nested(self, port):
+        client = JsonRpcClient('http://localhost:%d' % port)
+        result = yield client.test_remaining([])
+        raise Return(result + [deadline.current_deadline() == self.deadline])
+
+    def test_hang(self):
+        self.server.called += 1
+        self.server.waiting = JsonRpcFuture()
+        yield self.server.waiting
+
+
+class DeadlineTest(unittest.TestCase):
+    def test_encode(self):
+        self.assertEqual(deadline.encode_deadline(101.5, now=100), '1500')
+        self.assertEqual(deadline.encode_deadline(99, now=100), '0')
+        self.assertEqual(deadline.decode_deadline(' 250 ', now=100), 100.25)
+
+    def test_decode_invalid(self):
+        for value in (None, '', 'soon', '-1', '1.5'):
+            self.assertEqual(deadline.decode_deadline(value), None)
+
+    def test_activate(self):
+        def nested():
+            return deadline.activate_deadline(20, deadline.current_deadline)
+
+        self.assertEqual(deadline.current_deadline(), None)
+        self.assertEqual(deadline.activate_deadline(10, nested), 20)
+        self.assertEqual(deadline.current_deadline(), None)
+        self.assertEqual(deadline.remaining_time(None), None)
+        self.assertEqual(deadline.remaining_time(10, now=12), 0)
+
+
+class ServerDeadlineTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.server = server.JsonRpcServer(('localhost', self.port),
+                                           TestIface, timeout=2, backlog=8)
+        self.server.called = 0
+
+    def tearDown(self):
+        self.server.close()
+
+    def _post(self, data, timeout):
+        sock = socket.create_connection(('localhost', self.port))
+        sock.sendall('POST /RPC2 HTTP/1.1\r\nRequest-Timeout: %s\r\n'
+                     'Content-Length: %d\r\n\r\n%s' % (timeout, len(data),
+                                                       data))
+        base.loop(timeout=0.1, count=5)
+        response = sock.recv(65536)
+        sock.close()
+        return response
+
+    def test_expired(self):
+        request = base.JsonRpcRequest('test_hang', [])
+        response = self._post(request.dumps(), 0)
+        body = response.split('\r\n\r\n', 1)[1]
+        try:
+            base.loads(body, [base.JsonRpcResponse])
+        except errors.JsonRpcError as error:
+            self.assertEqual(error.code, errors.JsonRpcDeadlineError().code)
+        else:
+            self.fail('Expired request not rejected')
+        self.assertEqual(self.server.called, 0)
+
+    def test_iface_deadline(self):
+        client = JsonRpcClient('http://localhost:%d' % self.port, timeout=1)
+        remaining, current = client.test_remaining([]).result(timeout=1)
+        self.assertTrue(0.5 < remaining <= 1)
+        self.assertTrue(current)
+        client = JsonRpcClient('http://localhost:%d' % self.port)
+        self.assertEqual(client.test_remaining([]).result(timeout=1),
+                         [None, True])
+
+    def test_nested(self):
+        client = JsonRpcClient('http://localhost:%d' % self.port, timeout=1)
+        remaining, current, resumed = client.test_nested(
+            [self.port]).result(timeout=1)
+        self.assertTrue(0.5 < remaining <= 1)
+        self.assertTrue(current)
+        self.assertTrue(resumed)
+
+    def test_abort(self):
+        client = JsonRpcClient('http://localhost:%d' % self.port,
+                               timeout=0.2)
+        context = client.test_hang([])
+        self.assertEqual(context.exception(timeout=1).code, 110)
+        start = time.time()
+        while not self.server.waiting.done() and time.time() - start < 1:
+            base.loop(timeout=0.05, count=1)
+        self.assertTrue(self.server.waiting.cancelled())
+
+    def test_expired_inherited(self):
+        client = JsonRpcClient('http://localhost:%d' % self.port)
+        errors_ = []
+        context = deadline.activate_deadline(
+            time.time() - 1, client.test_remaining, [],
+            on_error=errors_.append)
+        self.assertTrue(context.done())
+        self.assertTrue(isinstance(errors_[0], errors.JsonRpcDeadlineError))
+        self.assertEqual(errors_[0].code, -32003)
+        self.assertEqual(errors_[0].id, context.request.id)
+        self.assertEqual(client.pending, {})
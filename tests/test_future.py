@@ -0,0 +1,257 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Provides unit tests for the Json-RPC2 future.py module.
+'''
+
+import unittest
+
+from jsonrpc2 import base
+from jsonrpc2 import future
+
+
+class FutureTest(unittest.TestCase):
+    def setUp(self):
+        self.done = []
+
+    def test_result(self):
+        fut = future.JsonRpcFuture()
+        fut.add_done_callback(self.done.append)
+        self.assertFalse(fut.done())
+        self.assertRaises(RuntimeError, fut.result)
+        fut.set_result(1)
+        fut.set_result(2)
+        self.assertTrue(fut.done())
+        self.assertEqual(fut.result(), 1)
+        self.assertEqual(fut.exception(), None)
+        self.assertEqual(self.done, [fut])
+
+    def test_exception(self):
+        fut = future.JsonRpcFuture()
+        fut.set_exception(ValueError('error'))
+        self.assertRaises(ValueError, fut.result)
+        self.assertTrue(isinstance(fut.exception(), ValueError))
+
+    def test_done_callback(self):
+        fut = future.JsonRpcFuture()
+        fut.set_result(1)
+        fut.add_done_callback(self.done.append)
+        self.assertEqual(self.done, [fut])
+
+    def test_callback_error(self):
+        fut = future.JsonRpcFuture()
+        fut.add_done_callback(lambda f: 1 / 0)
+        fut.add_done_callback(self.done.append)
+        fut.set_result(1)
+        self.assertEqual(self.done, [fut])
+
+    def test_cancel(self):
+        fut = future.JsonRpcFuture(canceller=lambda: self.done.append(0))
+        self.assertTrue(fut.cancel())
+        self.assertFalse(fut.cancel())
+        self.assertTrue(fut.cancelled())
+        self.assertRaises(future.CancelledError, fut.result)
+        self.assertEqual(self.done, [0])
+
+    def test_sleep(self):
+        fut = future.sleep(0.01, 'result')
+        base.loop(count=3)
+        self.assertEqual(fut.result(), 'result')
+        self.assertEqual(base._timers, [])
+
+    def test_sleep_cancel(self):
+        fut = future.sleep(10)
+        fut.cancel()
+        self.assertEqual(base._timers, [])
+
+    def test_result_wait(self):
+        fut = future.sleep(0.01, 'result')
+        self.assertEqual(fut.result(timeout=1), 'result')
+
+    def test_result_timeout(self):
+        fut = future.sleep(10)
+        try:
+            self.assertRaises(future.TimeoutError, fut.result, 0.01)
+            self.assertFalse(fut.done())
+        finally:
+            fut.cancel()
+
+
+class HelpersTest(unittest.TestCase):
+    def test_wait(self):
+        futs = [future.sleep(0.01, 1), future.sleep(10, 2)]
+        try:
+            done, pending = future.wait(futs, timeout=0.05)
+            self.assertEqual(done, set(futs[:1]))
+            self.assertEqual(pending, set(futs[1:]))
+        finally:
+            futs[1].cancel()
+
+    def test_gather(self):
+        futs = [future.sleep(0.02, 1), future.sleep(0.01, 2),
+                future.JsonRpcFuture()]
+        futs[2].set_result(3)
+        self.assertEqual(future.gather(*futs).result(timeout=1), [1, 2, 3])
+        self.assertEqual(future.gather().result(), [])
+
+    def test_gather_error(self):
+        futs = [future.sleep(10), future.JsonRpcFuture()]
+        gathered = future.gather(*futs)
+        futs[1].set_exception(ValueError('error'))
+        self.assertRaises(ValueError, gathered.result)
+        gathered = future.gather(*futs)
+        self.assertTrue(isinstance(gathered.exception(), ValueError))
+        futs[0].cancel()
+
+    def test_gather_cancel(self):
+        futs = [future.sleep(10), future.sleep(10)]
+        gathered = future.gather(*futs)
+        gathered.cancel()
+        self.assertTrue(all(fut.cancelled() for fut in futs))
+        self.assertEqual(base._timers, [])
+
+    def test_as_completed(self):
+        futs = [future.sleep(0.02, 1), future.sleep(0.01, 2),
+                future.sleep(0.03, 3)]
+        results = [fut.result() for fut in future.as_completed(futs, 1)]
+        self.assertEqual(results, [2, 1, 3])
+
+    def test_as_completed_timeout(self):
+        futs = [future.sleep(0.01, 1), future.sleep(10, 2)]
+        results = []
+        try:
+            for fut in future.as_completed(futs, timeout=0.05):
+                results.append(fut.result())
+        except future.TimeoutError:
+            pass
+        else:
+            self.fail('TimeoutError not raised')
+        finally:
+            futs[1].cancel()
+        self.assertEqual(results, [1])
+
+
+class TaskTest(unittest.TestCase):
+    def setUp(self):
+        self.steps = []
+
+    def _coroutine(self, *futures):
+        results = []
+        try:
+            for fut in futures:
+                result = yield fut
+                results.append(result)
+        except future.CancelledError:
+            self.steps.append('cancelled')
+            raise
+        finally:
+            self.steps.append('finally')
+        raise future.Return(results)
+
+    def test_result(self):
+        futures = [future.JsonRpcFuture() for i in range(2)]
+        task = future.JsonRpcTask(self._coroutine(*futures))
+        self.assertFalse(task.done())
+        futures[0].set_result(1)
+        futures[1].set_result(2)
+        self.assertEqual(task.result(), [1, 2])
+        self.assertEqual(self.steps, ['finally'])
+
+    def test_done_futures(self):
+        fut = future.JsonRpcFuture()
+        fut.set_result(1)
+        task = future.JsonRpcTask(self._coroutine(fut, fut))
+        self.assertEqual(task.result(), [1, 1])
+
+    def test_many_done_futures(self):
+        fut = future.JsonRpcFuture()
+        fut.set_result(1)
+        task = future.JsonRpcTask(self._coroutine(*[fut] * 10000))
+        self.assertEqual(task.result(), [1] * 10000)
+        cancelled = future.JsonRpcFuture()
+        cancelled.cancel()
+        task = future.JsonRpcTask(self._coroutine(*[fut] * 10000 +
+                                                  [cancelled]))
+        self.assertTrue(task.cancelled())
+
+    def test_exception(self):
+        def coroutine(fut):
+            try:
+                yield fut
+            except ValueError as err:
+                raise future.Return('handled %s' % err)
+
+        fut = future.JsonRpcFuture()
+        task = future.JsonRpcTask(coroutine(fut))
+        fut.set_exception(ValueError('error'))
+        self.assertEqual(task.result(), 'handled error')
+
+    def test_uncaught_exception(self):
+        def coroutine():
+            yield future.sleep(0)
+            raise KeyError('key')
+
+        task = future.JsonRpcTask(coroutine())
+        base.loop(count=2)
+        self.assertTrue(isinstance(task.exception(), KeyError))
+
+    def test_invalid_await(self):
+        def coroutine():
+            yield 'invalid'
+
+        task = future.JsonRpcTask(coroutine())
+        self.assertTrue(isinstance(task.exception(), TypeError))
+
+    def test_generator_result(self):
+        def coroutine():
+            if False:
+                yield
+        task = future.JsonRpcTask(coroutine())
+        self.assertEqual(task.result(), None)
+
+    def test_cancel(self):
+        fut = future.JsonRpcFuture()
+        task = future.JsonRpcTask(self._coroutine(fut))
+        self.assertTrue(task.cancel())
+        self.assertTrue(task.cancelled())
+        self.assertTrue(fut.cancelled())
+        self.assertEqual(self.steps, ['cancelled', 'finally'])
+        self.assertFalse(task.cancel())
+
+    def test_cancel_nested(self):
+        fut = future.JsonRpcFuture()
+        inner = future.JsonRpcTask(self._coroutine(fut))
+        outer = future.JsonRpcTask(self._coroutine(inner))
+        outer.cancel()
+        self.assertTrue(inner.cancelled())
+        self.assertTrue(fut.cancelled())
+        self.assertEqual(self.steps, ['cancelled', 'finally'] * 2)
+
+    def test_cancel_itself(self):
+        def coroutine():
+            yield future.sleep(0)
+            tasks[0].cancel()
+            yield future.sleep(10)
+
+        tasks = [future.JsonRpcTask(coroutine())]
+        base.loop(count=2)
+        self.assertTrue(tasks[0].cancelled())
+        self.assertEqual(base._timers, [])
@@ -0,0 +1,108 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Provides unit tests for the Json-RPC2 logger.py module.
+'''
+
+import logging
+import unittest
+
+from jsonrpc2 import logger
+
+
+class CaptureHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class Unprintable(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return 'unprintable'
+
+    __repr__ = __str__
+
+
+class LoggerTest(unittest.TestCase):
+    def setUp(self):
+        logger.setup()
+        self.handler = CaptureHandler()
+        self.level = logger._logger.level
+        self.handlers = logger._logger.handlers
+        logger._logger.handlers = [self.handler]
+
+    def tearDown(self):
+        logger._logger.handlers = self.handlers
+        logger.configure(self.level)
+
+    def test_disabled_is_fake(self):
+        logger.configure(logging.INFO)
+        self.assertTrue(logger.debug is logger._log)
+        self.assertFalse(logger.info is logger._log)
+        self.assertFalse(logger.enabled(logging.DEBUG))
+
+    def test_deferred_formatting(self):
+        value = Unprintable()
+        logger.configure(logging.INFO)
+        logger.debug('Value: %s', value)
+        self.assertEqual(value.calls, 0)
+        self.assertEqual(self.handler.messages, [])
+
+        logger.configure(logging.DEBUG)
+        logger.debug('Value: %s', value)
+        self.assertEqual(value.calls, 1)
+        self.assertEqual(self.handler.messages, ['Value: unprintable'])
+
+    def test_truncated_payload(self):
+        logger.configure(logging.DEBUG, max_payload=10)
+        logger.debug('Loads message: %s', 'x' * 100)
+        logger.debug('Dumps message: %s', {'params': list(range(1000))})
+        logger.debug('Short: %s', 'abc')
+        loads, dumps, short = self.handler.messages
+        self.assertEqual(loads, 'Loads message: %s...' % ('x' * 10))
+        self.assertEqual(len(dumps), len('Dumps message: ') + 13)
+        self.assertEqual(short, 'Short: abc')
+
+    def test_truncated_mapping(self):
+        logger.configure(logging.DEBUG, max_payload=3)
+        logger.debug('Mapping: %(a)s', {'a': 'abcdef'})
+        self.assertEqual(self.handler.messages, ['Mapping: abcdef'])
+
+    def test_truncated_info(self):
+        logger.configure(logging.DEBUG, max_payload=3)
+        logger.info('Info: %s', 'abcdef')
+        self.assertEqual(self.handler.messages, ['Info: abcdef'])
+
+    def test_sampled_debug(self):
+        logger.configure(logging.DEBUG, sample=3)
+        for i in range(7):
+            logger.debug('Message: %d', i)
+        logger.info('Info')
+        self.assertEqual(self.handler.messages,
+                         ['Message: 2', 'Message: 5', 'Info'])
+
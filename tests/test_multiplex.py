@@ -0,0 +1,258 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''
+Provides unit tests for the Json-RPC2 multiplex.py module.
+'''
+
+import time
+import errno
+import socket
+import random
+import unittest
+
+from jsonrpc2 import base
+from jsonrpc2 import errors
+from jsonrpc2 import server
+from jsonrpc2 import resolver
+from jsonrpc2.client import JsonRpcClient
+
+
+class TestIface(server.JsonRpcIface):
+    def test_delay(self, delay, value):
+        base.call_later(delay, self._on_result, value)
+
+    def test_hold(self, value):
+        self.server.held.append((value, self._on_result))
+
+    def test_note(self, value):
+        self.server.notes.append(value)
+
+    def test_subscribe(self):
+        return self._subscribe('topic')
+
+
+class SlowDnsCache(resolver.DnsCache):
+    '''
+    A DNS cache resolving hosts to the given ports of the loopback address.
+    '''
+    def __init__(self, ports, delay=0):
+        resolver.DnsCache.__init__(self)
+        self.ports = ports
+        self.delay = delay
+
+    def _resolve(self, host, port):
+        time.sleep(self.delay)
+        if not self.ports:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name not known')
+        return sum([socket.getaddrinfo('127.0.0.1', port, socket.AF_INET,
+                                       socket.SOCK_STREAM)
+                    for port in self.ports], [])
+
+
+class MultiplexTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.url = 'http://localhost:%d' % self.port
+        self.server = server.JsonRpcServer(('localhost', self.port),
+                                           TestIface, backlog=8)
+        self.server.held = []
+        self.server.notes = []
+        self.client = JsonRpcClient(self.url, multiplexed=True, timeout=5)
+
+    def tearDown(self):
+        for stream in list(self.client.streams.values()):
+            stream.close()
+        for handler in list(self.server.connections):
+            handler.close()
+        self.server.close()
+
+    def _loop(self, condition, timeout=2):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            base.loop(0.01, count=1)
+        self.assertTrue(condition())
+
+    def _release(self):
+        held, self.server.held = self.server.held, []
+        for value, on_result in held:
+            on_result(value)
+
+    def test_out_of_order(self):
+        done = []
+        slow = self.client.test_delay([0.3, 'slow'], on_result=done.append)
+        fast = self.client.test_delay([0.0, 'fast'], on_result=done.append)
+        self.assertEqual(slow.result(2), 'slow')
+        self.assertEqual(fast.result(2), 'fast')
+        self.assertEqual(done, ['fast', 'slow'])
+        self.assertEqual(len(self.client.streams), 1)
+        self.assertEqual(self.server.stats()['accepted'], 1)
+        self.assertEqual(self.client.pending, {})
+
+    def test_max_in_flight(self):
+        self.client.max_in_flight = 2
+        contexts = [self.client.test_hold([i]) for i in range(5)]
+        stream = self.client.streams[self.url]
+        self._loop(lambda: len(self.server.held) == 2)
+        self.assertEqual(stream.stats()['queued'], 3)
+        while not all(context.done() for context in contexts):
+            self._release()
+            base.loop(0.01, count=1)
+        self.assertEqual([context.result() for context in contexts],
+                         list(range(5)))
+        self.assertEqual(stream.stats()['peak'], 2)
+        self.assertEqual(stream.stats()['in_flight'], 0)
+
+    def test_error(self):
+        context = self.client.test_missing([])
+        with self.assertRaises(errors.JsonRpcError) as cm:
+            context.result(2)
+        self.assertEqual(cm.exception.code, -32601)
+        self.assertEqual(cm.exception.id, context.request.id)
+        context = self.client.test_subscribe([])
+        with self.assertRaises(errors.JsonRpcError) as cm:
+            context.result(2)
+        self.assertEqual(self.server.publisher.subscribers('topic'), 0)
+
+    def test_error_without_id(self):
+        context = self.client.test_hold([1])
+        self._loop(lambda: self.server.held)
+        for handler in list(self.server.connections):
+            handler.send_frame('{"jsonrpc": "2.0", "id": null, "error": '
+                               '{"code": -32700, "message": "Parse error."}}')
+        with self.assertRaises(errors.JsonRpcError) as cm:
+            context.result(2)
+        self.assertEqual(cm.exception.code, -32700)
+        self.assertEqual(self.client.streams, {})
+
+    def test_result_without_id(self):
+        context = self.client.test_hold([1])
+        self._loop(lambda: self.server.held)
+        for handler in list(self.server.connections):
+            handler.send_frame('{"jsonrpc": "2.0", "id": null, "result": 1}')
+        with self.assertRaises(errors.JsonRpcProtocolError) as cm:
+            context.result(2)
+        self.assertEqual(cm.exception.code, errno.EPROTO)
+        self.assertEqual(cm.exception.message, 'Response without ID')
+        self.assertEqual(self.client.streams, {})
+
+    def test_notification(self):
+        self.client.notify(base.JsonRpcNotification('test_note', ['a']))
+        self.assertEqual(self.client.test_delay([0, 'b']).result(2), 'b')
+        self.assertEqual(self.server.notes, ['a'])
+
+    def test_connection_lost(self):
+        context = self.client.test_hold([1])
+        self._loop(lambda: self.server.held)
+        for handler in list(self.server.connections):
+            handler.close()
+        with self.assertRaises(errors.JsonRpcProtocolError):
+            context.result(2)
+        self.assertEqual(self.client.streams, {})
+        self.assertEqual(self.client.test_delay([0, 2]).result(2), 2)
+        self.assertEqual(self.server.stats()['accepted'], 2)
+
+    def test_idle_stream_closed(self):
+        self.assertEqual(self.client.test_delay([0, 1]).result(2), 1)
+        stream = self.client.streams[self.url]
+        for handler in list(self.server.connections):
+            handler.close()
+        self.assertEqual(self.client.test_delay([0, 2]).result(2), 2)
+        self.assertIsNot(self.client.streams[self.url], stream)
+
+    def test_expired(self):
+        self.client.timeout = 0.1
+        self.client.max_in_flight = 1
+        held = self.client.test_hold([1])
+        self.client.timeout = 2
+        queued = self.client.test_delay([0, 2])
+        with self.assertRaises(errors.JsonRpcProtocolError):
+            held.result(2)
+        self.assertEqual(queued.result(2), 2)
+
+    def test_not_upgraded(self):
+        self.server.multiplexing = False
+        context = self.client.test_delay([0, 1])
+        with self.assertRaises(errors.JsonRpcProtocolError):
+            context.result(2)
+
+    def test_drain(self):
+        context = self.client.test_hold([1])
+        self._loop(lambda: self.server.held)
+        self.server.drain(timeout=5)
+        self.assertEqual(len(self.server.connections), 1)
+        self._release()
+        self.assertEqual(context.result(2), 1)
+        self._loop(lambda: not self.server.connections)
+        self.assertEqual(self.server.abandoned, [])
+
+    def test_drain_shed(self):
+        held = self.client.test_hold([1])
+        self._loop(lambda: self.server.held)
+        self.server.drain(timeout=5)
+        shed = self.client.test_delay([0, 2])
+        with self.assertRaises(errors.JsonRpcError) as cm:
+            shed.result(2)
+        self.assertEqual(cm.exception.code, -32001)
+        self.assertEqual(cm.exception.id, shed.request.id)
+        self.assertFalse(held.done())
+        self._release()
+        self.assertEqual(held.result(2), 1)
+        self._loop(lambda: not self.server.connections)
+
+    def test_resolved_in_background(self):
+        dns_cache = SlowDnsCache([self.port], delay=0.3)
+        client = JsonRpcClient('http://jsonrpc.test:%d' % self.port,
+                               multiplexed=True, dns_cache=dns_cache)
+        start = time.time()
+        context = client.test_delay([0, 1])
+        self.assertTrue(time.time() - start < 0.2)
+        stream = client.streams['http://jsonrpc.test:%d' % self.port]
+        self.assertEqual(stream.stats()['queued'], 1)
+        self.assertEqual(context.result(2), 1)
+        stream.close()
+
+    def test_next_address(self):
+        dns_cache = SlowDnsCache([self.port + 1, self.port])
+        client = JsonRpcClient('http://jsonrpc.test:%d' % self.port,
+                               multiplexed=True, dns_cache=dns_cache)
+        self.assertEqual(client.test_delay([0, 1]).result(2), 1)
+        for stream in list(client.streams.values()):
+            stream.close()
+
+    def test_not_resolved(self):
+        client = JsonRpcClient('http://jsonrpc.test:%d' % self.port,
+                               multiplexed=True, dns_cache=SlowDnsCache([]))
+        with self.assertRaises(errors.JsonRpcProtocolError):
+            client.test_delay([0, 1]).result(2)
+        self.assertEqual(client.streams, {})
+
+    def test_connection_refused(self):
+        client = JsonRpcClient('http://127.0.0.1:%d' % (self.port + 1),
+                               multiplexed=True)
+        with self.assertRaises(errors.JsonRpcProtocolError) as cm:
+            client.test_delay([0, 1]).result(2)
+        self.assertEqual(cm.exception.code, errno.ECONNREFUSED)
+        self.assertEqual(client.streams, {})
+
+    def test_https_rejected(self):
+        client = JsonRpcClient('https://localhost:%d' % self.port,
+                               multiplexed=True)
+        with self.assertRaises(ValueError):
+            client.test_delay([0, 1])
@@ -0,0 +1,159 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Provides unit tests for the Json-RPC2 profiler.py module.
+'''
+
+import os
+import time
+import pstats
+import random
+import shutil
+import socket
+import tempfile
+import unittest
+
+from jsonrpc2 import base
+from jsonrpc2 import server
+from jsonrpc2 import profiler
+
+
+class TestIface(server.JsonRpcIface):
+    def test_result(self, a):
+        return {'a': a}
+
+    def test_busy(self, seconds):
+        end = time.time() + seconds
+        while time.time() < end:
+            pass
+        return seconds
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_sample_every(self):
+        prof = profiler.JsonRpcProfiler(every=3)
+        samples = [prof.sample() for i in range(6)]
+        self.assertEqual([s is not None for s in samples],
+                         [False, False, True, False, False, True])
+        self.assertEqual(prof.requests, 6)
+
+    def test_sample_disabled(self):
+        prof = profiler.JsonRpcProfiler(every=0)
+        self.assertEqual(prof.sample(), None)
+
+    def test_collect(self):
+        prof = profiler.JsonRpcProfiler(every=1)
+        for i in range(2):
+            profile = prof.sample()
+            prof.run(profile, sorted, [3, 2, 1])
+            prof.collect(profile, 'foo')
+        self.assertEqual(prof.methods(), ['foo'])
+        self.assertEqual(prof.profiled, 2)
+        self.assertTrue(isinstance(prof.stats('foo'), pstats.Stats))
+        self.assertEqual(prof.stats('bar'), None)
+
+    def test_nested_run(self):
+        prof = profiler.JsonRpcProfiler(every=1)
+        outer, inner = prof.sample(), prof.sample()
+        result = prof.run(outer, prof.run, inner, sum, [1, 2])
+        self.assertEqual(result, 3)
+
+    def test_sample_stack(self):
+        prof = profiler.JsonRpcProfiler()
+        prof._sample_stack(None, None)
+        self.assertEqual(prof.methods(), [profiler.NO_METHOD])
+
+
+class ServerProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.server = server.JsonRpcServer(('localhost', self.port),
+                                           TestIface, timeout=1)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.dir)
+
+    def _call(self, method, params):
+        client = socket.create_connection(('localhost', self.port), 1)
+        data = base.JsonRpcRequest(method, params).dumps()
+        client.send('POST / HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s'
+                    % (len(data), data))
+        base.loop(count=3)
+        data = client.recv(64 * 1024)
+        client.close()
+        return data
+
+    def test_profiler_off(self):
+        self.assertTrue(self._call('test_result', [1])
+                        .startswith('HTTP/1.1 200 OK'))
+
+    def test_profile_every_request(self):
+        self.server.profiler = profiler.JsonRpcProfiler(every=2)
+        for i in range(4):
+            self._call('test_result', [i])
+        self._call('unknown', [])
+        self._call('unknown', [])
+        prof = self.server.profiler
+        self.assertEqual(prof.requests, 6)
+        self.assertEqual(prof.profiled, 3)
+        self.assertEqual(prof.methods(), ['test_result', 'unknown'])
+        paths = prof.dump_stats(self.dir)
+        self.assertEqual(sorted(os.listdir(self.dir)),
+                         ['test_result.prof', 'unknown.prof'])
+        stats = pstats.Stats(paths[0])
+        functions = [func[2] for func in stats.stats]
+        self.assertTrue('loads' in functions)
+        self.assertTrue('dumps' in functions)
+
+    def test_profile_pipelined(self):
+        self.server.keep_alive = True
+        self.server.profiler = prof = profiler.JsonRpcProfiler(every=1)
+        client = socket.create_connection(('localhost', self.port), 1)
+        client.send(''.join(
+            'POST / HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s' % (len(data),
+                                                                  data)
+            for data in [base.JsonRpcRequest('test_result', [i]).dumps()
+                         for i in range(2)]))
+        for i in range(20):
+            if prof.profiled == 2:
+                break
+            base.loop(timeout=0.05, count=1)
+        client.close()
+        self.assertEqual(prof.requests, 2)
+        self.assertEqual(prof.profiled, 2)
+
+    def test_sample_stacks(self):
+        self.server.profiler = prof = profiler.JsonRpcProfiler(every=0)
+        prof.start(0.001)
+        try:
+            self._call('test_busy', [0.2])
+        finally:
+            prof.stop()
+        self.assertTrue(prof.stacks('test_busy'))
+        path = os.path.join(self.dir, 'stacks.txt')
+        prof.dump_stacks(path)
+        with open(path) as fp:
+            lines = fp.read().splitlines()
+        self.assertTrue(any(line.startswith('test_busy;') and
+                            'test_busy (test_profiler.py' in line
+                            for line in lines))
@@ -0,0 +1,177 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Provides unit tests for the Json-RPC2 pubsub.py module.
+'''
+
+import json
+import random
+import socket
+import unittest
+
+from jsonrpc2 import base
+from jsonrpc2 import server
+from jsonrpc2 import pubsub
+
+
+class TestIface(server.JsonRpcIface):
+    def watch(self, topic):
+        self._subscribe(topic)
+
+    def watch_returned(self, topic):
+        return self._subscribe(topic)
+
+
+class PublisherTest(unittest.TestCase):
+    def setUp(self):
+        self.publisher = pubsub.JsonRpcPublisher()
+
+    def test_publish_no_subscribers(self):
+        self.assertEqual(self.publisher.publish('foo', [1]), 0)
+
+    def test_publish_shared_chunk(self):
+        first = self.publisher.subscribe('foo')
+        second = self.publisher.subscribe('foo')
+        self.assertEqual(self.publisher.publish('foo', [1]), 2)
+        self.assertTrue(first.queue[0] is second.queue[0])
+        data = first.queue[0].split('\r\n')[1]
+        self.assertEqual(json.loads(data), {'jsonrpc': base.SPEC_VER,
+                                            'method': 'foo',
+                                            'params': [1]})
+
+    def test_unsubscribe(self):
+        subscription = self.publisher.subscribe('foo')
+        subscription.close()
+        self.assertEqual(self.publisher.subscribers('foo'), 0)
+        self.assertEqual(self.publisher.publish('foo', [1]), 0)
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, self.publisher.subscribe, 'foo', 'bar')
+
+    def _publish(self, policy, count=5):
+        subscription = self.publisher.subscribe('foo', policy, max_queued=2)
+        for i in range(count):
+            self.publisher.publish('foo', [i])
+        return subscription
+
+    def _params(self, subscription):
+        return [json.loads(chunk.split('\r\n')[1])['params'][0]
+                for chunk in subscription.queue]
+
+    def test_policy_drop(self):
+        subscription = self._publish(pubsub.POLICY_DROP)
+        self.assertEqual(self._params(subscription), [0, 1])
+        self.assertEqual(subscription.dropped, 3)
+
+    def test_policy_drop_oldest(self):
+        subscription = self._publish(pubsub.POLICY_DROP_OLDEST)
+        self.assertEqual(self._params(subscription), [3, 4])
+        self.assertEqual(subscription.dropped, 3)
+
+    def test_policy_coalesce(self):
+        subscription = self._publish(pubsub.POLICY_COALESCE)
+        self.assertEqual(self._params(subscription), [4])
+        self.assertEqual(subscription.dropped, 4)
+
+    def test_policy_close(self):
+        subscription = self._publish(pubsub.POLICY_CLOSE)
+        self.assertTrue(subscription.closed)
+        self.assertEqual(self.publisher.subscribers('foo'), 0)
+
+    def test_max_bytes(self):
+        subscription = self.publisher.subscribe('foo', pubsub.POLICY_DROP,
+                                                max_bytes=1)
+        self.publisher.publish('foo', [1])
+        self.publisher.publish('foo', [2])
+        self.assertEqual(len(subscription.queue), 1)
+        self.assertEqual(subscription.dropped, 1)
+
+
+class ServerPubSubTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.server = server.JsonRpcServer(('localhost', self.port),
+                                           TestIface, timeout=0.2)
+
+    def tearDown(self):
+        self.server.close()
+
+    def _subscribe(self, topic='foo', method='watch'):
+        client = socket.create_connection(('localhost', self.port), 1)
+        data = '{"jsonrpc": "2.0", "id": "1", "method": "%s", ' \
+               '"params": ["%s"]}' % (method, topic)
+        client.send('POST / HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s'
+                    % (len(data), data))
+        base.loop(count=3)
+        return client
+
+    def _read_chunks(self, client):
+        data = client.recv(64 * 1024)
+        headers, body = data.split('\r\n\r\n', 1)
+        chunks = []
+        while body:
+            size, body = body.split('\r\n', 1)
+            size = int(size, 16)
+            chunks.append(body[:size])
+            body = body[size + 2:]
+        return headers, chunks
+
+    def test_subscribe_and_publish(self):
+        client = self._subscribe()
+        self.assertEqual(self.server.publisher.subscribers('foo'), 1)
+        self.assertEqual(self.server.publish('foo', {'a': 1}), 1)
+        self.assertEqual(self.server.publish('bar', {'a': 2}), 0)
+        base.loop(count=3)
+        headers, chunks = self._read_chunks(client)
+        client.close()
+        self.assertTrue('Transfer-Encoding: chunked' in headers)
+        response = base.loads(chunks[0], [base.JsonRpcResponse])
+        self.assertEqual(response.id, '1')
+        notification = base.loads(chunks[1], [base.JsonRpcNotification])
+        self.assertEqual(notification.method, 'foo')
+        self.assertEqual(notification.params, {'a': 1})
+
+    def test_subscribe_returned(self):
+        client = self._subscribe(method='watch_returned')
+        self.assertEqual(self.server.publish('foo', {'a': 1}), 1)
+        base.loop(count=3)
+        headers, chunks = self._read_chunks(client)
+        client.close()
+        self.assertEqual(len(chunks), 2)
+        response = base.loads(chunks[0], [base.JsonRpcResponse])
+        self.assertEqual(response.id, '1')
+        notification = base.loads(chunks[1], [base.JsonRpcNotification])
+        self.assertEqual(notification.params, {'a': 1})
+
+    def test_subscriber_close(self):
+        client = self._subscribe()
+        client.close()
+        base.loop(count=3)
+        self.assertEqual(self.server.publisher.subscribers('foo'), 0)
+
+    def test_server_close_subscription(self):
+        client = self._subscribe()
+        self.server.publisher.close()
+        base.loop(count=3)
+        headers, chunks = self._read_chunks(client)
+        self.assertEqual(chunks[-1], '')
+        self.assertEqual(client.recv(1024), '')
+        client.close()
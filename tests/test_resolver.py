@@ -0,0 +1,184 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+
+'''
+Provides unit tests for the Json-RPC2 resolver.py module.
+'''
+
+import time
+import socket
+import random
+import asyncore
+import unittest
+
+from jsonrpc2 import base
+from jsonrpc2 import errors
+from jsonrpc2 import server
+from jsonrpc2 import resolver
+from jsonrpc2.client import JsonRpcClient
+
+
+class TestIface(server.JsonRpcIface):
+    def test_port(self):
+        return self.server.port
+
+
+class TestDnsCache(resolver.DnsCache):
+    '''
+    A DNS cache resolving hosts of a static table.
+    '''
+    def __init__(self, hosts, delay=0, **kwargs):
+        resolver.DnsCache.__init__(self, **kwargs)
+        self.hosts = hosts
+        self.delay = delay
+        self.resolved = []
+
+    def _resolve(self, host, port):
+        self.resolved.append(host)
+        time.sleep(self.delay)
+        if host not in self.hosts:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name not known')
+        return socket.getaddrinfo(self.hosts[host], port, 0,
+                                  socket.SOCK_STREAM)
+
+
+class DnsCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = TestDnsCache({'a': '127.0.0.1', 'b': '127.0.0.2'},
+                                  ttl=60, negative_ttl=5, stale_ttl=60)
+
+    def test_resolve(self):
+        future = self.cache.resolve('a', 80)
+        self.assertFalse(future.done())
+        self.assertTrue(self.cache.resolve('a', 80) is future)
+        addresses = future.result(timeout=1)
+        self.assertEqual(addresses[0][4], ('127.0.0.1', 80))
+        self.assertEqual(self.cache.cached('a', 80), addresses)
+        self.assertTrue(self.cache.resolve('a', 80).done())
+        self.assertEqual(self.cache.resolved, ['a'])
+        self.assertFalse(self.cache._waker._fileno in asyncore.socket_map)
+
+    def test_negative(self):
+        self.cache.resolve('c', 80).result(timeout=1)
+        self.assertRaises(socket.gaierror, self.cache.cached, 'c', 80)
+        self.assertTrue(self.cache.resolve('c', 80).done())
+        self.cache.entries[('c', 80)].expires = 0
+        self.assertEqual(self.cache.cached('c', 80), None)
+        self.assertEqual(self.cache.stats()['failures'], 1)
+
+    def test_stale(self):
+        addresses = self.cache.resolve('a', 80).result(timeout=1)
+        self.cache.entries[('a', 80)].expires = time.time() - 1
+        self.assertEqual(self.cache.cached('a', 80), addresses)
+        future = self.cache.pending[('a', 80)]
+        self.cache.hosts.pop('a')
+        future.result(timeout=1)
+        # Failures do not replace stale addresses.
+        self.assertEqual(self.cache.cached('a', 80), addresses)
+        self.cache.entries[('a', 80)].expires = time.time() - 61
+        self.assertEqual(self.cache.cached('a', 80), None)
+
+    def test_ip_address(self):
+        self.assertTrue(self.cache.resolve('127.0.0.1', 80).done())
+        self.assertTrue(self.cache.resolve('::1', 80).done())
+        self.assertEqual(self.cache.resolved, [])
+
+    def test_max_entries(self):
+        self.cache.max_entries = 1
+        self.cache.store(('a', 80), [], now=10)
+        self.cache.store(('b', 80), [], now=20)
+        self.assertEqual(list(self.cache.entries), [('b', 80)])
+
+    def test_url_address(self):
+        self.assertEqual(resolver.url_address('http://a/RPC2'), ('a', 80))
+        self.assertEqual(resolver.url_address('https://a:8443'),
+                         ('a', 8443))
+
+
+class ClientDnsCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.server = server.JsonRpcServer(('', self.port), TestIface,
+                                           timeout=1, backlog=8,
+                                           keep_alive=True)
+        self.server.port = self.port
+        self.cache = TestDnsCache({'a': '127.0.0.1', 'b': '127.0.0.2'})
+
+    def tearDown(self):
+        self.server.close()
+
+    def _client(self, host='a', **kwargs):
+        return JsonRpcClient('http://%s:%d' % (host, self.port), timeout=1,
+                             dns_cache=self.cache, **kwargs)
+
+    def test_request(self):
+        self.cache.delay = 0.2
+        client = self._client()
+        start = time.time()
+        context = client.test_port([])
+        self.assertTrue(time.time() - start < 0.1)
+        self.assertFalse(context.done())
+        self.assertEqual(context.result(timeout=1), self.port)
+        self.assertEqual(client.test_port([]).result(timeout=1), self.port)
+        self.assertEqual(self.cache.resolved, ['a'])
+
+    def test_unknown_host(self):
+        client = self._client('c')
+        error = client.test_port([]).exception(timeout=1)
+        self.assertTrue(isinstance(error, errors.JsonRpcProtocolError))
+        self.assertEqual(error.code, socket.EAI_NONAME)
+
+    def test_cancel_resolving(self):
+        self.cache.delay = 0.1
+        client = self._client()
+        context = client.test_port([])
+        context.cancel()
+        self.cache.pending[('a', self.port)].result(timeout=1)
+        self.assertTrue(context._response is None)
+
+    def test_notification(self):
+        client = self._client()
+        client.notifier = True
+        context = client.test_port([])
+        context.result(timeout=1)
+        self.assertEqual(self.cache.resolved, ['a'])
+
+    def test_moved_host(self):
+        client = self._client(blocking=True)
+        self.assertEqual(client.test_port([]), self.port)
+        self.cache.store(('a', self.port), socket.getaddrinfo(
+            '127.0.0.2', self.port, 0, socket.SOCK_STREAM))
+        self.assertEqual(client.test_port([]), self.port)
+        self.assertEqual(self.server.stats()['accepted'], 2)
+        self.assertEqual(client.test_port([]), self.port)
+        self.assertEqual(self.server.stats()['accepted'], 2)
+        client.pool.clear()
+
+    def test_balancer_prefetch(self):
+        client = JsonRpcClient(['http://a:%d' % self.port,
+                                'http://b:%d' % self.port],
+                               timeout=1, dns_cache=self.cache)
+        self.assertEqual(sorted(self.cache.pending),
+                         [('a', self.port), ('b', self.port)])
+        client.balancer.update(['http://a:%d' % self.port,
+                                'http://c:%d' % self.port])
+        self.assertEqual(len(self.cache.pending), 3)
+        self.assertEqual(client.test_port([]).result(timeout=1), self.port)
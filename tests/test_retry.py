@@ -0,0 +1,186 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+
+'''
+Provides unit tests for the Json-RPC2 retry.py module.
+'''
+
+import time
+import random
+import unittest
+
+from jsonrpc2 import base
+from jsonrpc2 import errors
+from jsonrpc2 import server
+from jsonrpc2 import retry
+from jsonrpc2.client import JsonRpcClient, JsonRpcCall
+
+
+class TestIface(server.JsonRpcIface):
+    def test_port(self):
+        if not self.server.delay:
+            return self.server.port
+        base.call_later(self.server.delay, self._on_result, self.server.port)
+
+    def test_error(self):
+        raise errors.JsonRpcError()
+
+
+class RetryBudgetTest(unittest.TestCase):
+    def test_withdraw(self):
+        budget = retry.RetryBudget(ratio=0.5, min_per_second=0, capacity=2)
+        self.assertTrue(budget.withdraw())
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        self.assertTrue(budget.withdraw())
+        self.assertEqual((budget.withdrawn, budget.rejected), (3, 2))
+
+    def test_capacity(self):
+        budget = retry.RetryBudget(ratio=1, min_per_second=0, capacity=1)
+        for i in range(5):
+            budget.deposit()
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+
+    def test_refill(self):
+        budget = retry.RetryBudget(ratio=0, min_per_second=10, capacity=1)
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        budget._refilled -= 0.1
+        self.assertTrue(budget.withdraw())
+
+    def test_retryable(self):
+        refused = errors.JsonRpcProtocolError(111, 'Connection refused')
+        timeout = errors.JsonRpcProtocolError(110, 'Connection timed out')
+        not_found = errors.JsonRpcProtocolError(404, 'Not Found')
+        self.assertTrue(retry.is_retryable(refused))
+        self.assertFalse(retry.is_retryable(timeout))
+        self.assertTrue(retry.is_retryable(timeout, idempotent=True))
+        self.assertFalse(retry.is_retryable(not_found, idempotent=True))
+        self.assertFalse(retry.is_retryable(errors.JsonRpcError(), True))
+
+
+class HedgePolicyTest(unittest.TestCase):
+    def test_delay(self):
+        stats = retry.MethodStats()
+        policy = retry.HedgePolicy(delay=0.1, percentile=90, min_samples=10)
+        self.assertEqual(policy.hedge_delay(stats), 0.1)
+        stats.latencies.extend(i / 100.0 for i in range(1, 11))
+        self.assertEqual(policy.hedge_delay(stats), 0.09)
+        policy = retry.HedgePolicy(percentile=50, min_samples=20)
+        self.assertEqual(policy.hedge_delay(stats), None)
+        self.assertRaises(ValueError, retry.HedgePolicy)
+
+    def test_stats(self):
+        stats = retry.MethodStats(samples=3)
+        self.assertEqual(stats.percentile(50), None)
+        stats.latencies.extend([4, 1, 3, 2])
+        self.assertEqual((stats.percentile(0), stats.percentile(100)), (1, 3))
+        stats.requests, stats.retries, stats.hedges = 4, 1, 2
+        self.assertEqual(stats.stats()['retry_rate'], 0.25)
+        self.assertEqual(stats.stats()['hedge_rate'], 0.5)
+
+
+class ClientRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.servers = []
+        for port in (self.port, self.port + 1):
+            srv = server.JsonRpcServer(('localhost', port), TestIface,
+                                       timeout=2, backlog=8)
+            srv.port = port
+            srv.delay = None
+            self.servers.append(srv)
+        self.urls = ['http://localhost:%d' % port
+                     for port in (self.port, self.port + 1)]
+
+    def tearDown(self):
+        for srv in self.servers:
+            srv.close()
+
+    def test_plain_client(self):
+        client = JsonRpcClient(self.urls[0], timeout=1)
+        self.assertFalse(isinstance(client.test_port([]), JsonRpcCall))
+
+    def test_retry_refused(self):
+        self.servers[0].close()
+        client = JsonRpcClient(self.urls, timeout=1,
+                               retry_budget=retry.RetryBudget())
+        call = client.test_port([])
+        self.assertTrue(isinstance(call, JsonRpcCall))
+        self.assertEqual(call.result(timeout=2), self.port + 1)
+        self.assertEqual(len(call.attempts), 2)
+        self.assertEqual(call.attempts[0].endpoint.url, self.urls[0])
+        stats = client.method_stats['test_port'].stats()
+        self.assertEqual((stats['requests'], stats['retries']), (1, 1))
+
+    def test_retry_budget(self):
+        for srv in self.servers:
+            srv.close()
+        budget = retry.RetryBudget(ratio=0, min_per_second=0, capacity=1)
+        client = JsonRpcClient(self.urls, timeout=1, retry_budget=budget)
+        errors_ = []
+        for i in range(3):
+            call = client.test_port([], on_error=errors_.append)
+            self.assertTrue(call.done())
+            self.assertEqual(errors_[-1].code, 111)
+            self.assertEqual(errors_[-1].id, call.request.id)
+        self.assertEqual(client.method_stats['test_port'].retries, 1)
+        self.assertEqual(client.method_stats['test_port'].errors, 3)
+
+    def test_no_retry_of_errors(self):
+        client = JsonRpcClient(self.urls, timeout=1,
+                               retry_budget=retry.RetryBudget(),
+                               idempotent=['test_error'])
+        call = client.test_error([])
+        self.assertRaises(errors.JsonRpcError, call.result, 2)
+        self.assertEqual(len(call.attempts), 1)
+
+    def test_hedge(self):
+        self.servers[0].delay = 0.5
+        client = JsonRpcClient(self.urls, timeout=2,
+                               idempotent=['test_port'],
+                               hedging=retry.HedgePolicy(delay=0.05),
+                               retry_budget=retry.RetryBudget())
+        start = time.time()
+        call = client.test_port([])
+        self.assertEqual(call.result(timeout=2), self.port + 1)
+        self.assertTrue(time.time() - start < 0.4)
+        self.assertEqual(len(call.attempts), 2)
+        self.assertTrue(call.attempts[0].cancelled())
+        self.assertEqual(client.pending, {})
+        stats = client.method_stats['test_port'].stats()
+        self.assertEqual((stats['hedges'], stats['hedge_wins']), (1, 1))
+        self.assertEqual(stats['hedge_rate'], 1.0)
+        self.assertEqual([e['outstanding'] for e in client.balancer.stats()],
+                         [0, 0])
+
+    def test_no_hedge(self):
+        client = JsonRpcClient(self.urls, timeout=2,
+                               hedging=retry.HedgePolicy(delay=0.01))
+        self.servers[0].delay = 0.1
+        call = client.test_port([])
+        self.assertEqual(call.result(timeout=2), self.port)
+        self.assertEqual(len(call.attempts), 1)
+        self.assertEqual(client.method_stats['test_port'].hedges, 0)
@@ -21,15 +21,24 @@
 Provides unit tests for the Json-RPC2 server.py module.
 '''
 
+import os
+import ssl
+import signal
 import random
 import socket
 import unittest
+import threading
 import six.moves.http_client as http_client
 
+from jsonrpc2 import acl
 from jsonrpc2 import base
 from jsonrpc2 import server
 from jsonrpc2 import errors
+from jsonrpc2 import future
+from jsonrpc2.client import JsonRpcClient
 
+CERT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'keycert.pem')
 
 class TestIface(server.JsonRpcIface):
     def test_result(self, a, b=2):
@@ -46,6 +55,12 @@ class TestIface(server.JsonRpcIface):
     def test_on_error(self, a):
         self._on_error(Exception(str(a)))
 
+    def test_deferred(self, a):
+        self.server.deferred.append(self)
+
+    def test_raw(self):
+        return base.RawJson('{"raw": [1, 2]}')
+
 
 class TestHandler(server.JsonRpcRequestHandler):
     def __init__(self, *args, **kwargs):
@@ -176,6 +191,18 @@ Content-Length: 85\r
         self.assertEqual(response.result, {'status': 'OK',
                                            'params': {'a': 123, 'b': 'abc'}})
 
+    def test_call_method_raw_result(self):
+        client = socket.create_connection(('localhost', self.port), 1)
+        client.send(format_request('test_raw', []))
+        base.loop(count=3)
+        resp = http_client.HTTPResponse(client)
+        resp.begin()
+        data = resp.read()
+        client.close()
+        self.assertTrue('"result": {"raw": [1, 2]}' in data)
+        response = base.loads(data, [base.JsonRpcResponse])
+        self.assertEqual(response.result, {'raw': [1, 2]})
+
     def test_call_method_dict_params(self):
         client = socket.create_connection(('localhost', self.port), 1)
         data = '''POST / HTTP/1.1\r
@@ -366,3 +393,608 @@ Content-Length: 85\r
             self.assertFalse(True)
         finally:
             client.close()
+
+
+class ServerTlsTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        context = server.create_ssl_context(CERT_FILE)
+        self.server = server.JsonRpcServer(('localhost', self.port),
+                                           TestIface, timeout=1,
+                                           ssl_context=context)
+        self.data = None
+
+    def tearDown(self):
+        self.server.close()
+
+    def _request(self, data):
+        client = socket.create_connection(('localhost', self.port), 1)
+        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        client = context.wrap_socket(client)
+        client.sendall(data)
+        resp = http_client.HTTPResponse(client)
+        resp.begin()
+        self.data = resp.read()
+        client.close()
+
+    def _run_client(self, data):
+        thread = threading.Thread(target=self._request, args=(data,))
+        thread.start()
+        while thread.is_alive():
+            base.loop(timeout=0.05, count=1)
+        thread.join()
+
+    def test_call_method(self):
+        self._run_client('''POST / HTTP/1.1\r
+Content-Length: 85\r
+\r
+{"jsonrpc": "2.0", "id": "12345abc", "method": "test_result", "params": [123, "abc"]}''')
+        response = base.loads(self.data, [base.JsonRpcResponse])
+        self.assertEqual(response.id, '12345abc')
+        self.assertEqual(response.result, {'status': 'OK',
+                                           'params': {'a': 123, 'b': 'abc'}})
+        self.assertEqual(self.server.session_stats()['accept_good'], 1)
+
+    def test_plaintext_client(self):
+        client = socket.create_connection(('localhost', self.port), 1)
+        client.send('POST / HTTP/1.1\r\nContent-Length: 0\r\n\r\n')
+        base.loop(count=3)
+        try:
+            data = client.recv(1024)
+        except socket.error:
+            data = ''
+        client.close()
+        self.assertFalse(data.startswith('HTTP'))
+        self.assertEqual(self.server.session_stats()['accept_good'], 0)
+
+
+class ServerListenersTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.server = server.JsonRpcServer(('localhost', self.port),
+                                           TestIface, timeout=0.2)
+
+    def tearDown(self):
+        self.server.close()
+
+    def _call(self, address, family=socket.AF_INET):
+        client = socket.socket(family, socket.SOCK_STREAM)
+        client.settimeout(1)
+        client.connect(address)
+        data = '''POST / HTTP/1.1\r
+Content-Length: 85\r
+\r
+{"jsonrpc": "2.0", "id": "12345abc", "method": "test_result", "params": [123, "abc"]}'''
+        client.send(data)
+        base.loop(count=3)
+        try:
+            data = client.recv(64 * 1024)
+        except socket.error:
+            data = ''
+        client.close()
+        return data
+
+    def test_addr(self):
+        self.assertEqual(self.server.addr, ('127.0.0.1', self.port))
+        self.assertTrue(('127.0.0.1:%d' % self.port) in repr(self.server))
+
+    def test_no_listeners(self):
+        srv = server.JsonRpcServer(None, TestIface)
+        self.assertEqual(srv.listeners, [])
+        self.assertEqual(srv.addr, None)
+
+    def test_multiple_listeners(self):
+        self.server.add_listener(('127.0.0.1', self.port + 1), backlog=5)
+        self.assertEqual(len(self.server.listeners), 2)
+        for port in (self.port, self.port + 1):
+            data = self._call(('127.0.0.1', port))
+            self.assertTrue(data.startswith('HTTP/1.1 200 OK'))
+        self.assertEqual(self.server.stats(), {'listeners': 2,
+                                               'accepted': 2,
+                                               'rejected': 0})
+
+    def test_listener_allowed_ips(self):
+        self.server.add_listener(('127.0.0.1', self.port + 1),
+                                 allowed_ips=['10.0.0.1'])
+        self.assertEqual(self._call(('127.0.0.1', self.port + 1)), '')
+        self.assertTrue(self._call(('127.0.0.1', self.port))
+                        .startswith('HTTP/1.1 200 OK'))
+        self.assertEqual(self.server.stats()['rejected'], 1)
+
+    def test_reload_acl(self):
+        self.server.acl = acl.JsonRpcAcl(['!127.0.0.0/8'])
+        self.assertEqual(self._call(('127.0.0.1', self.port)), '')
+        self.server.acl.load(['127.0.0.0/8'])
+        self.assertTrue(self._call(('127.0.0.1', self.port))
+                        .startswith('HTTP/1.1 200 OK'))
+        self.assertEqual(self.server.acl.stats(),
+                         [('127.0.0.0/8', acl.ALLOW, 1), (None, acl.DENY, 0)])
+
+    def test_empty_allowed_ips(self):
+        self.server.allowed_ips = []
+        self.assertEqual(self._call(('127.0.0.1', self.port)), '')
+        self.server.allowed_ips = ['!10.0.0.0/8']
+        self.assertEqual(self._call(('127.0.0.1', self.port)), '')
+        self.server.allowed_ips = None
+        self.assertTrue(self._call(('127.0.0.1', self.port))
+                        .startswith('HTTP/1.1 200 OK'))
+        self.assertEqual(self.server.stats()['rejected'], 2)
+
+    def test_listener_family(self):
+        for host in ('localhost', ''):
+            listener = self.server.add_listener((host, self.port + 1))
+            self.assertEqual(listener.socket.family, socket.AF_INET)
+            self.assertTrue(self._call(('127.0.0.1', self.port + 1))
+                            .startswith('HTTP/1.1 200 OK'))
+            self.server.remove_listener(listener)
+
+    def test_remove_listener(self):
+        listener = self.server.add_listener(('127.0.0.1', self.port + 1))
+        self.server.remove_listener(listener)
+        self.assertEqual(len(self.server.listeners), 1)
+        self.assertRaises(socket.error, self._call,
+                          ('127.0.0.1', self.port + 1))
+
+    @unittest.skipUnless(socket.has_ipv6, 'IPv6 is not supported')
+    def test_ipv6_listener(self):
+        try:
+            self.server.add_listener(('::1', self.port + 1))
+        except socket.error:
+            self.skipTest('IPv6 loopback is not available')
+        data = self._call(('::1', self.port + 1), socket.AF_INET6)
+        self.assertTrue(data.startswith('HTTP/1.1 200 OK'))
+        self.assertTrue(('[::1]:%d' % (self.port + 1)) in repr(self.server))
+
+    @unittest.skipUnless(socket.has_ipv6, 'IPv6 is not supported')
+    def test_dualstack_listener(self):
+        try:
+            self.server.add_listener(('::', self.port + 1), dualstack=True)
+        except socket.error:
+            self.skipTest('IPv6 is not available')
+        data = self._call(('127.0.0.1', self.port + 1))
+        self.assertTrue(data.startswith('HTTP/1.1 200 OK'))
+
+
+REQUEST_FORMAT = '''POST / HTTP/1.1\r
+Content-Length: %d\r
+%s\r
+%s'''
+
+def format_request(method, params, id='12345abc', headers=''):
+    data = base.JsonRpcRequest(method, params, id).dumps()
+    return REQUEST_FORMAT % (len(data), headers, data)
+
+
+class ServerKeepAliveTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.server = server.JsonRpcServer(('localhost', self.port),
+                                           TestIface, timeout=0.2,
+                                           keep_alive=True)
+
+    def tearDown(self):
+        self.server.close()
+
+    def _read_response(self, client):
+        resp = http_client.HTTPResponse(client)
+        resp.begin()
+        return resp, base.loads(resp.read(), [base.JsonRpcResponse])
+
+    def test_persistent_connection(self):
+        client = socket.create_connection(('localhost', self.port), 1)
+        for i in range(3):
+            client.send(format_request('test_result', [i]))
+            base.loop(count=3)
+            resp, response = self._read_response(client)
+            self.assertEqual(resp.getheader('connection'), 'keep-alive')
+            self.assertEqual(response.result['params']['a'], i)
+        client.close()
+        self.assertEqual(self.server.stats()['accepted'], 1)
+
+    def test_blocking_client(self):
+        client = JsonRpcClient('http://localhost:%d' % self.port, timeout=1,
+                               blocking=True)
+        for i in range(3):
+            self.assertEqual(client.test_result([i]),
+                             {'status': 'OK', 'params': {'a': i, 'b': 2}})
+        self.assertRaises(errors.JsonRpcError, client.test_exception, ['a'])
+        self.assertEqual(self.server.stats()['accepted'], 1)
+        self.assertEqual(client.pool.reused, 3)
+        self.assertEqual(len(client.pool), 1)
+        client.pool.clear()
+
+    def test_gather_client(self):
+        # Connections of concurrent requests wait in the listen backlog.
+        self.server.close()
+        self.server = server.JsonRpcServer(('localhost', self.port),
+                                           TestIface, timeout=0.2,
+                                           keep_alive=True, backlog=8)
+        client = JsonRpcClient('http://localhost:%d' % self.port, timeout=1,
+                               keep_alive=True)
+        contexts = [client.test_result([i]) for i in range(3)]
+        results = future.gather(*contexts).result(timeout=1)
+        self.assertEqual([result['params']['a'] for result in results],
+                         [0, 1, 2])
+        self.assertEqual(len(client.pool), 3)
+        client.pool.clear()
+
+    def test_pipelined_requests(self):
+        client = socket.create_connection(('localhost', self.port), 1)
+        client.send(format_request('test_result', [1], id='1') +
+                    format_request('test_result', [2], id='2'))
+        base.loop(count=5)
+        data = client.recv(64 * 1024)
+        client.close()
+        responses = data.split('HTTP/1.1 200 OK')[1:]
+        self.assertEqual(len(responses), 2)
+        for i, data in enumerate(responses):
+            response = base.loads(data.split('\r\n\r\n', 1)[1],
+                                  [base.JsonRpcResponse])
+            self.assertEqual(response.id, str(i + 1))
+
+    def test_connection_close(self):
+        client = socket.create_connection(('localhost', self.port), 1)
+        client.send(format_request('test_result', [1],
+                                   headers='Connection: close\r\n'))
+        base.loop(count=3)
+        resp, response = self._read_response(client)
+        self.assertEqual(resp.getheader('connection'), 'close')
+        self.assertEqual(client.recv(1024), '')
+        client.close()
+
+    def test_notification(self):
+        client = socket.create_connection(('localhost', self.port), 1)
+        data = base.JsonRpcNotification('test_result', [1]).dumps()
+        client.send(REQUEST_FORMAT % (len(data), '', data))
+        base.loop(count=3)
+        resp = http_client.HTTPResponse(client)
+        resp.begin()
+        self.assertEqual(resp.status, 204)
+        client.close()
+
+    def test_idle_timeout(self):
+        client = socket.create_connection(('localhost', self.port), 1)
+        client.send(format_request('test_result', [1]))
+        base.loop(count=3)
+        self._read_response(client)
+        base.loop(timeout=0.1, count=5)
+        self.assertEqual(client.recv(1024), '')
+        self.assertEqual(len(self.server.connections), 0)
+        client.close()
+
+
+class ServerDrainTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.server = server.JsonRpcServer(('localhost', self.port),
+                                           TestIface, timeout=5,
+                                           keep_alive=True)
+        self.server.deferred = []
+        self.abandoned = None
+
+    def tearDown(self):
+        self.server.close()
+        for handler in list(self.server.connections):
+            handler.close()
+
+    def _on_drained(self, abandoned):
+        self.abandoned = abandoned
+
+    def test_drain_idle(self):
+        client = socket.create_connection(('localhost', self.port), 1)
+        base.loop(count=1)
+        self.server.drain(callback=self._on_drained)
+        self.assertEqual(self.abandoned, [])
+        self.assertEqual(self.server.connections, set())
+        self.assertRaises(socket.error, socket.create_connection,
+                          ('localhost', self.port), 1)
+        client.close()
+
+    def test_drain_inflight(self):
+        client = socket.create_connection(('localhost', self.port), 1)
+        client.send(format_request('test_deferred', [1]))
+        base.loop(count=3)
+        self.server.drain(timeout=5, callback=self._on_drained)
+        self.assertEqual(self.abandoned, None)
+        iface = self.server.deferred[0]
+        iface._on_result('done')
+        base.loop(count=3)
+        resp = http_client.HTTPResponse(client)
+        resp.begin()
+        self.assertEqual(resp.getheader('connection'), 'close')
+        self.assertEqual(base.loads(resp.read(), [base.JsonRpcResponse])
+                         .result, 'done')
+        self.assertEqual(self.abandoned, [])
+        client.close()
+
+    def test_drain_timeout(self):
+        client = socket.create_connection(('localhost', self.port), 1)
+        client.send(format_request('test_deferred', [1]))
+        base.loop(count=3)
+        self.server.drain(timeout=0.05, callback=self._on_drained)
+        base.loop(timeout=0.1, count=3)
+        self.assertEqual(len(self.abandoned), 1)
+        self.assertEqual(self.abandoned[0].method, 'test_deferred')
+        self.assertEqual(self.server.abandoned, self.abandoned)
+        self.assertEqual(self.server.connections, set())
+        client.close()
+
+    def test_drain_on_signal(self):
+        previous = self.server.drain_on_signal(signal.SIGUSR1,
+                                               callback=self._on_drained)
+        try:
+            os.kill(os.getpid(), signal.SIGUSR1)
+            base.loop(timeout=0.1, count=2)
+        finally:
+            signal.signal(signal.SIGUSR1, previous)
+        self.assertTrue(self.server.draining)
+        self.assertEqual(self.abandoned, [])
+
+
+class CoroutineIface(server.JsonRpcIface):
+    def test_sleep(self, a):
+        yield future.sleep(0.01)
+        raise future.Return({'a': a})
+
+    def test_error(self, a):
+        yield future.sleep(0.01)
+        raise Exception(str(a))
+
+    def test_wait(self):
+        fut = future.JsonRpcFuture()
+        self.server.waiting.append(fut)
+        try:
+            result = yield fut
+        except future.CancelledError:
+            self.server.cancelled.append(self.request.id)
+            raise
+        raise future.Return(result)
+
+    def test_remote(self, a):
+        client = JsonRpcClient('http://localhost:%d' % self.server.remote_port,
+                               timeout=1)
+        result = yield client.test_result([a])
+        raise future.Return(result['params'])
+
+
+class ServerCoroutineTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.server = server.JsonRpcServer(('localhost', self.port),
+                                           CoroutineIface, timeout=0.2)
+        self.server.waiting = []
+        self.server.cancelled = []
+
+    def tearDown(self):
+        self.server.close()
+        for handler in list(self.server.connections):
+            handler.close()
+
+    def _call(self, method, params, count=5):
+        client = socket.create_connection(('localhost', self.port), 1)
+        client.send(format_request(method, params))
+        base.loop(timeout=0.05, count=count)
+        resp = http_client.HTTPResponse(client)
+        resp.begin()
+        data = resp.read()
+        client.close()
+        return resp, data
+
+    def test_result(self):
+        resp, data = self._call('test_sleep', [1])
+        self.assertEqual(base.loads(data, [base.JsonRpcResponse]).result,
+                         {'a': 1})
+
+    def test_error(self):
+        resp, data = self._call('test_error', ['failed'])
+        self.assertRaises(errors.JsonRpcError, base.loads, data,
+                          [base.JsonRpcResponse])
+
+    def test_deferred_result(self):
+        client = socket.create_connection(('localhost', self.port), 1)
+        client.send(format_request('test_wait', []))
+        base.loop(count=3)
+        self.server.waiting[0].set_result('done')
+        base.loop(count=3)
+        resp = http_client.HTTPResponse(client)
+        resp.begin()
+        self.assertEqual(base.loads(resp.read(), [base.JsonRpcResponse])
+                         .result, 'done')
+        client.close()
+
+    def test_await_client(self):
+        remote = server.JsonRpcServer(('localhost', self.port + 1),
+                                      TestIface)
+        self.server.remote_port = self.port + 1
+        try:
+            resp, data = self._call('test_remote', ['abc'], count=10)
+        finally:
+            remote.close()
+        self.assertEqual(base.loads(data, [base.JsonRpcResponse]).result,
+                         {'a': 'abc', 'b': 2})
+
+    def test_cancel_on_close(self):
+        client = socket.create_connection(('localhost', self.port), 1)
+        client.send(format_request('test_wait', []))
+        base.loop(count=3)
+        client.close()
+        base.loop(count=3)
+        self.assertEqual(self.server.cancelled, ['12345abc'])
+        self.assertTrue(self.server.waiting[0].cancelled())
+
+    def test_cancel_on_timeout(self):
+        client = socket.create_connection(('localhost', self.port), 1)
+        client.send(format_request('test_wait', []))
+        base.loop(timeout=0.1, count=5)
+        resp = http_client.HTTPResponse(client)
+        resp.begin()
+        self.assertEqual(resp.status, 408)
+        self.assertEqual(self.server.cancelled, ['12345abc'])
+        client.close()
+
+
+class ServerBackpressureTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.server = server.JsonRpcServer(('localhost', self.port),
+                                           TestIface, timeout=5,
+                                           keep_alive=True)
+        self.server.high_watermark = 300
+        self.server.low_watermark = 100
+        self.server.connection_high_watermark = 200
+        self.server.connection_low_watermark = 50
+        self.sockets = []
+
+    def tearDown(self):
+        self.server.close()
+        for handler in list(self.server.connections):
+            handler.close()
+        for sock in self.sockets:
+            sock.close()
+
+    def _handler(self):
+        sock, peer = socket.socketpair()
+        self.sockets.append(peer)
+        return server.JsonRpcRequestHandler(sock, self.server)
+
+    def test_connection_watermarks(self):
+        handler = self._handler()
+        handler.write_buffer = 'x' * 150
+        self.assertFalse(handler.paused)
+        handler.write_buffer += 'x' * 50
+        self.assertTrue(handler.paused)
+        self.assertFalse(handler.readable())
+        handler.write_buffer = 'x' * 100
+        self.assertTrue(handler.paused)
+        handler.write_buffer = 'x' * 50
+        self.assertFalse(handler.paused)
+        self.assertTrue(handler.readable())
+        self.assertEqual(self.server.buffered, 50)
+
+    def test_server_watermarks(self):
+        first, second = self._handler(), self._handler()
+        first.write_buffer = 'x' * 150
+        second.write_buffer = 'x' * 150
+        self.assertTrue(self.server.paused)
+        self.assertFalse(first.readable())
+        self.assertFalse(self.server.listeners[0].readable())
+        self.assertEqual(self.server.buffer_stats(),
+                         {'buffered': 300, 'paused': True,
+                          'paused_connections': 0})
+        first.close()
+        self.assertTrue(self.server.paused)
+        second.write_buffer = ''
+        self.assertFalse(self.server.paused)
+        self.assertTrue(self.server.listeners[0].readable())
+        self.assertEqual(self.server.buffered, 0)
+
+    def test_publish_paused(self):
+        handler = self._handler()
+        subscription = self.server.publisher.subscribe('foo')
+        handler.write_buffer = 'x' * 300
+        self.assertTrue(self.server.paused)
+        self.assertEqual(self.server.publish('foo', [1]), None)
+        self.assertEqual(len(subscription.queue), 0)
+        self.assertEqual(subscription.dropped, 1)
+        handler.write_buffer = ''
+        self.assertFalse(self.server.paused)
+        self.assertEqual(self.server.publish('foo', [2]), 1)
+        self.assertEqual(len(subscription.queue), 1)
+
+    def test_pause_frames(self):
+        handler = self._handler()
+        handler.start_exchanges()
+        frames = ''.join(
+            base.JsonRpcRequest('test_result', [i], str(i)).dumps() + '\n'
+            for i in (1, 2))
+        # Paused by the write buffer of the connection
+        handler.write_buffer = 'x' * 200
+        handler.read_buffer = frames + '{"jsonrpc"'
+        handler.process_frames()
+        self.assertTrue(handler.paused)
+        self.assertEqual(handler.write_buffer, 'x' * 200)
+        self.assertEqual(handler.read_buffer, frames + '{"jsonrpc"')
+        handler.handle_write()
+        self.assertFalse(handler.paused)
+        self.assertEqual(handler.write_buffer.count('"result"'), 2)
+        self.assertEqual(handler.read_buffer, '{"jsonrpc"')
+        # Paused server
+        handler.handle_write()
+        self.server.pause()
+        handler.read_buffer = frames
+        handler.process_frames()
+        self.assertEqual(handler.write_buffer, '')
+        self.assertEqual(handler.read_buffer, frames)
+        self.server.resume()
+        self.assertEqual(handler.write_buffer.count('"result"'), 2)
+        self.assertEqual(handler.read_buffer, '')
+
+    def test_pause_reading(self):
+        client = socket.create_connection(('localhost', self.port), 1)
+        base.loop(timeout=0.05, count=1)
+        self.server.pause()
+        client.send(format_request('test_result', [1], id='1') +
+                    format_request('test_result', [2], id='2'))
+        base.loop(timeout=0.05, count=3)
+        handler = list(self.server.connections)[0]
+        self.assertEqual(handler.read_buffer, '')
+        self.server.resume()
+        base.loop(timeout=0.05, count=5)
+        data = client.recv(64 * 1024)
+        client.close()
+        self.assertEqual(data.count('HTTP/1.1 200 OK'), 2)
+
+
+class ServerLimitsTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.server = server.JsonRpcServer(('localhost', self.port),
+                                           TestIface, timeout=5)
+
+    def tearDown(self):
+        self.server.close()
+        for handler in list(self.server.connections):
+            handler.close()
+
+    def _send(self, data, count=3):
+        client = socket.create_connection(('localhost', self.port), 1)
+        client.send(data)
+        base.loop(timeout=0.1, count=count)
+        resp = http_client.HTTPResponse(client)
+        resp.begin()
+        resp.read()
+        client.close()
+        return resp.status
+
+    def test_body_too_large(self):
+        self.server.max_body_size = 100
+        self.assertEqual(self._send(REQUEST_FORMAT % (1000, '', '')), 413)
+        self.assertEqual(self.server.connections, set())
+
+    def test_header_too_large(self):
+        self.server.max_header_size = 100
+        data = 'POST / HTTP/1.1\r\nX-Test: %s' % ('a' * 200)
+        self.assertEqual(self._send(data), 431)
+
+    def test_bad_content_length(self):
+        data = 'POST / HTTP/1.1\r\nContent-Length: abc\r\n\r\n'
+        self.assertEqual(self._send(data), 400)
+
+    def test_method_limit(self):
+        self.server.method_body_sizes['test_result'] = 50
+        data = format_request('test_result', ['a' * 100])
+        # The method is resolved before the rest of the body is received.
+        self.assertEqual(self._send(data[:data.index('"method"') + 30]), 413)
+
+    def test_method_limit_raised(self):
+        self.server.max_body_size = 50
+        self.server.method_body_sizes['test_result'] = 1000
+        self.assertEqual(self._send(format_request('test_result', [1])), 200)
+        self.assertEqual(self._send(format_request('test_exception', [1])),
+                         413)
+
+    def test_slow_request(self):
+        self.server.min_receive_rate = 100
+        self.server.receive_grace = 0.1
+        data = format_request('test_result', [1])
+        self.assertEqual(self._send(data[:20], count=10), 408)
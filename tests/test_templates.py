@@ -0,0 +1,107 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Provides unit tests for the Json-RPC2 templates.py module.
+'''
+
+import json
+import unittest
+
+from jsonrpc2 import base
+from jsonrpc2 import errors
+from jsonrpc2 import templates
+
+
+class JsonTemplateTest(unittest.TestCase):
+    def test_render(self):
+        template = templates.JsonTemplate({
+            'constant': '100%',
+            'nested': {'list': [1, templates.Slot('a')]},
+            'b': templates.Slot('b')
+        })
+        self.assertEqual(sorted(template.names), ['a', 'b'])
+        data = template.render(a={'x': '%s'}, b=u'\u0105')
+        self.assertEqual(json.loads(data), {
+            'constant': '100%',
+            'nested': {'list': [1, {'x': '%s'}]},
+            'b': u'\u0105'
+        })
+
+    def test_render_encoded(self):
+        template = templates.JsonTemplate([templates.Slot('a')])
+        self.assertEqual(template.render_encoded(a='true'), '[true]')
+
+    def test_render_raw(self):
+        template = templates.JsonTemplate([templates.Slot('a')])
+        self.assertEqual(template.render(a=base.RawJson('{"b":1}')),
+                         '[{"b":1}]')
+
+    def test_render_error(self):
+        template = templates.JsonTemplate([templates.Slot('a')])
+        self.assertRaises(errors.JsonRpcParseError, template.render,
+                          a=object())
+
+    def test_result(self):
+        data = templates.RESULT_TEMPLATE.render(id='abc', result=[1, 2])
+        response = base.loads(data, [base.JsonRpcResponse])
+        self.assertEqual(response.id, 'abc')
+        self.assertEqual(response.result, [1, 2])
+
+
+class ErrorTemplateTest(unittest.TestCase):
+    def _assert_rendered(self, error):
+        template = templates.error_template(error)
+        values = {'id': error.id}
+        if error.data:
+            values['data'] = error.data
+        marshaled = error.marshal()
+        marshaled['jsonrpc'] = '2.0'
+        self.assertEqual(json.loads(template.render(**values)), marshaled)
+
+    def test_canned_errors(self):
+        for error in (errors.JsonRpcParseError(),
+                      errors.InvalidJsonRpcError(),
+                      errors.JsonRpcMethodNotFoundError(
+                            id='1', data={'method': 'test'}),
+                      errors.JsonRpcOverloadError(id=2)):
+            self._assert_rendered(error)
+
+    def test_cached(self):
+        first = templates.error_template(errors.JsonRpcOverloadError(id=1))
+        second = templates.error_template(errors.JsonRpcOverloadError(id=2))
+        self.assertTrue(first is second)
+
+    def test_not_canned(self):
+        error = errors.JsonRpcError(message='Custom error.')
+        self.assertEqual(templates.error_template(error), None)
+
+
+class HttpHeadTemplateTest(unittest.TestCase):
+    def test_render(self):
+        template = templates.HttpHeadTemplate('HTTP/1.1', 200, 'OK',
+                                              [('Connection', 'close')])
+        head = template.render()
+        self.assertTrue(head.startswith('HTTP/1.1 200 OK\r\n'
+                                        'Connection: close\r\nDate: '))
+        self.assertTrue(head.endswith(' GMT\r\n'))
+
+    def test_http_date(self):
+        self.assertTrue(templates.http_date() is templates.http_date())
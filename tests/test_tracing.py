@@ -0,0 +1,195 @@
+# This file is part of Json-RPC2.
+#
+# Copyright (C) 2012 Marcin Lyko
+# All rights reserved.
+#
+# Json-RPC2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# Json-RPC2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Json-RPC2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+'''
+Provides unit tests for the Json-RPC2 tracing.py module.
+'''
+
+import random
+import socket
+import unittest
+
+from jsonrpc2 import base
+from jsonrpc2 import client
+from jsonrpc2 import server
+from jsonrpc2 import tracing
+
+
+class TestTracer(tracing.JsonRpcTracer):
+    def __init__(self):
+        tracing.JsonRpcTracer.__init__(self)
+        self.spans = []
+
+    def finish_span(self, span):
+        self.spans.append(span)
+
+    def names(self):
+        return [span.name for span in self.spans]
+
+    def find(self, name):
+        for span in self.spans:
+            if span.name == name:
+                return span
+
+
+class TestIface(server.JsonRpcIface):
+    def test_result(self, a):
+        return {'a': a}
+
+    def test_nested(self, a):
+        self.server.nested = self.server.tracer.current
+        return a
+
+
+class TracerTest(unittest.TestCase):
+    def setUp(self):
+        self.tracer = TestTracer()
+
+    def test_root_span(self):
+        span = self.tracer.start_span('foo', a=1)
+        self.assertEqual(len(span.trace_id), 32)
+        self.assertEqual(len(span.span_id), 16)
+        self.assertEqual(span.parent_id, None)
+        self.assertEqual(span.tags, {'a': 1})
+        self.assertEqual(span.duration, None)
+
+    def test_child_span(self):
+        parent = self.tracer.start_span('foo')
+        child = parent.child('bar')
+        self.assertEqual(child.trace_id, parent.trace_id)
+        self.assertEqual(child.parent_id, parent.span_id)
+        self.assertNotEqual(child.span_id, parent.span_id)
+
+    def test_finish_once(self):
+        span = self.tracer.start_span('foo', start=10)
+        span.finish(end=12, b=2)
+        span.finish()
+        self.assertEqual(self.tracer.spans, [span])
+        self.assertEqual(span.duration, 2)
+        self.assertEqual(span.tags, {'b': 2})
+
+    def test_inject_extract(self):
+        span = self.tracer.start_span('foo')
+        context = self.tracer.extract(self.tracer.inject(span))
+        self.assertEqual(context.trace_id, span.trace_id)
+        self.assertEqual(context.span_id, span.span_id)
+        self.assertTrue(context.sampled)
+
+    def test_extract_invalid(self):
+        for value in (None, '', 'foo', '00-%s-%s-01' % ('0' * 32, '1' * 16),
+                      '01-%s-%s-01' % ('1' * 32, '1' * 16)):
+            self.assertEqual(self.tracer.extract(value), None)
+
+    def test_activate(self):
+        span = self.tracer.start_span('foo')
+        current = self.tracer.activate(span, lambda: self.tracer.current)
+        self.assertTrue(current is span)
+        self.assertEqual(self.tracer.current, None)
+
+
+class TracingIntegrationTest(unittest.TestCase):
+    def setUp(self):
+        self.port = random.randint(10000, 65000)
+        self.client_tracer = TestTracer()
+        self.server_tracer = TestTracer()
+        self.client = client.JsonRpcClient('http://localhost:%d' % self.port,
+                                           timeout=1,
+                                           tracer=self.client_tracer)
+        self.server = server.JsonRpcServer(('localhost', self.port),
+                                           TestIface, timeout=1)
+        self.server.tracer = self.server_tracer
+        self._result = None
+
+    def tearDown(self):
+        self.server.close()
+
+    def _on_result(self, result):
+        self._result = result
+
+    def _call(self, method, params):
+        context = self.client.request(base.JsonRpcRequest(method, params),
+                                      on_result=self._on_result)
+        while not self.client_tracer.find('jsonrpc.call'):
+            base.loop(count=1)
+        return context
+
+    def test_request_spans(self):
+        self._call('test_result', [1])
+        self.assertEqual(self._result, {'a': 1})
+        self.assertEqual(self.server_tracer.names(),
+                         ['accept', 'http.headers', 'http.body',
+                          'jsonrpc.loads', 'jsonrpc.method',
+                          'jsonrpc.dumps', 'jsonrpc.dispatch', 'http.write',
+                          'jsonrpc.request'])
+        self.assertEqual(self.client_tracer.names(),
+                         ['jsonrpc.dumps', 'http.send', 'http.wait',
+                          'jsonrpc.loads', 'jsonrpc.call'])
+        call = self.client_tracer.find('jsonrpc.call')
+        request = self.server_tracer.find('jsonrpc.request')
+        self.assertEqual(request.trace_id, call.trace_id)
+        self.assertEqual(request.parent_id, call.span_id)
+        self.assertEqual(request.tags['method'], 'test_result')
+        for span in self.server_tracer.spans[:-1]:
+            self.assertEqual(span.parent_id, request.span_id)
+            self.assertTrue(span.start >= request.start)
+            self.assertTrue(span.end <= request.end)
+
+    def test_pipelined_spans(self):
+        self.server.keep_alive = True
+        sock = socket.create_connection(('localhost', self.port), 1)
+        data = ''.join(
+            'POST / HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s' % (len(data),
+                                                                  data)
+            for data in [base.JsonRpcRequest('test_result', [i]).dumps()
+                         for i in range(2)])
+        sock.send(data)
+        for i in range(20):
+            if self.server_tracer.names().count('jsonrpc.request') == 2:
+                break
+            base.loop(timeout=0.05, count=1)
+        sock.close()
+        requests = [span for span in self.server_tracer.spans
+                    if span.name == 'jsonrpc.request']
+        self.assertEqual(len(requests), 2)
+        self.assertNotEqual(requests[0].trace_id, requests[1].trace_id)
+
+    def test_current_span(self):
+        self.server.nested = None
+        self._call('test_nested', [1])
+        request = self.server_tracer.find('jsonrpc.request')
+        self.assertTrue(self.server.nested is request)
+
+    def test_method_error(self):
+        self._call('unknown', [1])
+        method = self.server_tracer.find('jsonrpc.method')
+        self.assertTrue('error' in method.tags)
+
+    def test_no_tracer(self):
+        self.server.tracer = None
+        self.client.tracer = None
+        context = self.client.request(base.JsonRpcRequest('test_result', [2]),
+                                      on_result=self._on_result)
+        for i in range(20):
+            if self._result is not None:
+                break
+            base.loop(count=1)
+        self.assertEqual(self._result, {'a': 2})
+        self.assertEqual(context.trace, None)
+        self.assertFalse('Traceparent' in context._request.headers)